@@ -1,92 +1,180 @@
+import os
+import sys
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-import matplotlib.pyplot as plt
- 
-# Step 1: Load CSV data
-file_path = '/Users/tanuskabiswakarma/CSC4740_project/diabetes_panel.csv'  
-data = pd.read_csv(file_path)
-
-# Step 2: Clean column names
-data.columns = data.columns.str.strip()  # Remove leading/trailing spaces
-print("Columns in CSV:", data.columns)
-
-# Step 3: Detect relevant columns
-year_col = [col for col in data.columns if 'year' in col.lower()]
-diabetes_col = [col for col in data.columns if 'diabetes_prevalence' in col.lower()]
-state_col = [col for col in data.columns if 'state' in col.lower()]
-risk_cols = [col for col in data.columns if 'obesity' in col.lower() or 'inactivity' in col.lower()]
-
-if not year_col or not diabetes_col:
-    raise ValueError("Could not find 'Year' or 'Diabetes' columns in your CSV.")
-
-year_col = year_col[0]
-diabetes_col = diabetes_col[0]
-state_col = state_col[0] if state_col else None
-
-# Line Graph 
-plt.figure(figsize=(10, 6))
-plt.plot(data[year_col], data[diabetes_col], marker='o', color='blue', linewidth=2)
-plt.title('Diabetes Prevalence in the US (2014–2023)', fontsize=16)
-plt.xlabel('Year', fontsize=12)
-plt.ylabel('Diabetes Prevalence (%)', fontsize=12)
-plt.xticks(data[year_col], rotation=45)
-plt.grid(True, linestyle='--', alpha=0.5)
-plt.tight_layout()
-plt.show()
-
-# Bar Graph 
-if state_col:
-    latest_year = data[year_col].max()
-    latest_data = data[data[year_col] == latest_year]
-    
-    plt.figure(figsize=(12, 6))
-    plt.bar(latest_data[state_col], latest_data[diabetes_col], color='orange')
-    plt.title(f'Diabetes Prevalence by State in {latest_year}', fontsize=16)
-    plt.xlabel('State', fontsize=12)
+import matplotlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'src'))
+from manifest import load_manifest, save_manifest, fingerprint, is_fresh, record
+
+DEFAULT_PANEL = os.path.join(HERE, 'data', 'processed', 'diabetes_panel.csv')
+OUT_DIR = os.path.join(HERE, 'Graphs&Images')
+
+
+# Figures
+
+def line_national(plt, data, year_col, diabetes_col):
+    fig = plt.figure(figsize=(10, 6))
+    plt.plot(data[year_col], data[diabetes_col], marker='o', color='blue', linewidth=2)
+    plt.title('Diabetes Prevalence in the US (2014–2023)', fontsize=16)
+    plt.xlabel('Year', fontsize=12)
     plt.ylabel('Diabetes Prevalence (%)', fontsize=12)
-    plt.xticks(rotation=45)
-    plt.grid(axis='y', linestyle='--', alpha=0.5)
+    plt.xticks(data[year_col], rotation=45)
+    plt.grid(True, linestyle='--', alpha=0.5)
     plt.tight_layout()
-    plt.show()
-
-# Bar Graph 
-if state_col:
-    latest_year = data[year_col].min()
-    latest_data = data[data[year_col] == latest_year]
-    
-    plt.figure(figsize=(12, 6))
-    plt.bar(latest_data[state_col], latest_data[diabetes_col], color='orange')
-    plt.title(f'Diabetes Prevalence by State in {latest_year}', fontsize=16)
+    return fig
+
+def bar_states(plt, data, year, state_col, diabetes_col):
+    fig = plt.figure(figsize=(12, 6))
+    plt.bar(data[state_col], data[diabetes_col], color='orange')
+    plt.title(f'Diabetes Prevalence by State in {year}', fontsize=16)
     plt.xlabel('State', fontsize=12)
     plt.ylabel('Diabetes Prevalence (%)', fontsize=12)
     plt.xticks(rotation=45)
     plt.grid(axis='y', linestyle='--', alpha=0.5)
     plt.tight_layout()
-    plt.show()
+    return fig
 
-
-# Scatter Plot 
-for risk in risk_cols:
-    plt.figure(figsize=(8, 6))
+def scatter_risk(plt, data, risk, diabetes_col, title, xlabel, figsize=(8, 6)):
+    fig = plt.figure(figsize=figsize)
     plt.scatter(data[risk], data[diabetes_col], color='green', alpha=0.7)
-    plt.title(f'Diabetes Prevalence vs {risk}', fontsize=16)
-    plt.xlabel(f'{risk} (%)', fontsize=12)
+    plt.title(title, fontsize=16)
+    plt.xlabel(xlabel, fontsize=12)
+    plt.ylabel('Diabetes Prevalence (%)', fontsize=12)
+    plt.grid(True, linestyle='--', alpha=0.5)
+    plt.tight_layout()
+    return fig
+
+def line_state(plt, data, state, year_col, diabetes_col):
+    fig = plt.figure(figsize=(8, 5))
+    plt.plot(data[year_col], data[diabetes_col], marker='o', linewidth=2)
+    plt.title(f'Diabetes Prevalence in {state}', fontsize=16)
+    plt.xlabel('Year', fontsize=12)
     plt.ylabel('Diabetes Prevalence (%)', fontsize=12)
     plt.grid(True, linestyle='--', alpha=0.5)
     plt.tight_layout()
-    plt.show()
-
-# Scatter Plot for Smoking Prevalence
-smoking_col = [col for col in data.columns if 'smoking_prevalence' in col.lower()]
-if not smoking_col:
-    raise ValueError("Could not find 'smoking_prevalence' column in your CSV.")
-smoking_col = smoking_col[0]
-
-plt.figure(figsize=(10, 6))
-plt.scatter(data[smoking_col], data[diabetes_col], color='green', alpha=0.7)
-
-plt.title('Diabetes Prevalence vs Smoking Prevalence', fontsize=16)
-plt.xlabel('Smoking Prevalence (%)', fontsize=12)
-plt.ylabel('Diabetes Prevalence (%)', fontsize=12)
-plt.grid(True, linestyle='--', alpha=0.5)
-plt.tight_layout()
-plt.show()
+    return fig
+
+DRAW = {'line_national': line_national, 'bar_states': bar_states,
+        'scatter_risk': scatter_risk, 'line_state': line_state}
+
+
+# Figure list: (file name, draw function, data slice, kwargs)
+
+def figure_specs(data, per_state=False):
+    year_col = [col for col in data.columns if 'year' in col.lower()]
+    diabetes_col = [col for col in data.columns if 'diabetes_prevalence' in col.lower()]
+    state_col = [col for col in data.columns if 'state' in col.lower()]
+    risk_cols = [col for col in data.columns if 'obesity' in col.lower() or 'inactivity' in col.lower()]
+
+    if not year_col or not diabetes_col:
+        raise ValueError("Could not find 'Year' or 'Diabetes' columns in your CSV.")
+
+    year_col = year_col[0]
+    diabetes_col = diabetes_col[0]
+    state_col = state_col[0] if state_col else None
+
+    specs = [('Diabetes Prevalence in the US (2014-2023).png', 'line_national',
+              data[[year_col, diabetes_col]], dict(year_col=year_col, diabetes_col=diabetes_col))]
+
+    if state_col:
+        for year in (data[year_col].max(), data[year_col].min()):
+            sl = data.loc[data[year_col] == year, [state_col, diabetes_col]]
+            specs.append((f'Diabetes Prevalence by State in {year}.png', 'bar_states', sl,
+                          dict(year=year, state_col=state_col, diabetes_col=diabetes_col)))
+
+    for risk in risk_cols:
+        specs.append((f'Diabetes Prevalence vs {risk}.png', 'scatter_risk', data[[risk, diabetes_col]],
+                      dict(risk=risk, diabetes_col=diabetes_col, title=f'Diabetes Prevalence vs {risk}',
+                           xlabel=f'{risk} (%)')))
+
+    smoking_col = [col for col in data.columns if 'smoking_prevalence' in col.lower()]
+    if not smoking_col:
+        raise ValueError("Could not find 'smoking_prevalence' column in your CSV.")
+    smoking_col = smoking_col[0]
+    specs.append(('Diabetes Prevalence vs Smoking Prevalence.png', 'scatter_risk',
+                  data[[smoking_col, diabetes_col]],
+                  dict(risk=smoking_col, diabetes_col=diabetes_col,
+                       title='Diabetes Prevalence vs Smoking Prevalence',
+                       xlabel='Smoking Prevalence (%)', figsize=(10, 6))))
+
+    if per_state and state_col:
+        for state, sl in data.groupby(state_col, sort=True):
+            specs.append((os.path.join('states', f'Diabetes Prevalence in {state}.png'), 'line_state',
+                          sl[[year_col, diabetes_col]].sort_values(year_col),
+                          dict(state=state, year_col=year_col, diabetes_col=diabetes_col)))
+    return specs
+
+
+# Rendering
+
+def render(name, kind, data, kwargs, out_dir):
+    # Worker: headless backend, draw, save, close
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig = DRAW[kind](plt, data, **kwargs)
+    path = os.path.join(out_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+    return name
+
+def render_batch(data, out_dir=OUT_DIR, workers=None, force=False, per_state=False):
+    # Skip figures whose data slice, draw function and options are unchanged
+    os.makedirs(out_dir, exist_ok=True)
+    folder = Path(out_dir)
+    manifest = load_manifest(folder)
+    specs = figure_specs(data, per_state)
+    todo = []
+    for name, kind, sl, kwargs in specs:
+        fp = fingerprint(kind, kwargs, list(sl.columns),
+                         pd.util.hash_pandas_object(sl, index=False).tolist())
+        if not force and is_fresh(manifest, name, fp, folder):
+            continue
+        todo.append((name, kind, sl, kwargs, fp))
+
+    if workers == 1 or len(todo) <= 1:
+        done = [render(n, k, sl, kw, out_dir) for n, k, sl, kw, _ in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = list(pool.map(render, *zip(*[(n, k, sl, kw, out_dir) for n, k, sl, kw, _ in todo])))
+    for (name, _, _, _, fp), _ in zip(todo, done):
+        record(manifest, name, fp, [name])
+    save_manifest(folder, manifest)
+    print(f"Rendered {len(done)} figure(s), {len(specs) - len(done)} unchanged -> {out_dir}")
+    return done
+
+def show_interactive(data):
+    import matplotlib.pyplot as plt
+    for name, kind, sl, kwargs in figure_specs(data):
+        DRAW[kind](plt, sl, **kwargs)
+        plt.show()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Diabetes prevalence figures")
+    ap.add_argument('--panel', default=DEFAULT_PANEL, help="panel CSV (default: data/processed/diabetes_panel.csv)")
+    ap.add_argument('--batch', action='store_true',
+                    help="headless: render every figure to Graphs&Images/ on a process pool")
+    ap.add_argument('--workers', type=int, default=None, help="process pool size in --batch mode")
+    ap.add_argument('--force', action='store_true', help="re-render figures even if their data is unchanged")
+    ap.add_argument('--per-state', action='store_true', help="also render one trend chart per state")
+    args = ap.parse_args(argv)
+    if args.batch:
+        matplotlib.use('Agg')
+
+    # Load once, clean column names
+    data = pd.read_csv(args.panel)
+    data.columns = data.columns.str.strip()  # Remove leading/trailing spaces
+    print("Columns in CSV:", data.columns)
+
+    if args.batch:
+        render_batch(data, workers=args.workers, force=args.force, per_state=args.per_state)
+    else:
+        show_interactive(data)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Benchmark suite: generates synthetic CDC exports at several scales (see
+# synth.py) and times the pipeline stages on them. Each stage is run once to warm
+# up, `repeat` times for the best wall time, then once more under tracemalloc for peak
+# Python-visible memory (numpy/pandas buffers included). Results are written to
+# benchmarks/results/<commit>_<timestamp>.json; --compare diffs two result files.
+# The synthetic runs stay out of reports/run_log.jsonl unless --run-log is given.
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+sys.path.insert(0, str(HERE))
+
+SCALES = {
+    # name: (units, years, indicators)
+    "small": (51, 10, 4),
+    "medium": (500, 20, 8),
+    "large": (3000, 20, 12),
+}
+MIXEDLM_MAX_ROWS = 20_000   # MixedLM above this takes minutes; skipped
+
+def measure(fn, repeat=3):
+    out = fn()   # warm-up: lazy imports and caches are not part of the timing
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, best, peak / 1024 ** 2
+
+def _relabel(df, path):
+    # clean.py only knows four indicators by name; give extra synthetic ones
+    # their own columns so the join really has k value columns
+    stem = path.stem.lower()
+    if "riskfactor" in stem:
+        label = stem.split("_")[1]
+        df = df.rename(columns={"diabetes_prevalence": f"{label}_prevalence"})
+    return df
+
+def run_scale(name, units, years, indicators, repeat, tmp):
+    import clean
+    import preprocess
+    from synth import generate
+    from backtest import rolling_origin
+    from trends import unit_trends
+    from forecast import forecast
+    from regions import assign_regions
+    from clean import STATE_LOOKUP
+    USPS_OF = {v: k for k, v in STATE_LOOKUP.items()}
+
+    raw_dir = Path(tmp) / name
+    paths = generate(raw_dir, units, years, indicators)
+    cfg = clean.load_config()
+    rows = []
+
+    def add(stage, fn, n_rows=None):
+        out, secs, peak = measure(fn, repeat)
+        rows.append({"scale": name, "units": units, "years": years, "indicators": indicators,
+                     "stage": stage, "seconds": secs, "peak_mb": peak,
+                     "rows": n_rows(out) if n_rows else None})
+        print(f"  {name:<7} {stage:<28} {secs * 1000:10.1f} ms  {peak:8.1f} MB")
+        return out
+
+    dfs = add("clean.clean_one_file", lambda: [_relabel(clean.clean_one_file(p, cfg), p) for p in paths],
+              lambda out: sum(len(d) for d in out))
+    panel = add("preprocess.outer_join_on_keys", lambda: preprocess.outer_join_on_keys(dfs), len)
+    panel = panel[panel["state_fips"].notna()].sort_values(["year", "state_fips"], ignore_index=True)
+    train, val, test = add("preprocess.time_splits", lambda: preprocess.time_splits(panel), lambda out: len(out[0]))
+
+    features = [c for c in ["inactivity_prevalence", "obesity_prevalence", "smoking_prevalence"] if c in train]
+    target = preprocess.TARGET
+    fit_rows = train.dropna(subset=features + [target])
+
+    def linear_fit():
+        from sklearn.linear_model import LinearRegression
+        return LinearRegression().fit(fit_rows[features], fit_rows[[target]])
+    add("LinearReg.fit", linear_fit, lambda out: len(fit_rows))
+    add("backtest.rolling_origin", lambda: rolling_origin(fit_rows, features, target), len)
+
+    growth = panel.dropna(subset=[target]).copy()
+    # Region from the state part of the FIPS code: county FIPS are
+    # state * 1000 + county (synth.units), state names are not prefixes of USPS codes
+    fips = growth["state_fips"].astype(int)
+    usps = pd.Series(np.where(fips > 99, fips // 1000, fips)).map(USPS_OF)
+    growth["region"] = assign_regions(usps).to_numpy()
+    growth["year_c"] = growth["year"] - growth["year"].mean()
+    formula = "diabetes_prevalence ~ year_c * C(region)"
+
+    def ols_fit():
+        import statsmodels.formula.api as smf
+        return smf.ols(formula=formula, data=growth).fit(cov_type="HC3")
+    add("growth.ols", ols_fit, lambda out: len(growth))
+    add("trends.unit_trends", lambda: unit_trends(growth, group="state"), len)
+    add("forecast.forecast", lambda: forecast(growth, horizon=5), len)
+    if len(growth) <= MIXEDLM_MAX_ROWS:
+        def mixedlm_fit():
+            import statsmodels.formula.api as smf
+            return smf.mixedlm(formula, growth, groups=growth["state"]).fit(reml=False)
+        add("growth.mixedlm", mixedlm_fit, lambda out: len(growth))
+    return rows
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+def compare(old_path, new_path):
+    old = pd.DataFrame(json.loads(Path(old_path).read_text())["results"])
+    new = pd.DataFrame(json.loads(Path(new_path).read_text())["results"])
+    m = old.merge(new, on=["scale", "stage"], suffixes=("_old", "_new"))
+    m["time_ratio"] = m["seconds_new"] / m["seconds_old"]
+    m["mem_ratio"] = m["peak_mb_new"] / m["peak_mb_old"]
+    cols = ["scale", "stage", "seconds_old", "seconds_new", "time_ratio", "peak_mb_old", "peak_mb_new", "mem_ratio"]
+    print(m[cols].to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Time and memory benchmarks on synthetic CDC data")
+    ap.add_argument("--scales", nargs="+", default=["small", "medium"], choices=sorted(SCALES))
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default=None, help="result JSON path (default: benchmarks/results/)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    ap.add_argument("--run-log", action="store_true",
+                    help="also append every timed stage to reports/run_log.jsonl (off by default)")
+    args = ap.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.run_log:
+        import instrument
+        instrument.disable()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.scales:
+            results += run_scale(name, *SCALES[name], args.repeat, tmp)
+
+    commit = git_commit()
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    out = Path(args.out) if args.out else HERE / "results" / f"{commit}_{stamp}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"commit": commit, "timestamp": stamp, "python": platform.python_version(),
+                               "numpy": np.__version__, "pandas": pd.__version__,
+                               "results": results}, indent=1))
+    print("wrote", out)
+
+if __name__ == "__main__":
+    main()
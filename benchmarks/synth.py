@@ -0,0 +1,93 @@
+import sys
+import argparse
+from pathlib import Path
+import numpy as np
+
+# Synthetic CDC "Line chart" exports in the same layout as data/raw: two title
+# lines, the Year,State,Percentage,Lower Limit, Upper Limit header, "Median of
+# States" rows, "No Data" rows for territories, and the surveillance footer.
+# Scale with units (states, then synthetic counties), years and indicators.
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from clean import NAME_TO_USPS, STATE_LOOKUP
+
+TITLES = {
+    "diabetes": "Diagnosed Diabetes; Total; Adults Aged 18+ Years; Age-Adjusted Percentage; U.S. States",
+    "obesity": "Obesity; Total; Adults with Diabetes Aged 18+ Years; Age-Adjusted Percentage; U.S. States",
+    "inactivity": "Physical Inactivity; Total; Adults with Diabetes Aged 18+ Years; Age-Adjusted Percentage; U.S. States",
+    "smoking": "Current Smoking; Total; Adults with Diabetes Aged 18+ Years; Age-Adjusted Percentage; U.S. States",
+}
+FILENAMES = {
+    "diabetes": "DiabetesAtlas_AllStatesLineChartData.csv",
+    "obesity": "cdc_obesity_{y0}_{y1}.csv",
+    "inactivity": "cdc_inactivity_{y0}_{y1}.csv",
+    "smoking": "cdc_smoking_{y0}_{y1}.csv",
+}
+FOOTER = ("US Diabetes Surveillance System; www.cdc.gov/diabetes/data; Division of Diabetes "
+          "Translation - Centers for Disease Control and Prevention.")
+TERRITORIES = ["Virgin Islands of the U.S.", "Guam", "Puerto Rico"]
+
+def units(n_units):
+    # Real state names first; beyond 51 units, synthetic counties carry a
+    # FIPS column (mapped to state_fips by columns_config.yaml)
+    names = sorted(NAME_TO_USPS)
+    if n_units <= len(names):
+        return names[:n_units], None
+    fips = [STATE_LOOKUP[NAME_TO_USPS[names[i % len(names)]]] * 1000 + i // len(names) + 1
+            for i in range(n_units)]
+    return [f"{names[i % len(names)]} County {i // len(names) + 1}" for i in range(n_units)], fips
+
+def indicator_names(n_indicators):
+    base = ["diabetes", "obesity", "inactivity", "smoking"]
+    return base[:n_indicators] + [f"riskfactor{i:02d}" for i in range(len(base), n_indicators)]
+
+def write_line_chart(path, title, names, fips, years, rng, level, trend):
+    n, t = len(names), len(years)
+    base = rng.normal(level, level * 0.15, n)[:, None] + trend * np.arange(t)[None, :]
+    pct = np.round(np.clip(base + rng.normal(0, 0.4, (n, t)), 0.5, 95), 1)
+    half = np.round(rng.uniform(0.5, 2.5, (n, t)), 1)
+    with open(path, "w", newline="") as f:
+        f.write(title + "\n")
+        f.write("Data downloaded on 18-November-2025\n")
+        f.write("Year,State,Percentage,Lower Limit, Upper Limit\n" if fips is None
+                else "Year,State,FIPS,Percentage,Lower Limit, Upper Limit\n")
+        med = np.median(pct, axis=0)
+        for j, y in enumerate(years):
+            extra = "" if fips is None else ","
+            f.write(f"{y},Median of States,{extra}{med[j]:.1f},{med[j] - 1:.1f},{med[j] + 1:.1f}\n")
+        for j, y in enumerate(years):
+            for name in TERRITORIES:
+                extra = "" if fips is None else ","
+                f.write(f"{y},{name},{extra}No Data,No Data,No Data\n")
+            lo, hi = pct[:, j] - half[:, j], pct[:, j] + half[:, j]
+            for i, name in enumerate(names):
+                extra = "" if fips is None else f"{fips[i]},"
+                f.write(f"{y},{name},{extra}{pct[i, j]:.1f},{lo[i]:.1f},{hi[i]:.1f}\n")
+        f.write(FOOTER)
+
+def generate(out_dir, n_units=51, n_years=10, n_indicators=4, first_year=2014, seed=0):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    names, fips = units(n_units)
+    years = list(range(first_year, first_year + n_years))
+    paths = []
+    for k, ind in enumerate(indicator_names(n_indicators)):
+        title = TITLES.get(ind, f"Risk Factor {ind}; Total; Adults Aged 18+ Years; Age-Adjusted Percentage; U.S. States")
+        name = FILENAMES.get(ind, "cdc_{ind}_{y0}_{y1}.csv").format(ind=ind, y0=years[0], y1=years[-1])
+        path = out_dir / name
+        level = {"diabetes": 10, "obesity": 45, "inactivity": 35, "smoking": 18}.get(ind, 25)
+        write_line_chart(path, title, names, fips, years, rng, level, trend=0.1 * (k % 3))
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Write synthetic CDC line-chart CSVs")
+    ap.add_argument("out_dir")
+    ap.add_argument("--units", type=int, default=51)
+    ap.add_argument("--years", type=int, default=10)
+    ap.add_argument("--indicators", type=int, default=4)
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    for p in generate(a.out_dir, a.units, a.years, a.indicators, seed=a.seed):
+        print(p)
@@ -1,17 +1,23 @@
 import os
+import sys
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import statsmodels.formula.api as smf
 import statsmodels.api as sm
 
-# 1. Load the data
-CSV_PATH = '/Users/tanuskabiswakarma/CSC4740_project/diabetes_panel.csv' 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+import preprocess
+from trends import unit_trends
+from bootstrap import group_bootstrap
+from model_cache import fit_ols, fit_mixedlm
+from regions import assign_regions
+import cube
+from cube import Cube
+from weighted import aggregates
 
-if not os.path.exists(CSV_PATH):
-    raise FileNotFoundError(f"{CSV_PATH} not found.")
-
-df = pd.read_csv(CSV_PATH)
+# 1. Load the data (the processed panel: Parquet store or CSV, see preprocess.py)
+df = preprocess.read_table(preprocess.panel_path())
 
 # Basic sanity checks - change column names below if file uses different names
 expected_cols = {'state', 'year', 'diabetes_prevalence'}
@@ -19,40 +25,58 @@ if not expected_cols.issubset(df.columns):
     raise ValueError(f"CSV must contain columns: {expected_cols}. Found: {df.columns.tolist()}")
 
 # If prevalence is stored as proportion (0-1), convert to percent for readability
-if df['diabetes_prevalence'].max() <= 1.01:
-    df['diabetes_prevalence'] = df['diabetes_prevalence'] * 100
-
-
-# 2. Map states to regions
-south = {'AL','AR','DE','DC','FL','GA','KY','LA','MD','MS','NC','OK','SC','TN','TX','VA','WV'}
-northeast = {'CT','ME','MA','NH','NJ','NY','PA','RI','VT'}
-midwest = {'IL','IN','IA','KS','MI','MN','MO','NE','ND','OH','SD','WI'}
-west = {'AK','AZ','CA','CO','HI','ID','MT','NV','NM','OR','UT','WA','WY'}
-
-def assign_region(state_abbr):
-    st = str(state_abbr).strip().upper()
-    if st in south:
-        return 'South'
-    if st in northeast:
-        return 'Northeast'
-    if st in west:
-        return 'West'
-    if st in midwest:
-        return 'Midwest'
-    return 'Other'
+rescaled = df['diabetes_prevalence'].max() <= 1.01
+if rescaled:
+    for col in ['diabetes_prevalence', 'diabetes_ci_low', 'diabetes_ci_high']:
+        df[col] = df[col] * 100
+
+
+# 2. Map states to regions (Census regions, src/regions.py)
 
 df['state_abbr'] = df['state'].astype(str).str.strip()
 if (df['state_abbr'].str.len() > 2).mean() > 0.5:
     print("Warning: >50% of 'state' values look like full names. If so, convert full names to 2-letter abbreviations before running.")
-df['region'] = df['state_abbr'].apply(assign_region)
-
-# 3. Aggregate: region-year averages
-
-region_trends = (
-    df.groupby(['year', 'region'], as_index=False)
-      .agg(mean_prev=('diabetes_prevalence', 'mean'),
-           se_prev=('diabetes_prevalence', lambda x: x.std(ddof=1) / np.sqrt(len(x))))
-)
+df['region'] = assign_regions(df['state_abbr']).to_numpy()
+
+# 3. Aggregate: region-year averages, read off the aggregate cube
+#    (state x year x indicator sums rolled up to regions once). preprocess.py
+#    persists the cube; it is only rebuilt here when missing or stale.
+#    se_prev = sd / sqrt(n) with n the states that have a value. The earlier
+#    groupby divided by every row, missing values included, which understated
+#    the SE of region-years with a missing state.
+
+if preprocess.cube_fresh() and not rescaled:
+    agg = Cube(cube.load(preprocess.PROCESSED))
+else:
+    agg = Cube.from_panel(df)
+region_trends = (agg.table('region', 'diabetes_prevalence')
+                    .rename(columns={'geo': 'region', 'mean': 'mean_prev', 'se': 'se_prev'})
+                    [['year', 'region', 'mean_prev', 'se_prev']])
+
+# Inverse-variance weighted region-year means (weights 1/se² from each
+# state's CI), next to the equal-weight ones
+ivw = (aggregates(df, ['diabetes_prevalence'], by=('year', 'region'))
+       .rename(columns={'mean_ivw': 'mean_prev_ivw', 'se_ivw': 'se_prev_ivw'}))
+region_trends = region_trends.merge(ivw[['year', 'region', 'mean_prev_ivw', 'se_prev_ivw']],
+                                    on=['year', 'region'], how='left')
+
+# Percentile bootstrap CIs (states resampled within each region-year), all
+# replicates drawn as one array operation; set BOOT_WORKERS > 1 for a pool
+BOOT_REPLICATES = 10000
+BOOT_SEED = 42
+BOOT_WORKERS = 1
+boot = group_bootstrap(df, 'diabetes_prevalence', ['year', 'region'],
+                       n_boot=BOOT_REPLICATES, seed=BOOT_SEED, workers=BOOT_WORKERS)
+region_trends = region_trends.merge(boot[['year', 'region', 'boot_low', 'boot_high']],
+                                    on=['year', 'region'], how='left')
+region_trends.to_csv('region_trends.csv', index=False)
+
+# Per-state linear trends, all states in one vectorized pass (no per-state smf.ols)
+state_trends = unit_trends(df, value='diabetes_prevalence', group='state_abbr', time='year')
+state_trends['region'] = assign_regions(state_trends['state_abbr']).to_numpy()
+print("\nFastest-growing states (slope = percentage points per year):")
+print(state_trends.sort_values('slope', ascending=False).head(10).to_string(index=False))
+state_trends.to_csv('state_trends.csv', index=False)
 
 # Pivot for plotting convenience
 pivot = region_trends.pivot(index='year', columns='region', values='mean_prev')
@@ -86,7 +110,8 @@ df['region'] = pd.Categorical(df['region'])
 
 
 formula = 'diabetes_prevalence ~ year_c * C(region)'
-ols_model = smf.ols(formula=formula, data=df).fit(cov_type='HC3')  # robust SEs
+# Fits are cached on (panel, formula, options); unchanged data skips fitting
+ols_model = fit_ols(formula, df, cov_type='HC3')  # robust SEs
 print("\nOLS regression results (with year x region interaction):")
 print(ols_model.summary())
 
@@ -101,8 +126,9 @@ print("- To test whether Northeast and West are lower, check their C(region) coe
 # 6. Fit a linear mixed effects model (states as random intercepts)
 
 try:
-    md = smf.mixedlm("diabetes_prevalence ~ year_c * C(region)", df, groups=df["state_abbr"])
-    mdf = md.fit(reml=False)  # maximum likelihood
+    # Cached like the OLS fit; a changed panel warm-starts from the last fit
+    mdf = fit_mixedlm("diabetes_prevalence ~ year_c * C(region)", df, "state_abbr",
+                      reml=False)  # maximum likelihood
     print("\nLinear Mixed Effects (random intercept for state) results:")
     print(mdf.summary())
 except Exception as e:
@@ -113,14 +139,15 @@ except Exception as e:
 
 # 7. Quick automated checks: which region has highest average overall and by most recent year
 
-overall_by_region = df.groupby('region')['diabetes_prevalence'].mean().sort_values(ascending=False)
+pooled = agg.table('region', 'diabetes_prevalence', pooled=True)
+overall_by_region = (pooled.set_index('geo')['mean'].rename_axis('region')
+                     .rename('diabetes_prevalence').sort_values(ascending=False))
 print("\nOverall average diabetes prevalence by region (descending):\n", overall_by_region)
 
 most_recent_year = df['year'].max()
-recent_by_region = (df[df['year'] == most_recent_year]
-                    .groupby('region')['diabetes_prevalence']
-                    .mean()
-                    .sort_values(ascending=False))
+recent = region_trends[region_trends['year'] == most_recent_year]
+recent_by_region = (recent.set_index('region')['mean_prev']
+                    .rename('diabetes_prevalence').sort_values(ascending=False))
 print(f"\nAverage diabetes prevalence by region in the most recent year ({most_recent_year}):\n", recent_by_region)
 
 # 8. pairwise contrasts to test 'South > Northeast' and 'South > West'
@@ -157,6 +184,8 @@ if mdf is not None:
 
 print("\nAnalysis complete. Outputs produced:")
 print(" - region_diabetes_trends.png (plot)")
+print(" - state_trends.csv")
+print(" - region_trends.csv (region-year means with SE, inverse-variance weighted means and bootstrap CIs)")
 print(" - ols_summary.txt")
 if mdf is not None:
     print(" - mixedlm_summary.txt")
@@ -1,14 +1,90 @@
 from sklearn.linear_model import LinearRegression
 from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
 import pandas as pd
+from pathlib import Path
+import numpy as np
+import store
+import arrays
+from instrument import stage
+from backtest import rolling_origin_arrays
+from cube import ci_columns
+from weighted import ci_se, wls
 
-#For K-fold
-from sklearn.model_selection import cross_val_score,KFold
+PROCESSED = Path("data/processed")
+FEATURES = ["inactivity_prevalence","obesity_prevalence","smoking_prevalence"]
+TARGET = "diabetes_prevalence"
+KEYS = ["state_fips", "year"]
+
+def load_split(name, columns, filters=None):
+    # Parquet store when preprocess.py wrote one (only the needed columns are
+    # read), otherwise the CSV copy
+    path = PROCESSED / store.STORE_DIR / name
+    if store.has_dataset(path):
+        return store.read_dataset(path, columns=columns, filters=filters)
+    return pd.read_csv(PROCESSED / f"{name}.csv", usecols=columns)
+
+def load_xy(name):
+    # Memory-mapped .npy split when preprocess.py --npy wrote one: FEATURES is
+    # a view of the mapped file and nothing is parsed. Otherwise the table split.
+    folder = PROCESSED / arrays.ARRAY_DIR / name
+    if arrays.has_split(folder):
+        X, y, keys, meta = arrays.load_split(folder, FEATURES)
+        return X, y.reshape(-1, 1), arrays.key_column(keys, meta, "year")
+    X = load_split(f"X_{name}", FEATURES + ["year"])
+    return X[FEATURES], load_split(f"y_{name}", [TARGET]), X["year"].to_numpy()
+
+def load_keys(name):
+    # (state_fips, year) of the rows load_xy(name) returns, from the same source
+    folder = PROCESSED / arrays.ARRAY_DIR / name
+    if arrays.has_split(folder):
+        _, _, keys, meta = arrays.load_split(folder)
+        return pd.DataFrame({k: arrays.key_column(keys, meta, k) for k in KEYS}).astype("int64")
+    return load_split(f"X_{name}", KEYS).astype("int64")
+
+def align_on_keys(keys, table):
+    # table's rows reordered to match keys (state_fips, year); raises instead
+    # of falling back to row order when the two do not hold the same rows
+    table = table.astype({k: "int64" for k in KEYS})
+    if len(table) != len(keys) or table.duplicated(KEYS).any():
+        raise ValueError(f"Cannot align {len(table)} rows on {len(keys)} keys (lengths or duplicate keys differ)")
+    out = keys.merge(table, on=KEYS, how="left", indicator=True)
+    missing = int((out["_merge"] != "both").sum())
+    if missing:
+        raise ValueError(f"{missing} of {len(keys)} keys have no matching row")
+    return out.drop(columns="_merge")
+
+def fit_linear(X_train, y_train, X_test, y_test):
+    # Fit on train, score on test; shared by main() and the pipeline runner
+    model = LinearRegression()
+    with stage("model_fit", model="LinearRegression", rows_in=len(X_train)):
+        model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+    metrics = {"r2": r2_score(y_test, y_pred),
+               "mse": mean_squared_error(y_test, y_pred),
+               "mae": mean_absolute_error(y_test, y_pred)}
+    return model, metrics
+
+def fit_weighted(X_train, y_train, ci, X_test, y_test):
+    # WLS with 1/se² weights from the target's CI (rows without a CI drop out).
+    # ci: diabetes_ci_low/_ci_high row-aligned with X_train (align_on_keys);
+    # a missing pair raises rather than borrowing another source's CI
+    frame = pd.DataFrame(np.asarray(X_train, dtype=float), columns=FEATURES)
+    frame[TARGET] = np.asarray(y_train, dtype=float)[:, 0]
+    if len(ci) != len(X_train):
+        raise ValueError(f"{len(ci)} CI rows for {len(X_train)} training rows")
+    lo, hi = ci_columns(ci, TARGET, required=True)
+    w = 1.0 / ci_se(ci[lo], ci[hi]) ** 2
+    fit = wls(frame, [TARGET], FEATURES, feature_sets=[FEATURES], weights=np.nan_to_num(w, posinf=0.0)[:, None])
+    coef = fit.set_index("term")["coef"]
+    y_pred = coef["const"] + np.asarray(X_test, dtype=float) @ coef[FEATURES].to_numpy()
+    metrics = {"r2": r2_score(y_test, y_pred),
+               "mse": mean_squared_error(y_test, y_pred),
+               "mae": mean_absolute_error(y_test, y_pred)}
+    return fit, metrics
 
 def main():
 
-    df = pd.read_csv("data/processed/X_train.csv")
-    df = df[["inactivity_prevalence","obesity_prevalence","smoking_prevalence"]]
+    df = load_split("X_train", FEATURES)
 
     df.head()
     #correlation matrix
@@ -17,27 +93,18 @@ def main():
     print('\n-----------------------------------------------------------------------------')
     
     #Formatting the split and processed data
-    X_test = pd.read_csv("data/processed/X_test.csv")
-    y_test = pd.read_csv("data/processed/y_test.csv")
+    X_test, y_test, _ = load_xy("test")
+    X_train, y_train, train_years = load_xy("train")
 
-    X_train = pd.read_csv("data/processed/X_train.csv")
-    y_train = pd.read_csv("data/processed/y_train.csv")
 
-    X_train = X_train[['inactivity_prevalence',"obesity_prevalence","smoking_prevalence"]]
-    X_test = X_test[['inactivity_prevalence',"obesity_prevalence","smoking_prevalence"]]
-
-
-    model1 = LinearRegression()
-    model1.fit(X_train,y_train)
-
-    y_pred = model1.predict(X_test)
+    model1, metrics = fit_linear(X_train, y_train, X_test, y_test)
 
     #Model Information
     print(f'\nCoefficients:\n\tInactivity: {model1.coef_[0][0]}\n\tObesity: {model1.coef_[0][1]}\n\tSmoking: {model1.coef_[0][2]}\n'
           f'Intercept: {model1.intercept_[0]}\n'
-          f'R-Squared: {r2_score(y_test,y_pred)}\n'
-          f'Mean Squared Error: {mean_squared_error(y_test,y_pred)}\n'
-          f'Mean Absolute Error: {mean_absolute_error(y_test, y_pred)}\n')
+          f'R-Squared: {metrics["r2"]}\n'
+          f'Mean Squared Error: {metrics["mse"]}\n'
+          f'Mean Absolute Error: {metrics["mae"]}\n')
     
     #Linear Regression Equation
     feature_names = ['inactivity', 'Obesity', 'smoking'] 
@@ -48,15 +115,30 @@ def main():
 
     print(f"Regression Equation: {equation}")
 
+    print('\n-----------------------------------------------------------------------------')
+    # Same model weighted by the precision of each state-year estimate
+    # CIs joined on (state_fips, year): X/y may come from the npy export
+    ci = align_on_keys(load_keys("train"), load_split("X_train", KEYS + ["diabetes_ci_low", "diabetes_ci_high"]))
+    wfit, wmetrics = fit_weighted(X_train, y_train, ci, X_test, y_test)
+    print("Inverse-variance weighted (WLS, weights from the diabetes CI):")
+    for r in wfit.itertuples():
+        print(f'\t{r.term}: {r.coef:.4f} (se {r.se:.4f})')
+    print(f'n={wfit.n.iloc[0]}  R-Squared: {wmetrics["r2"]}  Mean Squared Error: {wmetrics["mse"]}  '
+          f'Mean Absolute Error: {wmetrics["mae"]}')
+
     
     print('\n-----------------------------------------------------------------------------')
-    num_folds = 5
-    kf = KFold(n_splits=num_folds, shuffle=True, random_state=42)
-    cross_val_results = cross_val_score(model1, X_train, y_train, cv=kf)
+    # Rolling-origin backtest: fit on all years before each origin, score that
+    # year. Shuffled K-fold on a state-year panel trains on future years.
+    with stage("model_fit", model="rolling_origin", rows_in=len(X_train)) as st:
+        results = rolling_origin_arrays(np.asarray(X_train, dtype=float), np.asarray(y_train, dtype=float)[:, 0],
+                                        train_years, FEATURES, min_train_years=3)
+        st.rows_out = len(results)
 
-    print("Cross-Validation Results:")
-    for i, result in enumerate(cross_val_results,1):
-        print(f'\tFold {i}: {result*100:.2f}%')
-    print(f'Mean Accuracy: {cross_val_results.mean()*100:.2f}%')
+    print("Rolling-origin Backtest Results:")
+    for r in results.itertuples():
+        print(f'\tOrigin {r.origin_year} (train n={r.n_train}): R2={r.r2:.3f}  MSE={r.mse:.3f}  MAE={r.mae:.3f}')
+    print(f'Mean R2: {results.r2.mean():.3f}  Mean MSE: {results.mse.mean():.3f}  Mean MAE: {results.mae.mean():.3f}')
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
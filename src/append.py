@@ -0,0 +1,324 @@
+import csv
+import json
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import clean
+import preprocess
+import store
+import arrays
+import cube
+from backtest import year_stats, solve_batched, _scores
+from instrument import stage
+from manifest import load_manifest, save_manifest, path_digest, fingerprint, record
+
+# Append one new year of CDC data without a full rebuild:
+#
+#   1. clean only that year's rows of the new export(s)
+#   2. write them as a new year=YYYY partition of the matching interim dataset
+#   3. merge that year alone (the join key includes year, so no other year's
+#      panel rows can change) and write it as a new panel partition
+#   4. move the train/val/test windows forward: the old val year joins train,
+#      the old test year becomes val, the new year becomes test
+#   5. add the year's X'X / X'y / count to the stored per-year statistics and
+#      re-solve the linear model from them instead of refitting on all rows
+#
+# Re-appending a year that is already in the panel replaces it (revisions).
+# CSV copies are patched in place: new rows are appended, a revised year's
+# rows are swapped out. Needs the Parquet store (pyarrow).
+
+ROOT = preprocess.ROOT
+PROCESSED = preprocess.PROCESSED
+STATS = PROCESSED / "linear_stats.npz"
+MODEL = PROCESSED / "linear_model.json"
+SPLITS = ["train", "val", "test"]
+
+
+# CSV copies
+
+def splice_csv(path: Path, df, year, replace):
+    # Rows are formatted by pandas exactly as a full rewrite would; a revised
+    # year's rows are swapped in where the old ones were so the file keeps its order
+    if not path.exists():
+        return
+    with open(path, newline="") as f:
+        header = next(csv.reader(f))
+    text = df.reindex(columns=header).to_csv(index=False, header=False)
+    if not replace:
+        with open(path, "a", newline="") as f:
+            f.write(text)
+        return
+    col = header.index("year")
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(path, newline="") as src, open(tmp, "w", newline="") as out:
+        out.write(src.readline())
+        written = False
+        for line in src:
+            row = next(csv.reader([line]))
+            if row[col] == str(year):
+                if not written:
+                    out.write(text)
+                    written = True
+                continue
+            out.write(line)
+        if not written:
+            out.write(text)
+    tmp.replace(path)
+
+
+# Interim
+
+def source_column(path: Path):
+    cols = store.dataset_columns(path) if path.is_dir() else list(pd.read_csv(path, nrows=0).columns)
+    return next((c for c in cols if c.endswith("_prevalence")), None)
+
+def clean_year(raw_paths, year, cfg):
+    # Same cleaning as clean.py with the year window narrowed to the new year
+    cfg = dict(cfg, year_min=year, year_max=year)
+    frames = {}
+    for p in raw_paths:
+        df = clean.clean_one_file(p, cfg)
+        col = next((c for c in df.columns if c.endswith("_prevalence")), None)
+        if col is None or df.empty:
+            print(f"→ No {year} rows in {p.name}, skipped")
+            continue
+        frames[col] = df
+    return frames
+
+def append_interim(frames, year, sources, csv_copy=True):
+    # Returns the year's frame per interim source, in interim_paths() order
+    # (the panel merge is order-sensitive: first source wins on shared columns)
+    columns = store.load_dictionary(ROOT)
+    out = []
+    for path in sources:
+        col = source_column(path)
+        if col in frames:
+            df = frames[col]
+            replace = year in store.partition_values(path)
+            with stage("write", table=path.name, rows_in=len(df), year=year):
+                store.write_partition(df, path, columns, year)
+                if csv_copy:
+                    splice_csv(clean.INTERIM / f"{path.name}_clean.csv", df, year, replace)
+        # Read the partition back so the merge sees the stored (dictionary-typed)
+        # values, exactly as preprocess.py would. Sources without a new export
+        # contribute whatever they already hold for the year.
+        out.append(store.read_dataset(path, filters=[("year", "==", year)]))
+    return out
+
+
+# Panel and splits
+
+def append_panel(dfs, year, compact, csv_copy=True):
+    path = preprocess.STORE / "diabetes_panel"
+    order = store.dataset_columns(path)
+    panel = preprocess.panel_from_frames(dfs, compact).reindex(columns=order)
+    replace = year in store.partition_values(path)
+    with stage("write", table="diabetes_panel", rows_in=len(panel), year=year):
+        store.write_partition(panel, path, store.load_dictionary(ROOT), year)
+        if csv_copy:
+            splice_csv(PROCESSED / "diabetes_panel.csv", panel, year, replace)
+    return panel
+
+def split_years(years):
+    # Same windows as preprocess.time_splits, on the set of years with a target
+    y_min, y_max = min(years), max(years)
+    val_year = max(y_min, y_max - 1)
+    train = [y for y in years if y_min <= y <= max(y_min, val_year - 1)]
+    return {"train": train, "val": [val_year], "test": [y_max]}
+
+def advance_splits(year, panel_year, csv_copy=True):
+    # Only partitions whose split changed (or the appended year itself) are written
+    target = preprocess.TARGET
+    keys = [k for k in preprocess.KEYS if k in panel_year.columns]
+    panel_path = preprocess.STORE / "diabetes_panel"
+    have = store.read_dataset(panel_path, columns=["year", target])
+    new = split_years(sorted(int(y) for y in have.loc[have[target].notna(), "year"].unique()))
+    columns = store.load_dictionary(ROOT)
+
+    for name in SPLITS:
+        x_path, y_path = preprocess.STORE / f"X_{name}", preprocess.STORE / f"y_{name}"
+        old = set(store.partition_values(x_path)) if store.has_dataset(x_path) else set()
+        for y in old - set(new[name]):
+            store.drop_partition(x_path, y)
+            store.drop_partition(y_path, y)
+        todo = [y for y in new[name] if y not in old or y == year]
+        for y in todo:
+            rows = panel_year if y == year else store.read_dataset(panel_path, filters=[("year", "==", y)])
+            rows = rows.dropna(subset=[target, "year"])
+            with stage("write", table=f"X_{name}", rows_in=len(rows), year=y):
+                store.write_partition(rows.drop(columns=[target]), x_path, columns, y)
+                store.write_partition(rows[keys + [target]], y_path, columns, y)
+        if csv_copy and (todo or old - set(new[name])):
+            write_split_csv(name, old, new[name], todo)
+        if (todo or old - set(new[name])) and arrays.has_split(PROCESSED / arrays.ARRAY_DIR / name):
+            write_split_npy(name)
+    return new
+
+def write_split_npy(name):
+    # The .npy export is one contiguous block per split, so it is rewritten
+    # from the split's Parquet partitions rather than patched
+    folder = PROCESSED / arrays.ARRAY_DIR / name
+    dtype = arrays.load_meta(folder)["dtype"]
+    keys = preprocess.KEYS
+    X = store.read_dataset(preprocess.STORE / f"X_{name}")
+    y = store.read_dataset(preprocess.STORE / f"y_{name}")
+    df = X.merge(y[keys + [preprocess.TARGET]], on=keys, how="left", sort=False)
+    preprocess.write_split_arrays(df.sort_values(["year", "state_fips"], kind="stable"), name, dtype)
+
+def npy_dtype():
+    folder = PROCESSED / arrays.ARRAY_DIR / "train"
+    return arrays.load_meta(folder)["dtype"] if arrays.has_split(folder) else None
+
+def write_split_csv(name, old, years, todo):
+    # y_<split>.csv carries no keys, so it is only ever appended in step with
+    # X_<split>.csv or rewritten together with it
+    x_csv, y_csv = PROCESSED / f"X_{name}.csv", PROCESSED / f"y_{name}.csv"
+    if not x_csv.exists():
+        return
+    target = preprocess.TARGET
+    appended_only = set(old) <= set(years) and all(y > max(old, default=0) for y in todo)
+    x_path = preprocess.STORE / f"X_{name}"
+    y_path = preprocess.STORE / f"y_{name}"
+    X = store.read_dataset(x_path, filters=[("year", "in", todo)] if appended_only else None)
+    Y = store.read_dataset(y_path, filters=[("year", "in", todo)] if appended_only else None)
+    X = X.sort_values(["year", "state_fips"], kind="stable")
+    Y = Y.set_index(preprocess.KEYS).loc[X.set_index(preprocess.KEYS).index].reset_index()
+    header = list(pd.read_csv(x_csv, nrows=0).columns)
+    mode = "a" if appended_only else "w"
+    X.reindex(columns=header).to_csv(x_csv, mode=mode, header=not appended_only, index=False)
+    Y[[target]].to_csv(y_csv, mode=mode, header=not appended_only, index=False)
+
+
+# Linear model from per-year sufficient statistics
+
+def year_moments(df, features, target):
+    data = df.dropna(subset=list(features) + [target, "year"])
+    Z = np.column_stack([np.ones(len(data)), data[list(features)].to_numpy(dtype=float)])
+    y = data[target].to_numpy(dtype=float)
+    years, idx, G, b, n = year_stats(Z, y, data["year"].to_numpy(dtype=int))
+    yy = np.bincount(idx, y ** 2, len(years))
+    return {"years": years, "G": G, "b": b, "n": n, "yy": yy}
+
+def stats_source(manifest=None):
+    # Content fingerprint of what linear_stats.npz was built from: the panel
+    # and split datasets (file hashes are cached in the manifest)
+    paths = [preprocess.STORE / "diabetes_panel"] + [preprocess.STORE / f"{k}_{s}" for k in "Xy" for s in SPLITS]
+    return fingerprint([path_digest(p, manifest) if store.has_dataset(p) else None for p in paths])
+
+def load_stats(features, target, source=None):
+    # Built once from the whole panel; afterwards only appended years are
+    # added. Reused only when the features and the panel/splits it was saved
+    # with (source, taken before this append) still match.
+    if STATS.exists():
+        s = dict(np.load(STATS))
+        saved = str(s.pop("source")) if "source" in s else None
+        if list(s.pop("features")) == list(features) and source is not None and saved == source:
+            return s
+    cols = ["year"] + list(features) + [target]
+    return year_moments(store.read_dataset(preprocess.STORE / "diabetes_panel", columns=cols), features, target)
+
+def update_stats(stats, new):
+    keep = ~np.isin(stats["years"], new["years"])
+    merged = {k: np.concatenate([stats[k][keep], new[k]]) for k in stats}
+    order = np.argsort(merged["years"])
+    return {k: v[order] for k, v in merged.items()}
+
+def save_stats(stats, features, source):
+    tmp = STATS.with_suffix(".tmp.npz")
+    np.savez(tmp, features=np.array(features), source=np.array(source), **stats)
+    tmp.replace(STATS)
+
+def update_linear(panel_year, windows, source=None, manifest=None):
+    # source: stats_source() before the append, to check the saved stats against
+    from LinearReg import FEATURES, TARGET
+    with stage("model_fit", model="linear_stats", rows_in=len(panel_year)):
+        stats = update_stats(load_stats(FEATURES, TARGET, source), year_moments(panel_year, FEATURES, TARGET))
+        train = np.isin(stats["years"], windows["train"])
+        beta = solve_batched(stats["G"][train].sum(0)[None], stats["b"][train].sum(0)[None])[0]
+    save_stats(stats, FEATURES, stats_source(manifest))
+
+    test_year = windows["test"][0]
+    test = store.read_dataset(preprocess.STORE / "diabetes_panel", columns=["year"] + FEATURES + [TARGET],
+                              filters=[("year", "==", test_year)]).dropna()
+    pred = beta[0] + test[FEATURES].to_numpy(dtype=float) @ beta[1:]
+    r2, mse, mae = _scores(test[TARGET].to_numpy(dtype=float), pred, np.zeros(len(test), dtype=int), 1)
+    model = {"features": FEATURES, "intercept": float(beta[0]),
+             "coef": dict(zip(FEATURES, map(float, beta[1:]))),
+             "train_years": [int(y) for y in windows["train"]],
+             "n_train": int(stats["n"][train].sum()), "test_year": int(test_year),
+             "r2": float(r2[0]), "mse": float(mse[0]), "mae": float(mae[0])}
+    MODEL.write_text(json.dumps(model, indent=1))
+    return model
+
+
+def update_cube(panel_year, year):
+    # Only the appended year's cells are recomputed and rewritten; a cube
+    # that was never built is left for preprocess.py
+    if not store.has_dataset(cube.location(PROCESSED)):
+        return None
+    cells = cube.update(cube.load(PROCESSED, years=[year]), panel_year)
+    return cube.save(cells, PROCESSED, ROOT, years=[year])
+
+def main(raw_paths, year=None, csv=True, compact=None):
+    if not store.available():
+        raise RuntimeError("Appending needs the Parquet store (pyarrow); run clean.py and preprocess.py instead.")
+    panel_path = preprocess.STORE / "diabetes_panel"
+    if not store.has_dataset(panel_path):
+        raise RuntimeError("No panel in data/processed/parquet. Run clean.py and preprocess.py first.")
+    cfg = clean.load_config()
+    if compact is None:
+        compact = bool(cfg.get("compact_dtypes"))
+    if compact:
+        cfg["compact_dtypes"] = True
+    year = year or max(store.partition_values(panel_path)) + 1
+
+    sources = [p for p in preprocess.interim_paths() if p.is_dir()]
+    frames = clean_year([Path(p) for p in raw_paths], year, cfg)
+    if not frames:
+        raise SystemExit(f"No rows for {year} in {[Path(p).name for p in raw_paths]}")
+    unmatched = set(frames) - {source_column(p) for p in sources}
+    if unmatched:
+        raise SystemExit(f"No interim source for {sorted(unmatched)}; add it with clean.py first.")
+
+    manifest = load_manifest(preprocess.PROCESSED)
+    source = stats_source(manifest)
+    panel_year = append_panel(append_interim(frames, year, sources, csv), year, compact, csv)
+    windows = advance_splits(year, panel_year, csv)
+    model = update_linear(panel_year, windows, source, manifest)
+    cube_out = update_cube(panel_year, year)
+
+    # The outputs now match a full rebuild, so preprocess.py can skip next time
+    code = preprocess.code_digest(manifest)
+    paths = preprocess.interim_paths()
+    record(manifest, "panel", preprocess.panel_fingerprint(paths, manifest, code, csv, compact),
+           [f"{store.STORE_DIR}/diabetes_panel"] + (["diabetes_panel.csv"] if csv else []))
+    npy = npy_dtype()
+    record(manifest, "splits", preprocess.split_fingerprint(manifest, code, csv, npy),
+           [f"{store.STORE_DIR}/{k}_{s}" for k in "Xy" for s in SPLITS]
+           + ([f"{k}_{s}.csv" for k in "Xy" for s in SPLITS] if csv else [])
+           + ([f"{arrays.ARRAY_DIR}/{s}" for s in SPLITS] if npy else []))
+    if cube_out is not None:
+        record(manifest, "cube", preprocess.cube_fingerprint(manifest, code),
+               [str(cube_out.relative_to(preprocess.PROCESSED))])
+    save_manifest(preprocess.PROCESSED, manifest)
+
+    print(f"appended {year}: {len(panel_year)} panel rows")
+    print("windows:", {k: f"{v[0]}-{v[-1]}" for k, v in windows.items()})
+    print(f"linear (test {model['test_year']}, n_train={model['n_train']}): "
+          f"R2={model['r2']:.3f}  MSE={model['mse']:.3f}  MAE={model['mae']:.3f}")
+    return model
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Append one new year of CDC exports to interim, panel, splits and the linear model")
+    ap.add_argument("raw", nargs="+", help="new raw CDC CSV(s), one per indicator (keep them out of data/raw)")
+    ap.add_argument("--year", type=int, default=None,
+                    help="year to take from the files (default: one past the panel's last year)")
+    ap.add_argument("--no-csv", dest="csv", action="store_false", help="leave the CSV copies alone")
+    ap.add_argument("--compact", action="store_true", default=None)
+    return ap.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.raw, year=args.year, csv=args.csv, compact=args.compact)
@@ -0,0 +1,67 @@
+import json
+import shutil
+from pathlib import Path
+import numpy as np
+
+# Memory-mapped NumPy export of the X/y splits, written by
+# `preprocess.py --npy` next to the CSV/Parquet copies:
+#
+#   data/processed/npy/<split>/X.npy     float32/float64, n x p, column-major
+#   data/processed/npy/<split>/y.npy     same dtype, n
+#   data/processed/npy/<split>/keys.npy  int32, n x len(keys) (state_fips, year)
+#   data/processed/npy/<split>/meta.json {"columns", "keys", "target", "dtype", "rows"}
+#
+# load_split() maps the files read-only, so every process that loads a split
+# shares the same page-cache pages instead of parsing its own copy. X is
+# stored column-major: a run of adjacent columns (e.g. the three model
+# features) and a run of rows (one year's block; rows are sorted by year)
+# are both plain views, with no copy.
+
+ARRAY_DIR = "npy"
+
+def numeric_columns(df, exclude=()):
+    return [c for c in df.columns if c not in exclude and df[c].dtype.kind in "fiub"]
+
+def write_split(df, folder: Path, columns, target, keys, dtype="float64"):
+    tmp = folder.with_name(folder.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    X = np.asfortranarray(df[columns].to_numpy(dtype=dtype, na_value=np.nan))
+    np.save(tmp / "X.npy", X)
+    np.save(tmp / "y.npy", df[target].to_numpy(dtype=dtype, na_value=np.nan))
+    np.save(tmp / "keys.npy", df[keys].to_numpy(dtype=np.int32))
+    meta = {"columns": list(columns), "keys": list(keys), "target": target,
+            "dtype": np.dtype(dtype).name, "rows": len(df)}
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=1))
+    shutil.rmtree(folder, ignore_errors=True)
+    tmp.rename(folder)
+    return folder
+
+def remove_split(folder: Path):
+    shutil.rmtree(folder, ignore_errors=True)
+
+def has_split(folder: Path):
+    return (folder / "meta.json").exists()
+
+def load_meta(folder: Path):
+    return json.loads((folder / "meta.json").read_text())
+
+def _take(X, names, columns):
+    idx = [names.index(c) for c in columns]
+    if idx == list(range(idx[0], idx[0] + len(idx))):
+        return X[:, idx[0]:idx[0] + len(idx)]    # view
+    return X[:, idx]                             # non-adjacent columns: one copy
+
+def load_split(folder: Path, columns=None, mmap=True):
+    # Returns (X, y, keys, meta); X has `columns` in the order asked for
+    meta = load_meta(folder)
+    mode = "r" if mmap else None
+    X = np.load(folder / "X.npy", mmap_mode=mode)
+    if columns is not None:
+        X = _take(X, meta["columns"], list(columns))
+    y = np.load(folder / "y.npy", mmap_mode=mode)
+    keys = np.load(folder / "keys.npy", mmap_mode=mode)
+    return X, y, keys, meta
+
+def key_column(keys, meta, name):
+    return keys[:, meta["keys"].index(name)]
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# Rolling-origin (expanding-window) backtest for linear models on the
+# state-year panel. For each origin year t the model is fit on every year < t
+# and scored on year t, so no future year ever leaks into training.
+#
+# Instead of refitting from raw rows per fold, the per-year sufficient
+# statistics Z'Z and Z'y (Z = [1, X]) are computed once, cumulated over years,
+# and every fold is solved in one batched np.linalg call. Feature subsets reuse
+# the same statistics by slicing sub-blocks.
+
+def year_stats(Z, y, years):
+    # Per-year Gram matrices and moments; rows are grouped by year once
+    uniq, idx = np.unique(years, return_inverse=True)
+    order = np.argsort(idx, kind="stable")
+    bounds = np.searchsorted(idx[order], np.arange(len(uniq) + 1))
+    Zs, ys = Z[order], y[order]
+    p = Z.shape[1]
+    G = np.zeros((len(uniq), p, p))
+    b = np.zeros((len(uniq), p))
+    for t in range(len(uniq)):
+        s, e = bounds[t], bounds[t + 1]
+        G[t] = Zs[s:e].T @ Zs[s:e]
+        b[t] = Zs[s:e].T @ ys[s:e]
+    counts = np.diff(bounds)
+    return uniq, idx, G, b, counts
+
+def solve_batched(G, b):
+    # Stacked normal equations; pinv keeps rank-deficient folds (e.g. a
+    # constant feature in the first years) from raising
+    try:
+        return np.linalg.solve(G, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return (np.linalg.pinv(G) @ b[..., None])[..., 0]
+
+def _scores(y, pred, idx, n_groups):
+    # Per-year R², MSE and MAE with the same definitions as sklearn.metrics
+    err = y - pred
+    n = np.bincount(idx, minlength=n_groups).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mse = np.bincount(idx, err ** 2, n_groups) / n
+        mae = np.bincount(idx, np.abs(err), n_groups) / n
+        mean = np.bincount(idx, y, n_groups) / n
+        sst = np.bincount(idx, (y - mean[idx]) ** 2, n_groups)
+        r2 = 1.0 - (mse * n) / sst
+    return r2, mse, mae
+
+def rolling_origin(df, features, target, year_col="year", min_train_years=3, feature_sets=None):
+    # feature_sets: optional list of subsets of `features`, all scored from the
+    # same statistics. Rows missing any feature/target are dropped once up front.
+    # Returns one row per (feature set, origin year): n_train, n_test, r2, mse, mae.
+    data = df.dropna(subset=list(features) + [target, year_col])
+    return rolling_origin_arrays(data[list(features)].to_numpy(dtype=float), data[target].to_numpy(dtype=float),
+                                 data[year_col].to_numpy(), features, min_train_years, feature_sets)
+
+def rolling_origin_arrays(X, y, years, features, min_train_years=3, feature_sets=None):
+    # Same backtest on plain arrays, e.g. the memory-mapped .npy splits
+    # (arrays.load_split); rows with a NaN feature or target are dropped here
+    feature_sets = feature_sets or [list(features)]
+    ok = np.isfinite(X).all(axis=1) & np.isfinite(y)
+    if not ok.all():
+        X, y, years = X[ok], y[ok], years[ok]
+    Z = np.column_stack([np.ones(len(X)), X])
+    y = np.asarray(y, dtype=float)
+
+    uniq, idx, G, b, counts = year_stats(Z, y, years)
+    # Cumulative stats for "all years before t" sit at position t-1
+    Gc, bc, nc = np.cumsum(G, axis=0), np.cumsum(b, axis=0), np.cumsum(counts)
+    origins = np.arange(min_train_years, len(uniq))
+    if len(origins) == 0:
+        raise ValueError(f"Need more than {min_train_years} distinct years to backtest.")
+
+    test = np.isin(idx, origins)
+    rows = []
+    for fs in feature_sets:
+        cols = [0] + [1 + list(features).index(f) for f in fs]
+        sub = np.ix_(range(len(uniq)), cols, cols)
+        beta = solve_batched(Gc[sub][origins - 1], bc[:, cols][origins - 1])
+        # Each test row is predicted with the coefficients of its own origin
+        fold = np.full(len(uniq), -1)
+        fold[origins] = np.arange(len(origins))
+        f_idx = fold[idx[test]]
+        pred = np.einsum("ij,ij->i", Z[test][:, cols], beta[f_idx])
+        r2, mse, mae = _scores(y[test], pred, f_idx, len(origins))
+        rows.append(pd.DataFrame({
+            "features": "+".join(fs),
+            "origin_year": uniq[origins],
+            "n_train": nc[origins - 1],
+            "n_test": counts[origins],
+            "r2": r2, "mse": mse, "mae": mae,
+        }))
+    return pd.concat(rows, ignore_index=True)
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Percentile bootstrap CIs for group means (e.g. region x year), resampling
+# rows (states) within each group. Every replicate of every group is drawn in
+# one array operation: rows are sorted by group, one uniform matrix of shape
+# (replicates, rows) is mapped to within-group indices, and group means come
+# from np.add.reduceat over the resampled block. Large replicate counts are
+# split into batches with independent child seeds, optionally on a process
+# pool; results depend only on `seed` and `batch`, not on `workers`.
+
+def _batch_means(values, offsets, sizes, row_group, n_boot, seed):
+    rng = np.random.default_rng(seed)
+    u = rng.random((n_boot, len(row_group)))
+    idx = offsets[row_group] + (u * sizes[row_group]).astype(np.int64)
+    ok = ~np.isnan(values)
+    filled = np.where(ok, values, 0.0)
+    # (n_boot, rows, k) -> per-group sums along the row axis
+    sums = np.add.reduceat(filled[idx], offsets, axis=1)
+    counts = np.add.reduceat(ok[idx], offsets, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+def group_bootstrap(df, values, by, n_boot=10_000, seed=42, alpha=0.05, batch=2_000, workers=1):
+    values = [values] if isinstance(values, str) else list(values)
+    data = df.dropna(subset=by).sort_values(by, kind="stable")
+    keys = data[by].drop_duplicates().reset_index(drop=True)
+    row_group = data.groupby(by, sort=True, observed=True).ngroup().to_numpy()
+    sizes = np.bincount(row_group)
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    v = data[values].to_numpy(dtype=float)
+
+    counts = [min(batch, n_boot - i) for i in range(0, n_boot, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    args = [(v, offsets, sizes, row_group, n, s) for n, s in zip(counts, seeds)]
+    if workers and workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            reps = list(pool.map(_batch_means, *zip(*args)))
+    else:
+        reps = [_batch_means(*a) for a in args]
+    reps = np.concatenate(reps, axis=0)   # (n_boot, groups, k)
+
+    lo, hi = np.nanpercentile(reps, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    ok = ~np.isnan(v)
+    n = np.add.reduceat(ok, offsets, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.add.reduceat(np.where(ok, v, 0.0), offsets, axis=0) / n
+
+    # Tidy output: one row per group and indicator
+    out = []
+    for j, col in enumerate(values):
+        part = keys.copy()
+        part["indicator"] = col
+        part["n"] = n[:, j]
+        part["mean"] = mean[:, j]
+        part["boot_low"] = lo[:, j]
+        part["boot_high"] = hi[:, j]
+        out.append(part)
+    return pd.concat(out, ignore_index=True)
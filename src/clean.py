@@ -1,8 +1,19 @@
+import io
 import re
+import json
+import shutil
+import argparse
+from functools import lru_cache
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pandas as pd
 import yaml
 from datetime import datetime
+import store
+from instrument import stage, suppressed, size_of
+from manifest import load_manifest, save_manifest, file_digest, fingerprint, is_fresh, record
+from validate import compile_schema, Validator
 
 THIS = Path(__file__).resolve()
 ROOT = THIS.parent
@@ -13,8 +24,7 @@ for _ in range(5):  # walk up a few levels just in case
 RAW = ROOT / "data" / "raw"
 INTERIM = ROOT / "data" / "interim"
 REPORTS = ROOT / "reports"
-INTERIM.mkdir(parents=True, exist_ok=True)
-REPORTS.mkdir(parents=True, exist_ok=True)
+STORE = INTERIM / store.STORE_DIR   # year-partitioned Parquet datasets, one per raw file
 
 # USPS -> FIPS
 STATE_LOOKUP = {
@@ -38,6 +48,14 @@ NAME_TO_USPS = { # for full state names in CDC files
 
 YEAR_MIN, YEAR_MAX = 2014, 2023
 
+def year_bounds(cfg):
+    return cfg.get("year_min", YEAR_MIN), cfg.get("year_max", YEAR_MAX)
+
+def ensure_dirs():
+    # Created on first write, not at import, so importing clean is side-effect free
+    INTERIM.mkdir(parents=True, exist_ok=True)
+    REPORTS.mkdir(parents=True, exist_ok=True)
+
 def load_config():
     with open(ROOT / "columns_config.yaml", "r") as f:
         return yaml.safe_load(f)
@@ -48,29 +66,56 @@ def standardize_colnames(df):
                   .str.replace(r"[^a-z0-9]+","_", regex=True).str.strip("_"))
     return df
 
-def read_cdc_csv(path: Path) -> pd.DataFrame:
-    # CDC "Line chart" CSV: first rows are titles, then the header with State/Year
-    text = path.read_text(encoding="utf-8", errors="ignore").splitlines()
+def read_raw(path: Path) -> bytes:
+    # One disk read per file; header sniffing and parsing both work off this buffer
+    return path.read_bytes()
 
+def sniff_header(lines):
     header_idx = None
-    for i, line in enumerate(text[:50]):  # scan a generous range
+    for i, line in enumerate(lines[:50]):  # scan a generous range
         if ("," in line) and ("State" in line) and ("Year" in line):
             header_idx = i
             break
     if header_idx is None:
         # Fallback: first comma-containing line
-        for i, line in enumerate(text):
+        for i, line in enumerate(lines):
             if "," in line:
                 header_idx = i
                 break
     if header_idx is None:
         raise ValueError("Could not locate a CSV header with commas.")
+    return header_idx
+
+def read_cdc_csv(path: Path, raw: bytes = None) -> pd.DataFrame:
+    # CDC "Line chart" CSV: first rows are titles, then the header with State/Year
+    if raw is None:
+        raw = read_raw(path)
+    with stage("header_sniff", file=path.name):
+        text = raw.decode("utf-8", errors="ignore").splitlines()
+        header_idx = sniff_header(text)
 
     # Use the C engine first; if it complains, fall back to the python engine
-    try:
-        return pd.read_csv(path, skiprows=header_idx)
-    except Exception:
-        return pd.read_csv(path, skiprows=header_idx, engine="python")
+    with stage("parse", file=path.name, bytes_read=len(raw)) as st:
+        try:
+            df = pd.read_csv(io.BytesIO(raw), skiprows=header_idx)
+        except Exception:
+            df = pd.read_csv(io.BytesIO(raw), skiprows=header_idx, engine="python")
+        st.rows_out = len(df)
+    return df
+
+def first_line(raw: bytes) -> str:
+    return raw.split(b"\n", 1)[0].decode("utf-8", errors="ignore").rstrip("\r")
+
+def detect_indicator(path: Path, title: str) -> str:
+    blob = (path.name + " " + title).lower()
+
+    if ("obesity" in blob) or ("bmi" in blob):
+        return "obesity"
+    elif ("inactivity" in blob) or ("physical inactivity" in blob):
+        return "inactivity"
+    elif "smoking" in blob:
+        return "smoking"
+    return "diabetes"   # default
 
 def map_headers(df, cfg):
     rev = {}
@@ -82,7 +127,7 @@ def map_headers(df, cfg):
 def ensure_geo(df):
     if "state" in df.columns:
         df["state"] = df["state"].astype(str).str.strip()
-        df["state"] = df["state"].map(lambda x: NAME_TO_USPS.get(x, x)).str.upper()
+        df["state"] = df["state"].map(NAME_TO_USPS).fillna(df["state"]).str.upper()
     if "state_fips" not in df.columns and "state" in df.columns:
         df["state_fips"] = df["state"].map(STATE_LOOKUP)
     return df
@@ -94,36 +139,40 @@ def coerce_types(df):
         df["state_fips"] = pd.to_numeric(df["state_fips"], errors="coerce").astype("Int64")
     return df
 
-def fix_units(df, cfg):
+def unit_factors(df, cfg):
+    # Per rate column: multiplier that brings it to the configured unit
     as_percent = bool(cfg.get("store_as_percent", True))
+    factors = {}
     for c in df.columns:
         if any(k in c for k in ["prevalence","rate","pct","percentage","insecurity"]):
             s = pd.to_numeric(df[c], errors="coerce")
-            if as_percent and s.max(skipna=True) is not None and s.max(skipna=True) <= 1.0:
-                s = s * 100.0
-            if (not as_percent) and s.max(skipna=True) is not None and s.max(skipna=True) > 1.0:
-                s = s / 100.0
-            df[c] = s.clip(lower=0)
-    return df
+            factor = 1.0
+            mx = s.max(skipna=True)
+            if as_percent and pd.notna(mx) and mx <= 1.0:
+                factor = 100.0
+            if (not as_percent) and pd.notna(mx) and mx > 1.0:
+                factor = 0.01
+            factors[c] = factor
+    return factors
 
-def clean_one_file(path: Path, cfg):
-    try:
-        df = read_cdc_csv(path)
-    except Exception:
-        df = pd.read_csv(path)
+def fix_units(df, cfg, factors=None):
+    # factors=None decides the unit from this frame; the streaming reader
+    # passes the factors decided on its first chunk so every chunk agrees
+    if factors is None:
+        factors = unit_factors(df, cfg)
+    for c, factor in factors.items():
+        if c not in df.columns:
+            continue
+        s = pd.to_numeric(df[c], errors="coerce")
+        if factor == 100.0:
+            s = s * 100.0
+        elif factor == 0.01:
+            s = s / 100.0
+        df[c] = s.clip(lower=0)
+    return df
 
+def prepare_frame(df, indicator, cfg):
     df = standardize_colnames(df)
-    
-    blob = (path.name + " " + path.read_text(encoding="utf-8", errors="ignore").splitlines()[0]).lower()
-
-    if ("obesity" in blob) or ("bmi" in blob):
-        indicator = "obesity"
-    elif ("inactivity" in blob) or ("physical inactivity" in blob):
-        indicator = "inactivity"
-    elif "smoking" in blob:
-        indicator = "smoking"
-    else:
-        indicator = "diabetes"   # default
 
     rename_map = {
     "percentage": "diabetes_prevalence" if indicator == "diabetes" else f"{indicator}_prevalence",
@@ -142,63 +191,319 @@ def clean_one_file(path: Path, cfg):
         s = df["state"].astype(str).str.strip().str.lower()
         df = df[~s.isin(["median of states","median_of_states","united states","united_states"])]
 
-    df = map_headers(df, cfg)
-    df = ensure_geo(df)
-    df = coerce_types(df)
-    df = fix_units(df, cfg)
+    with stage("map_headers", rows_in=len(df)) as st:
+        df = map_headers(df, cfg)
+        st.rows_out = len(df)
+    with stage("ensure_geo", rows_in=len(df)) as st:
+        df = ensure_geo(df)
+        st.rows_out = len(df)
+    return coerce_types(df)
 
-    # Keep 2014–2023
+def finish_frame(df, cfg, factors=None):
+    with stage("fix_units", rows_in=len(df)) as st:
+        df = fix_units(df, cfg, factors)
+        st.rows_out = len(df)
+
+    # Keep 2014–2023 (append.py narrows the window to the year being added)
     if "year" in df.columns:
-        df = df[df["year"].between(YEAR_MIN, YEAR_MAX)]
+        df = df[df["year"].between(*year_bounds(cfg))]
+    if cfg.get("compact_dtypes"):
+        df = compact_dtypes(df)
+    return df
+
+# Compact representation: fixed state categories, narrow ints, float32 rates
+STATE_DTYPE = pd.CategoricalDtype(sorted(STATE_LOOKUP))
+STATE_FIPS = set(STATE_LOOKUP.values())
+RATE_MARKERS = ["prevalence","rate","pct","percentage","insecurity","ci_low","ci_high"]
+
+def state_level(df):
+    # State-level keys: every FIPS code present is a state's (county FIPS such
+    # as 1001 are not), or without a FIPS column some state names match
+    if "state_fips" in df.columns:
+        fips = pd.to_numeric(df["state_fips"], errors="coerce").dropna()
+        return fips.isin(STATE_FIPS).all()
+    return "state" in df.columns and df["state"].astype(str).isin(STATE_DTYPE.categories).any()
+
+def compact_dtypes(df):
+    with stage("compact_dtypes", rows_in=len(df)) as st:
+        df = df.copy()
+        fips_dtype = "int8"
+        if not state_level(df):
+            # County (or other sub-state) keys: keep every row, FIPS in int32
+            # and the names as an open category
+            fips_dtype = "int32"
+            if "state" in df.columns:
+                df["state"] = df["state"].astype(str).astype("category")
+        elif "state" in df.columns:
+            # Rows whose state is not one of STATE_LOOKUP (territories,
+            # "Median of States") have no FIPS code and never reach the panel,
+            # so they are dropped here rather than widening every key column
+            # to a nullable type
+            state = df["state"].astype(str)
+            keep = state.isin(STATE_DTYPE.categories)
+            dropped = int((~keep).sum())
+            if dropped:
+                names = sorted(state[~keep].unique())
+                print(f"   compact_dtypes: dropped {dropped} rows without a state code "
+                      f"({', '.join(names[:5])}{', ...' if len(names) > 5 else ''})")
+            st.fields["dropped"] = dropped
+            df = df[keep].copy()
+            df["state"] = state[keep].astype(STATE_DTYPE)
+        if "state_fips" in df.columns:
+            fips = pd.to_numeric(df["state_fips"], errors="coerce")
+            df["state_fips"] = fips.astype(fips_dtype) if fips.notna().all() else fips.astype(fips_dtype.capitalize())
+        if "year" in df.columns:
+            yr = pd.to_numeric(df["year"], errors="coerce")
+            df["year"] = yr.astype("int16") if yr.notna().all() else yr.astype("Int16")
+        # One vectorized to_numeric per rate/CI column turns "No Data" into NaN
+        for c in df.columns:
+            if any(k in c for k in RATE_MARKERS):
+                df[c] = pd.to_numeric(df[c], errors="coerce").astype("float32")
+        st.rows_out = len(df)
+    return df
+
+@lru_cache(maxsize=None)
+def schema():
+    # Compiled once per process from data_dictionary.yaml
+    return compile_schema(store.load_dictionary(ROOT), STATE_LOOKUP)
 
-    # Save
-    out_path = INTERIM / (path.stem + ".parquet")
+def validate_frame(df, validator, drop_invalid=False):
+    with stage("validate", rows_in=len(df)) as st:
+        validator.check(df)
+        if drop_invalid:
+            df = validator.apply(df)
+        st.rows_out = len(df)
+    return df
+
+def clean_frame(df, indicator, cfg, factors=None):
+    return finish_frame(prepare_frame(df, indicator, cfg), cfg, factors)
+
+def clean_one_file(path: Path, cfg):
+    with stage("read", file=path.name) as st:
+        raw = read_raw(path)
+        st.bytes_read = len(raw)
     try:
-        df.to_parquet(out_parquet, index=False)
-    except Exception as e:
-    # No pyarrow/fastparquet? Write CSV so we can keep going.
-        out_csv = INTERIM / (path.stem + "_clean.csv")
+        df = read_cdc_csv(path, raw)
+    except Exception:
+        df = pd.read_csv(io.BytesIO(raw))
+
+    with stage("clean", file=path.name, rows_in=len(df)) as st:
+        df = clean_frame(df, detect_indicator(path, first_line(raw)), cfg)
+        st.rows_out = len(df)
+
+    return df
+
+HEADER_PREFIX_LINES = 50
+HEADER_PREFIX_BYTES = 64 * 1024
+
+def read_prefix(path: Path):
+    # Bounded prefix: at most HEADER_PREFIX_LINES lines / HEADER_PREFIX_BYTES bytes
+    lines = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for _ in range(HEADER_PREFIX_LINES):
+            line = f.readline(HEADER_PREFIX_BYTES)
+            if not line:
+                break
+            lines.append(line.rstrip("\r\n"))
+    return lines
+
+def clean_file_streaming(path: Path, cfg, chunksize=100_000, csv=True, validator=None, drop_invalid=False):
+    # Constant-memory path for exports too large to load at once: header and
+    # indicator come from a bounded prefix, then each chunk goes through the
+    # same clean_frame() steps and is appended to the interim outputs.
+    prefix = read_prefix(path)
+    header_idx = sniff_header(prefix)
+    indicator = detect_indicator(path, prefix[0] if prefix else "")
+
+    use_store = store.available()
+    columns = store.load_dictionary(ROOT) if use_store else None
+    dataset = STORE / path.stem
+    tmp_dataset = dataset.with_name(dataset.name + ".tmp")
+    shutil.rmtree(tmp_dataset, ignore_errors=True)
+
+    out_csv = INTERIM / (path.stem + "_clean.csv")
+    tmp = out_csv.with_suffix(".csv.tmp")
+    factors = None
+    rows = 0
+    # dtype=str: per-chunk type inference would otherwise format untouched
+    # columns (e.g. CI bounds) differently depending on where "No Data" falls
+    reader = pd.read_csv(path, skiprows=header_idx, chunksize=chunksize, dtype=str)
+    with open(tmp, "w", newline="") if (csv or not use_store) else nullcontext() as out:
+        for i, chunk in enumerate(reader):
+            with suppressed():
+                df = prepare_frame(chunk, indicator, cfg)
+                if factors is None:
+                    # Unit decision is locked on the first chunk
+                    factors = unit_factors(df, cfg)
+                df = finish_frame(df, cfg, factors)
+                if validator is not None:
+                    # Duplicate keys are tracked across chunks by the validator
+                    df = validate_frame(df, validator, drop_invalid)
+            if out is not None:
+                df.to_csv(out, index=False, header=(i == 0))
+            if use_store and len(df):
+                store.write_dataset(df, tmp_dataset, columns, append=True, part=i)
+            rows += len(df)
+    if out is not None:
+        tmp.replace(out_csv)
+    if use_store:
+        shutil.rmtree(dataset, ignore_errors=True)
+        if tmp_dataset.exists():
+            tmp_dataset.rename(dataset)
+    return rows
+
+def write_interim(p: Path, df, csv=True):
+    # Returns a list of (kind, message) lines so the caller owns stdout and the log
+    ensure_dirs()
+    notes = []
+    outputs = []
+    if store.available():
+        out = store.write_dataset(df, STORE / p.stem, store.load_dictionary(ROOT))
+        outputs.append(f"{store.STORE_DIR}/{out.name}")
+        notes.append(("ok", f"   wrote: {out}"))
+    if csv or not store.available():
+        out_csv = INTERIM / (p.stem + "_clean.csv")
         df.to_csv(out_csv, index=False)
+        outputs.append(out_csv.name)
+        notes.append(("ok", f"   wrote: {out_csv}"))
+    notes.append(("log", f"{p.name} → {', '.join(outputs)} | rows={len(df)}"))
+    return notes
 
-        with open(REPORTS / "cleaning_log.md", "a") as log:
-            log.write(f"- {datetime.now().isoformat()} | {path.name} → {out_path.name} | rows={len(df)}\n")
-        return df
+def validation_notes(p: Path, validator):
+    lines = validator.lines()
+    notes = [("ok", f"   validate: {line}") for line in lines]
+    notes.append(("log", f"{p.name} validation | " + " | ".join(lines)))
+    notes.append(("validation", validator.summary()))
+    return notes
 
-def main():
+def process_file(p: Path, cfg, stream=False, chunksize=100_000, csv=True, drop_invalid=False):
+    # Worker entry point: clean + validate + write one raw file, never raises
+    ensure_dirs()
+    validator = Validator(schema())
+    try:
+        if stream:
+            with stage("stream_clean", file=p.name, bytes_read=size_of(p)) as st:
+                rows = clean_file_streaming(p, cfg, chunksize, csv, validator, drop_invalid)
+                st.rows_out = rows
+            return True, [("ok", f"   streamed: {p.name} ({rows} rows)"),
+                          ("log", f"{p.name} → {p.stem} | rows={rows} | streamed")] + validation_notes(p, validator)
+        df = validate_frame(clean_one_file(p, cfg), validator, drop_invalid)
+        with stage("write", file=p.name, rows_in=len(df)) as st:
+            notes = write_interim(p, df, csv)
+            st.bytes_written = size_of(STORE / p.stem) + size_of(INTERIM / (p.stem + "_clean.csv"))
+        return True, notes + validation_notes(p, validator)
+    except Exception as e:
+        return False, [("ok", f"   ERROR: {e}"), ("log", f"ERROR {p.name}: {e}")]
+
+def interim_outputs(p: Path):
+    names = [f"{store.STORE_DIR}/{p.stem}", p.stem + "_clean.csv"]
+    return [n for n in names if (INTERIM / n).exists()]
+
+def _report(p: Path, notes):
+    print("→ Processed:", p.name)
+    for kind, msg in notes:
+        if kind == "ok":
+            print(msg)
+        elif kind == "log":
+            with open(REPORTS / "cleaning_log.md", "a") as log:
+                log.write(f"- {datetime.now().isoformat()} | {msg}\n")
+
+def save_validation(results):
+    # reports/validation.json: latest summary per raw file (files skipped as
+    # unchanged keep their previous entry)
+    path = REPORTS / "validation.json"
+    try:
+        report = json.loads(path.read_text())
+    except (OSError, ValueError):
+        report = {}
+    report.update(results)
+    path.write_text(json.dumps(report, indent=1, sort_keys=True))
+
+def code_digest(manifest=None):
+    # The cleaner's output depends on this file, the Parquet writer, the
+    # validator and the data dictionary they both read
+    deps = [THIS, THIS.with_name("store.py"), THIS.with_name("validate.py"), ROOT / "data_dictionary.yaml"]
+    return fingerprint([(p.name, file_digest(p, manifest)) for p in deps])
+
+def main(workers=1, force=False, stream=False, chunksize=100_000, csv=True, compact=False,
+         drop_invalid=False):
     cfg = load_config()
+    if compact:
+        cfg["compact_dtypes"] = True
+    ensure_dirs()
 
     print("CLEAN ROOT:", ROOT)
     print("RAW PATH :", RAW)
     print("FILES IN RAW:", [x.name for x in RAW.glob("*")])
 
-    found_any = False
-    for p in sorted(RAW.glob("*.[cC][sS][vV]")):   # matches .csv and .CSV
-        found_any = True
-        print("→ Processing:", p.name)
-        try:
-            df = clean_one_file(p, cfg)
-
-            out_path = INTERIM / (p.stem + ".parquet")
-            try:
-                df.to_parquet(out_path, index=False)
-                print("   wrote:", out_path)
-            except Exception as e:
-                # Parquet fallback to CSV
-                out_csv = INTERIM / (p.stem + "_clean.csv")
-                df.to_csv(out_csv, index=False)
-                print("   parquet failed, wrote CSV instead:", out_csv)
-                with open(REPORTS / "cleaning_log.md", "a") as log:
-                    log.write(f"- {datetime.now().isoformat()} | PARQUET FAIL {p.name}: {e} | wrote {out_csv.name}\n")
-
-        except Exception as e:
-            print("   ERROR:", e)
-            with open(REPORTS / "cleaning_log.md", "a") as log:
-                log.write(f"- {datetime.now().isoformat()} | ERROR {p.name}: {e}\n")
+    paths = sorted(RAW.glob("*.[cC][sS][vV]"))   # matches .csv and .CSV
+
+    # Skip raw files whose bytes, config, year window, cleaner code and
+    # output-changing options are unchanged. --stream/--chunksize/--workers
+    # give identical output, so they are not part of the key.
+    manifest = load_manifest(INTERIM)
+    code = code_digest(manifest)
+    conf = file_digest(ROOT / "columns_config.yaml", manifest)
+    todo = []
+    for p in paths:
+        fp = fingerprint(file_digest(p, manifest), conf, list(year_bounds(cfg)), code, csv,
+                         bool(cfg.get("compact_dtypes")), drop_invalid)
+        if not force and is_fresh(manifest, p.name, fp, INTERIM):
+            print("→ Unchanged, skipping:", p.name)
+            continue
+        todo.append((p, fp))
 
-    if not found_any:
+    validation = {}
+    def _done(p, fp, ok, notes):
+        _report(p, notes)
+        validation.update({p.name: msg for kind, msg in notes if kind == "validation"})
+        if ok:
+            record(manifest, p.name, fp, interim_outputs(p))
+
+    if workers and workers > 1 and len(todo) > 1:
+        # Each file is independent; map() keeps results in path order
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            todo_paths = [p for p, _ in todo]
+            n = len(todo)
+            results = pool.map(process_file, todo_paths, [cfg] * n, [stream] * n,
+                               [chunksize] * n, [csv] * n, [drop_invalid] * n)
+            for (p, fp), (ok, notes) in zip(todo, results):
+                _done(p, fp, ok, notes)
+    else:
+        for p, fp in todo:
+            _done(p, fp, *process_file(p, cfg, stream, chunksize, csv, drop_invalid))
+    save_manifest(INTERIM, manifest)
+    if validation:
+        save_validation(validation)
+
+    if not paths:
         print("No CSVs found in", RAW)
         with open(REPORTS / "cleaning_log.md", "a") as log:
             log.write(f"- {datetime.now().isoformat()} | WARNING: no CSVs in data/raw\n")
 
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Clean raw CDC CSVs into data/interim")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="process pool size for cleaning files in parallel (1 = serial)")
+    ap.add_argument("--force", action="store_true",
+                    help="re-clean every file even if the manifest says it is up to date")
+    ap.add_argument("--stream", action="store_true",
+                    help="read each file in chunks with constant memory; each chunk is appended to "
+                         "*_clean.csv (unless --no-csv) and, with pyarrow, to the Parquet store")
+    ap.add_argument("--chunksize", type=int, default=100_000,
+                    help="rows per chunk in --stream mode")
+    ap.add_argument("--no-csv", dest="csv", action="store_false",
+                    help="only write the Parquet store, skip the *_clean.csv copies")
+    ap.add_argument("--compact", action="store_true",
+                    help="categorical state, int8 fips (int32 for county keys), int16 year, float32 rates "
+                         "(same as compact_dtypes: true in columns_config.yaml)")
+    ap.add_argument("--drop-invalid", action="store_true",
+                    help="drop rows that fail a data_dictionary.yaml check and blank unparseable values "
+                         "(default: only report them)")
+    return ap.parse_args(argv)
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(workers=args.workers, force=args.force,
+         stream=args.stream, chunksize=args.chunksize, csv=args.csv,
+         compact=args.compact, drop_invalid=args.drop_invalid)
@@ -0,0 +1,185 @@
+import os
+import sys
+import argparse
+from pathlib import Path
+
+# Single entry point: python src/cli.py <command> [options]
+#
+#   clean | preprocess | append | fit-linear | fit-growth | sweep | forecast | weighted | plot | query | serve | startup
+#
+# Only the standard library is imported at module level. Each command imports
+# pandas / pyarrow / sklearn / statsmodels / matplotlib inside its handler, so
+# `--help` or a `query` never pays for the libraries it does not use.
+# `startup` measures the import cost of this module in fresh interpreters and
+# fails when it exceeds the budget (or a heavy library leaks into it).
+
+THIS = Path(__file__).resolve()
+SRC = THIS.parent
+ROOT = SRC
+for _ in range(4):  # walk up a few levels just in case
+    if (ROOT / "columns_config.yaml").exists() and (ROOT / "data").exists():
+        break
+    ROOT = ROOT.parent
+
+STARTUP_BUDGET_MS = 150
+HEAVY = ["pandas", "numpy", "pyarrow", "sklearn", "statsmodels", "matplotlib", "yaml"]
+
+
+# Commands. Options after the command name go to the stage's own parser.
+
+def cmd_clean(argv):
+    import clean
+    args = clean.parse_args(argv)
+    clean.main(workers=args.workers, force=args.force, stream=args.stream,
+               chunksize=args.chunksize, csv=args.csv, compact=args.compact,
+               drop_invalid=args.drop_invalid)
+
+def cmd_preprocess(argv):
+    import preprocess
+    args = preprocess.parse_args(argv)
+    preprocess.main(force=args.force, csv=args.csv, compact=args.compact, npy=args.npy)
+
+def cmd_append(argv):
+    import append
+    args = append.parse_args(argv)
+    append.main(args.raw, year=args.year, csv=args.csv, compact=args.compact)
+
+def cmd_fit_linear(argv):
+    argparse.ArgumentParser(prog="cli.py fit-linear",
+                            description="Linear model on the X/y splits").parse_args(argv)
+    # LinearReg reads data/processed relative to the repo root
+    os.chdir(ROOT)
+    import LinearReg
+    LinearReg.main()
+
+def cmd_fit_growth(argv):
+    ap = argparse.ArgumentParser(prog="cli.py fit-growth",
+                                 description="Region growth OLS (+ MixedLM) and per-state trends on the panel")
+    ap.add_argument("--mixedlm", action="store_true", help="also fit the MixedLM growth model")
+    ap.add_argument("--out", default=None, help="write the per-state trend table to this CSV")
+    args = ap.parse_args(argv)
+    import preprocess
+    from pipeline import fit_growth_node
+    out = fit_growth_node(preprocess.read_table(preprocess.panel_path()), mixedlm=args.mixedlm)
+    print(out["ols"].summary())
+    if "mixedlm" in out:
+        print(out["mixedlm"].summary())
+    if args.out:
+        out["state_trends"].to_csv(args.out, index=False)
+        print("state trends ->", args.out)
+
+def cmd_sweep(argv):
+    import sweep
+    sweep.main(argv)
+
+def cmd_forecast(argv):
+    import forecast
+    forecast.main(argv)
+
+def cmd_weighted(argv):
+    import weighted
+    weighted.main(argv)
+
+def cmd_plot(argv):
+    # The figure script lives at the repo root, next to src/
+    sys.path.insert(0, str(ROOT))
+    import CSC4740_Project_pt1
+    CSC4740_Project_pt1.main(argv)
+
+def cmd_query(argv):
+    ap = argparse.ArgumentParser(prog="cli.py query",
+                                 description="Filter a processed table (panel, X_train, y_test, ...)")
+    ap.add_argument("--table", default="diabetes_panel")
+    ap.add_argument("--state", nargs="*", default=None, help="USPS codes, e.g. GA TX")
+    ap.add_argument("--years", nargs=2, type=int, default=None, metavar=("FROM", "TO"))
+    ap.add_argument("--columns", nargs="*", default=None)
+    ap.add_argument("--csv", action="store_true", help="print CSV instead of a table")
+    args = ap.parse_args(argv)
+    import preprocess
+    import store
+
+    path = preprocess.STORE / args.table
+    columns = None
+    if args.columns:
+        columns = list(dict.fromkeys([k for k in preprocess.KEYS] + args.columns))
+    if store.has_dataset(path):
+        # Year range is pushed down to the partitions, state to the row filter
+        filters = []
+        if args.years:
+            filters += [("year", ">=", args.years[0]), ("year", "<=", args.years[1])]
+        if args.state:
+            filters.append(("state", "in", args.state))
+        df = store.read_dataset(path, columns=columns, filters=filters or None)
+    else:
+        df = preprocess.read_table(preprocess.PROCESSED / f"{args.table}.csv")
+        if columns:
+            df = df[[c for c in columns if c in df.columns]]
+        if args.years:
+            df = df[df["year"].between(*args.years)]
+        if args.state:
+            df = df[df["state"].isin(args.state)]
+    if args.csv:
+        df.to_csv(sys.stdout, index=False)
+    else:
+        print(df.to_string(index=False))
+    return df
+
+def cmd_serve(argv):
+    import service
+    args = service.parse_args(argv)
+    service.serve(args.host, args.port, service.PanelService(args.cache_size))
+
+def cmd_startup(argv):
+    ap = argparse.ArgumentParser(prog="cli.py startup",
+                                 description="Measure the import cost of the CLI against a budget")
+    ap.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    ap.add_argument("--repeat", type=int, default=7)
+    args = ap.parse_args(argv)
+    import json
+    import subprocess
+    import statistics
+
+    # Fresh interpreter per sample; time only the import, not interpreter boot
+    probe = ("import sys, time, json; sys.path.insert(0, %r); t = time.perf_counter(); "
+             "import cli; ms = (time.perf_counter() - t) * 1e3; "
+             "print(json.dumps([ms, sorted(m for m in %r if m in sys.modules)]))") % (str(SRC), HEAVY)
+    samples, leaked = [], set()
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+        ms, mods = json.loads(out.stdout)
+        samples.append(ms)
+        leaked |= set(mods)
+    median = statistics.median(samples)
+    print(f"cli import: median {median:.1f} ms, max {max(samples):.1f} ms "
+          f"over {args.repeat} runs (budget {args.budget_ms:.0f} ms)")
+    if leaked:
+        print("heavy modules imported at startup:", ", ".join(sorted(leaked)))
+    if median > args.budget_ms or leaked:
+        raise SystemExit(1)
+    print("ok")
+
+COMMANDS = {
+    "clean": (cmd_clean, "clean raw CDC CSVs into data/interim"),
+    "preprocess": (cmd_preprocess, "merge interim files into the panel and X/y splits"),
+    "append": (cmd_append, "add one new year to interim, panel, splits and the linear model"),
+    "fit-linear": (cmd_fit_linear, "linear model + rolling-origin backtest on the splits"),
+    "fit-growth": (cmd_fit_growth, "region growth models and per-state trends"),
+    "sweep": (cmd_sweep, "feature-subset x OLS/Ridge/Lasso leaderboard on the val split"),
+    "forecast": (cmd_forecast, "h-year forecasts with prediction intervals for every state and indicator"),
+    "weighted": (cmd_weighted, "inverse-variance weighted WLS and region aggregates from the CIs"),
+    "plot": (cmd_plot, "figures (use --batch for headless rendering)"),
+    "query": (cmd_query, "filter a processed table by state / year / columns"),
+    "serve": (cmd_serve, "local HTTP query service over the panel (indexed, cached)"),
+    "startup": (cmd_startup, "check the CLI import time against the startup budget"),
+}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="cli.py", description="diabetes-trends command line")
+    sub = ap.add_subparsers(dest="command", metavar="command", required=True)
+    for name, (_, help_) in COMMANDS.items():
+        sub.add_parser(name, help=help_, add_help=False)
+    args, rest = ap.parse_known_args(argv)
+    return COMMANDS[args.command][0](rest)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import store
+from regions import assign_regions
+from instrument import stage
+
+# Persisted geography x year x indicator aggregate cube. One row per
+# (level, geo, year, indicator) with additive statistics, so every mean, SE
+# or contrast is a lookup and every roll-up is a sum:
+#
+#   level     state | region | national
+#   geo       USPS code | Census region | "US"
+#   n         non-missing values          sum, sumsq   Σx, Σx²
+#   n_ci      values with a CI            ci_low_sum, ci_high_sum, var_sum
+#                                         (var_sum = Σ se², se = CI width / 3.92)
+#
+# CIs come from each indicator's <base>_ci_low/_ci_high panel columns; an
+# indicator without them gets n_ci = 0.
+#
+# State cells come from the panel; region and national cells are sums of
+# state cells. update() replaces the state cells of the years it is given and
+# re-rolls only those years, so appending a year never rescans the panel.
+# Stored as a year-partitioned dataset next to the panel (see save()).
+
+LEVELS = ["state", "region", "national"]
+STATS = ["n", "sum", "sumsq", "n_ci", "ci_low_sum", "ci_high_sum", "var_sum"]
+Z95 = 1.959963984540054
+
+def indicators(panel):
+    return [c for c in panel.columns if c.endswith("_prevalence")]
+
+def ci_columns(panel, indicator, required=False):
+    # Per-indicator CI columns (<base>_ci_low/_ci_high, named by
+    # preprocess.panel_from_frames). A bare ci_low/ci_high is never taken as
+    # any particular indicator's.
+    base = indicator[: -len("_prevalence")] if indicator.endswith("_prevalence") else indicator
+    pair = (f"{base}_ci_low", f"{base}_ci_high")
+    if all(c in panel.columns for c in pair):
+        return pair
+    if required:
+        raise ValueError(f"No {pair[0]}/{pair[1]} columns for {indicator}; rebuild the panel with preprocess.py.")
+    return None
+
+def state_cells(panel, state="state", time="year"):
+    # One row per (state, year, indicator); vectorized over all indicators
+    data = panel.dropna(subset=[state, time])
+    geo = data[state].astype(str).str.strip().str.upper().to_numpy()
+    year = data[time].to_numpy(dtype=int)
+    parts = []
+    for ind in indicators(data):
+        x = data[ind].to_numpy(dtype=float, na_value=np.nan)
+        ok = ~np.isnan(x)
+        cols = {"level": "state", "geo": geo, "year": year, "indicator": ind,
+                "n": ok.astype(int), "sum": np.where(ok, x, 0.0), "sumsq": np.where(ok, x * x, 0.0)}
+        ci = ci_columns(data, ind)
+        if ci is not None:
+            lo = pd.to_numeric(data[ci[0]], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+            hi = pd.to_numeric(data[ci[1]], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+            has = ok & ~np.isnan(lo) & ~np.isnan(hi)
+            se = (hi - lo) / (2 * Z95)
+            cols.update(n_ci=has.astype(int), ci_low_sum=np.where(has, lo, 0.0),
+                        ci_high_sum=np.where(has, hi, 0.0), var_sum=np.where(has, se * se, 0.0))
+        else:
+            zero = np.zeros(len(x))
+            cols.update(n_ci=zero.astype(int), ci_low_sum=zero, ci_high_sum=zero, var_sum=zero)
+        parts.append(pd.DataFrame(cols))
+    cells = pd.concat(parts, ignore_index=True)
+    # Duplicate (state, year) rows add up like any other roll-up
+    return cells.groupby(["level", "geo", "year", "indicator"], as_index=False, sort=False)[STATS].sum()
+
+def roll_up(states):
+    # Region and national cells as sums of state cells
+    region = states.assign(level="region", geo=assign_regions(states["geo"]).to_numpy())
+    national = states.assign(level="national", geo="US")
+    ups = [d.groupby(["level", "geo", "year", "indicator"], as_index=False, sort=False)[STATS].sum()
+           for d in (region, national)]
+    return pd.concat([states] + ups, ignore_index=True)
+
+def build(panel):
+    with stage("cube", rows_in=len(panel)) as st:
+        cube = _sorted(roll_up(state_cells(panel)))
+        st.rows_out = len(cube)
+    return cube
+
+def update(cube, new_rows):
+    # Replace the state cells of every (state, year) in new_rows, re-roll those years
+    fresh = state_cells(new_rows)
+    years = fresh["year"].unique()
+    with stage("cube_update", rows_in=len(new_rows), years=len(years)) as st:
+        touched = cube["year"].isin(years)
+        old = cube[touched & (cube["level"] == "state")]
+        replaced = old.set_index(["geo", "year", "indicator"]).index.isin(
+            fresh.set_index(["geo", "year", "indicator"]).index)
+        states = pd.concat([old[~replaced], fresh], ignore_index=True)
+        cube = _sorted(pd.concat([cube[~touched], roll_up(states)], ignore_index=True))
+        st.rows_out = len(cube)
+    return cube
+
+def _sorted(cube):
+    order = {lvl: i for i, lvl in enumerate(LEVELS)}
+    key = cube["level"].map(order)
+    return (cube.assign(_l=key).sort_values(["_l", "indicator", "year", "geo"], kind="stable")
+                .drop(columns="_l").reset_index(drop=True))
+
+
+# Derived statistics (vectorized over any slice of the cube)
+
+def derive(cube):
+    n = cube["n"].to_numpy(dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = cube["sum"] / n
+        var = (cube["sumsq"] - cube["sum"] ** 2 / n) / (n - 1)
+        n_ci = cube["n_ci"].to_numpy(dtype=float)
+        out = cube.assign(mean=mean, sd=np.sqrt(var.clip(lower=0)), se=np.sqrt(var.clip(lower=0) / n),
+                          ci_low_mean=cube["ci_low_sum"] / n_ci, ci_high_mean=cube["ci_high_sum"] / n_ci,
+                          # SE of the mean from the sampling SEs of its members
+                          se_sampling=np.sqrt(cube["var_sum"]) / n_ci)
+    return out
+
+
+class Cube:
+    # In-memory view with a hash index on (level, geo, year, indicator).
+    # year=None cells (all years pooled) are summed once at construction.
+    def __init__(self, cells):
+        self.cells = cells.reset_index(drop=True)
+        pooled = (self.cells.groupby(["level", "geo", "indicator"], as_index=False, sort=False)[STATS].sum()
+                  .assign(year=-1))
+        self._all = pd.concat([self.cells, pooled[self.cells.columns]], ignore_index=True)
+        self._stats = self._all[STATS].to_numpy(dtype=float)
+        keys = zip(self._all["level"], self._all["geo"], self._all["year"].astype(int), self._all["indicator"])
+        self._index = {k: i for i, k in enumerate(keys)}
+
+    @classmethod
+    def from_panel(cls, panel):
+        return cls(build(panel))
+
+    def _row(self, level, geo, indicator, year=None):
+        i = self._index.get((level, geo, -1 if year is None else int(year), indicator))
+        return None if i is None else self._stats[i]
+
+    def n(self, level, geo, indicator, year=None):
+        r = self._row(level, geo, indicator, year)
+        return 0 if r is None else int(r[0])
+
+    def mean(self, level, geo, indicator, year=None):
+        r = self._row(level, geo, indicator, year)
+        return np.nan if r is None or r[0] == 0 else r[1] / r[0]
+
+    def se(self, level, geo, indicator, year=None):
+        r = self._row(level, geo, indicator, year)
+        if r is None or r[0] < 2:
+            return np.nan
+        n, s, ss = r[0], r[1], r[2]
+        return np.sqrt(max(ss - s * s / n, 0.0) / (n - 1) / n)
+
+    def contrast(self, a, b, indicator, year=None, level="region"):
+        # Difference of means a - b with a Welch-style SE
+        diff = self.mean(level, a, indicator, year) - self.mean(level, b, indicator, year)
+        return diff, np.hypot(self.se(level, a, indicator, year), self.se(level, b, indicator, year))
+
+    def table(self, level, indicator, pooled=False):
+        # Tidy (geo, year, n, mean, sd, se, ...) for reports, sorted by year then geo
+        src = self._all if pooled else self.cells
+        sel = src[(src["level"] == level) & (src["indicator"] == indicator)]
+        if pooled:
+            sel = sel[sel["year"] == -1]
+        return derive(sel).sort_values(["year", "geo"], kind="stable").reset_index(drop=True)
+
+
+# Persistence: data/processed/parquet/cube (year-partitioned), or
+# data/processed/cube.csv without pyarrow
+
+NAME = "cube"
+
+def location(processed: Path):
+    if store.available():
+        return processed / store.STORE_DIR / NAME
+    return processed / f"{NAME}.csv"
+
+def save(cube, processed: Path, root: Path, years=None):
+    # years: only rewrite those partitions (incremental update)
+    out = location(processed)
+    if not store.available():
+        cube.to_csv(out, index=False)
+    elif years is None or not store.has_dataset(out):
+        store.write_dataset(cube, out, store.load_dictionary(root))
+    else:
+        for y in years:
+            store.write_partition(cube[cube["year"] == y], out, store.load_dictionary(root), int(y))
+    return out
+
+def load(processed: Path, years=None):
+    out = location(processed)
+    if store.available():
+        filters = [("year", "in", [int(y) for y in years])] if years is not None else None
+        cells = store.read_dataset(out, filters=filters)
+    else:
+        cells = pd.read_csv(out)
+        if years is not None:
+            cells = cells[cells["year"].isin(years)]
+    return cells.astype({"year": int}).reset_index(drop=True)
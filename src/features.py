@@ -0,0 +1,152 @@
+import json
+import hashlib
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from instrument import stage
+from model_cache import ModelCache, frame_digest
+
+# Temporal features on the merged panel: per-unit lags, year-over-year deltas,
+# rolling means and rolling OLS slopes for any list of indicators.
+#
+# All indicators go into one dense (indicator, unit, year) array, so a lag is a
+# slice along the year axis and a rolling window is a difference of cumulative
+# sums; there is no groupby-apply and no loop over units. Gaps in a unit's
+# years stay NaN, so lag 1 is always the previous calendar year (not the
+# previous row), and rolling windows need every year present (pandas'
+# min_periods=window default).
+#
+# Results are cached in data/cache/features keyed on the spec plus the
+# contents of the key/indicator columns, so repeated model runs reuse them.
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache" / "features"
+
+DEFAULT_SPEC = {
+    "indicators": ["inactivity_prevalence", "obesity_prevalence", "smoking_prevalence"],
+    "lags": [1, 2],
+    "deltas": [1],
+    "rolling_mean": [3],
+    "rolling_slope": [3],
+}
+
+def normalize_spec(spec=None):
+    spec = dict(DEFAULT_SPEC, **(spec or {}))
+    return {k: sorted(set(v)) if k != "indicators" else list(dict.fromkeys(v)) for k, v in spec.items()}
+
+def feature_names(spec):
+    spec = normalize_spec(spec)
+    names = []
+    for c in spec["indicators"]:
+        names += [f"{c}_lag{k}" for k in spec["lags"]]
+        names += [f"{c}_delta{k}" for k in spec["deltas"]]
+        names += [f"{c}_mean{w}" for w in spec["rolling_mean"]]
+        names += [f"{c}_slope{w}" for w in spec["rolling_slope"]]
+    return names
+
+def _grid(df, unit, time):
+    codes, units = pd.factorize(df[unit], sort=True)
+    if (codes < 0).any():
+        raise ValueError(f"Rows without a {unit} cannot be placed on the grid.")
+    years = df[time].to_numpy(dtype=int)
+    y0 = years.min()
+    t_idx = years - y0
+    n_years = t_idx.max() + 1
+    if len(np.unique(codes * n_years + t_idx)) != len(df):
+        raise ValueError(f"Duplicate ({unit}, {time}) rows in the panel.")
+    return codes, t_idx, len(units), n_years
+
+def _shift(V, k):
+    out = np.full_like(V, np.nan)
+    if k < V.shape[-1]:
+        out[..., k:] = V[..., :-k]
+    return out
+
+def _window_sum(A, w):
+    # Trailing sums over the last w years; NaN where fewer than w years exist
+    c = np.cumsum(A, axis=-1)
+    out = np.full_like(c, np.nan)
+    if w <= c.shape[-1]:
+        out[..., w - 1] = c[..., w - 1]
+        out[..., w:] = c[..., w:] - c[..., :-w]
+    return out
+
+def build_features(panel, spec=None, unit="state_fips", time="year"):
+    # Returns the derived columns aligned to panel.index (row order untouched)
+    spec = normalize_spec(spec)
+    cols = [c for c in spec["indicators"] if c in panel.columns]
+    missing = set(spec["indicators"]) - set(cols)
+    if missing:
+        raise KeyError(f"Indicators not in the panel: {sorted(missing)}")
+    data = panel.dropna(subset=[unit, time])
+    codes, t_idx, n_units, n_years = _grid(data, unit, time)
+
+    V = np.full((len(cols), n_units, n_years), np.nan)
+    V[:, codes, t_idx] = data[cols].to_numpy(dtype=float).T
+    valid = ~np.isnan(V)
+    V0 = np.where(valid, V, 0.0)
+    t = np.arange(n_years, dtype=float)
+
+    out = {}
+    def emit(suffix, R):
+        for i, c in enumerate(cols):
+            out[f"{c}_{suffix}"] = R[i][codes, t_idx]
+
+    for k in spec["lags"]:
+        emit(f"lag{k}", _shift(V, k))
+    for k in spec["deltas"]:
+        emit(f"delta{k}", V - _shift(V, k))
+    for w in spec["rolling_mean"]:
+        n = _window_sum(valid.astype(float), w)
+        emit(f"mean{w}", np.where(n == w, _window_sum(V0, w) / w, np.nan))
+    for w in spec["rolling_slope"]:
+        # Slope of value on year over the window: (Σty - t̄Σy) / Σ(t - t̄)²,
+        # with t̄ = j - (w-1)/2 for the window ending at year j
+        n = _window_sum(valid.astype(float), w)
+        sy, sty = _window_sum(V0, w), _window_sum(V0 * t, w)
+        sxx = w * (w * w - 1) / 12.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = (sty - (t - (w - 1) / 2.0) * sy) / sxx
+        emit(f"slope{w}", np.where(n == w, slope, np.nan))
+
+    feats = pd.DataFrame(out, index=data.index)
+    return feats.reindex(index=panel.index, columns=[c for c in feature_names(spec) if c in out])
+
+def cached_features(panel, spec=None, unit="state_fips", time="year", cache=None):
+    spec = normalize_spec(spec)
+    used = [unit, time] + spec["indicators"]
+    key_spec = json.dumps({"spec": spec, "unit": unit, "time": time}, sort_keys=True)
+    key = hashlib.sha256((key_spec + frame_digest(panel[used])).encode()).hexdigest()[:32]
+    cache = cache or ModelCache(CACHE_DIR)
+    hit = cache.get(key)
+    if hit is not None:
+        return hit.set_axis(panel.index)
+    with stage("features", rows_in=len(panel)) as st:
+        feats = build_features(panel, spec, unit, time)
+        st.fields["features"] = feats.shape[1]
+    cache.put(key, key_spec, "features", feats)
+    return feats
+
+def add_features(panel, spec=None, unit="state_fips", time="year", cache=True):
+    feats = (cached_features if cache else build_features)(panel, spec, unit, time)
+    return pd.concat([panel, feats], axis=1)
+
+def parse_spec(args):
+    spec = {"indicators": args.indicators, "lags": args.lags, "deltas": args.deltas,
+            "rolling_mean": args.mean, "rolling_slope": args.slope}
+    return {k: v for k, v in spec.items() if v is not None}
+
+if __name__ == "__main__":
+    import preprocess
+    ap = argparse.ArgumentParser(description="Lags, deltas, rolling means/slopes on the panel -> data/processed/panel_features")
+    ap.add_argument("--indicators", nargs="+", default=None)
+    ap.add_argument("--lags", nargs="*", type=int, default=None)
+    ap.add_argument("--deltas", nargs="*", type=int, default=None)
+    ap.add_argument("--mean", nargs="*", type=int, default=None, help="rolling-mean windows (years)")
+    ap.add_argument("--slope", nargs="*", type=int, default=None, help="rolling-slope windows (years)")
+    ap.add_argument("--no-csv", dest="csv", action="store_false")
+    args = ap.parse_args()
+    panel = preprocess.read_table(preprocess.panel_path())
+    out = add_features(panel, parse_spec(args))
+    print(f"{out.shape[1] - panel.shape[1]} features on {len(out)} rows ->",
+          preprocess.write_table(out, "panel_features", args.csv))
@@ -0,0 +1,326 @@
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import preprocess
+from instrument import stage
+
+# Batch forecasts h years past the panel's last year for every unit (state,
+# or county: any unit column) and indicator at once, with prediction
+# intervals. Three methods:
+#
+#   linear      per-unit OLS trend value ~ a + b * year
+#   damped      per-unit damped-trend exponential smoothing, ETS(A,Ad,N);
+#               alpha/beta/phi picked per series from a small grid by
+#               in-sample one-step SSE
+#   regression  target ~ risk factors with unit fixed effects, pooled over
+#               all units, driven by the linear-trend forecasts of the factors
+#
+# The panel is laid out once as a dense (indicator, unit, year) array (gaps
+# are NaN), so every fit is a reduction along the year axis and the grid
+# search is one broadcast over (params, indicator, unit); there is no loop
+# over units. Intervals are analytic (t / normal, including the factor
+# forecast variance for `regression`) or a residual bootstrap, drawn in unit
+# chunks so county-sized panels fit in memory.
+
+TARGET = preprocess.TARGET
+RISK_FACTORS = ["inactivity_prevalence", "obesity_prevalence", "smoking_prevalence"]  # LinearReg.FEATURES
+METHODS = ["linear", "damped", "regression"]
+FORECAST = preprocess.ROOT / "reports" / "forecast.csv"
+
+ALPHAS = np.round(np.arange(0.1, 1.0, 0.1), 2)
+BETAS = np.array([0.01, 0.05, 0.1, 0.2, 0.3])
+PHIS = np.array([0.8, 0.85, 0.9, 0.95, 0.98])
+GRID_SERIES = 256          # series per block of the damped-trend grid search
+CHUNK_CELLS = 4_000_000   # bootstrap draws held at once (replicates x indicators x units x years)
+
+def panel_grid(panel, columns, unit="state", time="year"):
+    data = panel.dropna(subset=[unit, time])
+    codes, units = pd.factorize(data[unit], sort=True)
+    years = data[time].to_numpy(dtype=int)
+    y0 = years.min()
+    t_idx = years - y0
+    n_years = t_idx.max() + 1
+    if len(np.unique(codes * n_years + t_idx)) != len(data):
+        raise ValueError(f"Duplicate ({unit}, {time}) rows in the panel.")
+    V = np.full((len(columns), len(units), n_years), np.nan)
+    V[:, codes, t_idx] = data[columns].to_numpy(dtype=float, na_value=np.nan).T
+    return V, np.asarray(units), y0 + np.arange(n_years)
+
+
+# Linear trend: grouped sums along the year axis (as trends.unit_trends)
+
+def linear_fit(V, t):
+    ok = ~np.isnan(V)
+    y = np.where(ok, V, 0.0)
+    n = ok.sum(-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_bar = (ok * t).sum(-1) / n
+        y_bar = y.sum(-1) / n
+        sxx = (ok * t * t).sum(-1) - n * t_bar ** 2
+        sxy = (y * t).sum(-1) - n * t_bar * y_bar
+        syy = (y * y).sum(-1) - n * y_bar ** 2
+        slope = sxy / sxx
+        sigma2 = np.clip(syy - slope * sxy, 0, None) / (n - 2)
+    return {"n": n, "t_bar": t_bar, "y_bar": y_bar, "sxx": sxx, "slope": slope, "sigma2": sigma2}
+
+def linear_predict(fit, t0):
+    d = t0 - fit["t_bar"][..., None]
+    mean = fit["y_bar"][..., None] + fit["slope"][..., None] * d
+    with np.errstate(invalid="ignore", divide="ignore"):
+        se = np.sqrt(fit["sigma2"][..., None] * (1 + 1 / fit["n"][..., None] + d ** 2 / fit["sxx"][..., None]))
+    return mean, se
+
+def linear_fitted(fit, t):
+    return fit["y_bar"][..., None] + fit["slope"][..., None] * (t - fit["t_bar"][..., None])
+
+
+# Damped trend, error-correction form:
+#   yhat = l + phi b;  e = y - yhat;  l <- yhat + alpha e;  b <- phi b + beta e
+# Missing years contribute no error (the state is carried forward).
+
+def ets_grid():
+    a, b, p = np.meshgrid(ALPHAS, BETAS, PHIS, indexing="ij")
+    keep = b <= a
+    return a[keep], b[keep], p[keep]
+
+def ets_filter(V, level, trend, alpha, beta, phi, errors=False):
+    sse = np.zeros(np.broadcast(level, alpha).shape)
+    errs = np.full(sse.shape + V.shape[-1:], np.nan) if errors else None
+    for j in range(V.shape[-1]):
+        yhat = level + phi * trend
+        y = V[..., j]
+        ok = ~np.isnan(y)
+        e = np.where(ok, y - yhat, 0.0)
+        sse = sse + e * e
+        if errors:
+            errs[..., j] = np.where(ok, e, np.nan)
+        level = yhat + alpha * e
+        trend = phi * trend + beta * e
+    return level, trend, sse, errs
+
+def _grid_sse(Y, level, trend, alpha, beta, phi):
+    # ets_filter's SSE only, in place: Y (series, T), params (grid, 1)
+    shape = np.broadcast(level, alpha).shape
+    level, trend = np.broadcast_to(level, shape).copy(), np.broadcast_to(trend, shape).copy()
+    sse, e, tmp = np.zeros(shape), np.empty(shape), np.empty(shape)
+    for j in range(Y.shape[-1]):
+        y = Y[:, j]
+        np.multiply(phi, trend, out=trend)
+        np.add(level, trend, out=level)          # level now holds yhat
+        np.subtract(y, level, out=e)
+        miss = np.isnan(y)
+        if miss.any():
+            e[:, miss] = 0.0
+        np.multiply(e, e, out=tmp)
+        sse += tmp
+        np.multiply(alpha, e, out=tmp)
+        level += tmp
+        np.multiply(beta, e, out=tmp)
+        trend += tmp
+    return sse
+
+def damped_fit(V, t, lin):
+    # Start one year before the first grid year on the linear fit, then pick
+    # the grid point with the smallest one-step SSE per series. The search runs
+    # over blocks of series so the (grid, series) temporaries stay in cache.
+    trend0 = lin["slope"]
+    level0 = lin["y_bar"] + trend0 * (t[0] - 1 - lin["t_bar"])
+    a, b, p = (g[:, None] for g in ets_grid())
+    flat, l0, b0 = V.reshape(-1, V.shape[-1]), level0.ravel(), trend0.ravel()
+    best = np.empty(len(flat), dtype=np.int64)
+    for s in range(0, len(flat), GRID_SERIES):
+        sl = slice(s, s + GRID_SERIES)
+        best[sl] = np.argmin(_grid_sse(flat[sl], l0[sl], b0[sl], a, b, p), axis=0)
+    alpha, beta, phi = (g[:, 0][best].reshape(level0.shape) for g in (a, b, p))
+    level, trend, sse, errs = ets_filter(V, level0, trend0, alpha, beta, phi, errors=True)
+    n = (~np.isnan(V)).sum(-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma2 = np.where(n > 3, sse / (n - 3), np.nan)
+    return {"level": level, "trend": trend, "alpha": alpha, "beta": beta, "phi": phi,
+            "sigma2": sigma2, "errors": errs, "n": n}
+
+def damped_predict(fit, horizon):
+    h = np.arange(1, horizon + 1)
+    phi, alpha, beta = (fit[k][..., None] for k in ("phi", "alpha", "beta"))
+    mean = fit["level"][..., None] + np.cumsum(phi ** h, axis=-1) * fit["trend"][..., None]
+    # Var_h = sigma² (1 + Σ_{j<h} c_j²), c_j = alpha + beta phi (1 - phi^j) / (1 - phi)
+    c = alpha + beta * phi * (1 - phi ** h) / (1 - phi)
+    acc = np.concatenate([np.zeros(c.shape[:-1] + (1,)), np.cumsum(c[..., :-1] ** 2, axis=-1)], axis=-1)
+    with np.errstate(invalid="ignore"):
+        se = np.sqrt(fit["sigma2"][..., None] * (1 + acc))
+    return mean, se
+
+
+# Risk-factor regression with unit fixed effects (within estimator)
+
+def fe_fit(Y, X):
+    # Y (unit, year), X (factor, unit, year); rows need the target and every factor
+    ok = ~np.isnan(Y) & ~np.isnan(X).any(0)
+    n = ok.sum(-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_bar = np.where(ok, X, 0.0).sum(-1) / n
+        y_bar = np.where(ok, Y, 0.0).sum(-1) / n
+    Xc = np.where(ok, X - x_bar[..., None], 0.0)
+    Yc = np.where(ok, Y - y_bar[..., None], 0.0)
+    XtX = np.einsum("put,qut->pq", Xc, Xc)
+    beta = np.linalg.solve(XtX, np.einsum("put,ut->p", Xc, Yc))
+    resid = np.where(ok, Yc - np.einsum("p,put->ut", beta, Xc), np.nan)
+    dof = int(ok.sum() - (n > 0).sum() - len(beta))
+    sigma2 = np.nansum(resid ** 2) / dof
+    return {"beta": beta, "cov": sigma2 * np.linalg.inv(XtX), "sigma2": sigma2, "dof": dof,
+            "intercept": y_bar - beta @ x_bar, "x_bar": x_bar, "n": n, "resid": resid}
+
+def fe_predict(fit, x_mean, x_se):
+    # Parameter, residual and factor-forecast variance (factors independent)
+    beta = fit["beta"]
+    mean = fit["intercept"][:, None] + np.einsum("p,puh->uh", beta, x_mean)
+    d = x_mean - fit["x_bar"][..., None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (fit["sigma2"] * (1 + 1 / fit["n"])[:, None]
+               + np.einsum("puh,pq,quh->uh", d, fit["cov"], d)
+               + np.einsum("p,puh->uh", beta ** 2, x_se ** 2))
+    return mean, np.sqrt(var)
+
+
+# Residual bootstrap
+
+def _draws(R, n, reps, width, rng):
+    # R (..., T) residuals sorted NaN-last, n (...) observed counts:
+    # `width` draws per series and replicate, (reps, ..., width)
+    u = rng.random((reps,) + R.shape[:-1] + (width,))
+    idx = (u * n[..., None]).astype(np.int64)
+    return np.take_along_axis(np.broadcast_to(R, (reps,) + R.shape), idx, axis=-1)
+
+def _sorted_resid(r, n, dof_loss):
+    # Residuals rescaled for the fitted parameters, NaN last
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.sqrt(n / np.maximum(n - dof_loss, 1))
+    return np.sort(r * scale[..., None], axis=-1)
+
+def bootstrap_chunk(V, t, horizon, fits, methods, factor_i, n_boot, rng):
+    # Simulated forecasts (n_boot, ..., horizon) for one chunk of units
+    t0 = np.arange(1, horizon + 1, dtype=float)
+    out = {}
+    lin = fits["linear"]
+    if "linear" in methods or "regression" in methods:
+        R = _sorted_resid(V - linear_fitted(lin, t), lin["n"], 2)
+        y_star = np.where(np.isnan(V), np.nan, linear_fitted(lin, t) + _draws(R, lin["n"], n_boot, V.shape[-1], rng))
+        mean, _ = linear_predict(linear_fit(y_star, t), t0)
+        out["linear"] = mean + _draws(R, lin["n"], n_boot, horizon, rng)
+    if "damped" in methods:
+        d = fits["damped"]
+        R = _sorted_resid(d["errors"], d["n"], 3)
+        e = _draws(R, d["n"], n_boot, horizon, rng)
+        level, trend = np.broadcast_to(d["level"], e.shape[:-1]), np.broadcast_to(d["trend"], e.shape[:-1])
+        sims = np.empty(e.shape)
+        for j in range(horizon):
+            yhat = level + d["phi"] * trend
+            sims[..., j] = yhat + e[..., j]
+            level = yhat + d["alpha"] * e[..., j]
+            trend = d["phi"] * trend + d["beta"] * e[..., j]
+        out["damped"] = sims
+    if "regression" in methods and "regression" in fits:
+        fe = fits["regression"]
+        R = _sorted_resid(fe["resid"], fe["n"], 1 + len(fe["beta"]))
+        xs = out["linear"][:, factor_i]
+        out["regression"] = (fe["intercept"][:, None] + np.einsum("p,bpuh->buh", fe["beta"], xs)
+                             + _draws(R, fe["n"], n_boot, horizon, rng))
+    return out
+
+def forecast(panel, horizon=5, methods=METHODS, interval="analytic", level=0.95, unit="state",
+             time="year", indicators=None, target=TARGET, factors=RISK_FACTORS, n_boot=1000, seed=42):
+    # Tidy table: one row per (unit, indicator, method, horizon year)
+    indicators = list(indicators or [c for c in panel.columns if c.endswith("_prevalence")])
+    factors = [f for f in factors if f in indicators and f != target]
+    V, units, years = panel_grid(panel, indicators, unit, time)
+    t = (years - years[-1]).astype(float)        # last year at t=0, forecasts at t=1..h
+    t0 = np.arange(1, horizon + 1, dtype=float)
+    q = (1 - level) / 2
+
+    with stage("forecast", rows_in=len(panel), units=len(units), indicators=len(indicators),
+               horizon=horizon, interval=interval) as st:
+        fits, point = {"linear": linear_fit(V, t)}, {}
+        mean, se = linear_predict(fits["linear"], t0)
+        if "linear" in methods:
+            with np.errstate(invalid="ignore"):
+                crit = stats.t.ppf(1 - q, fits["linear"]["n"] - 2)[..., None]
+            point["linear"] = (mean, se, crit)
+        if "damped" in methods:
+            fits["damped"] = damped_fit(V, t, fits["linear"])
+            m, s = damped_predict(fits["damped"], horizon)
+            point["damped"] = (m, s, stats.norm.ppf(1 - q))
+        if "regression" in methods and target in indicators and factors:
+            ti, fi = indicators.index(target), [indicators.index(f) for f in factors]
+            fits["regression"] = fe = fe_fit(V[ti], V[fi])
+            m, s = fe_predict(fe, mean[fi], se[fi])
+            point["regression"] = (m[None], s[None], stats.t.ppf(1 - q, fe["dof"]))
+
+        bounds = {}
+        if interval == "bootstrap":
+            rng = np.random.default_rng(seed)
+            fi = [indicators.index(f) for f in factors]
+            chunk = max(1, CHUNK_CELLS // (n_boot * len(indicators) * len(years)))
+            parts = {m: [] for m in point}
+            for s0 in range(0, len(units), chunk):
+                sl = slice(s0, s0 + chunk)
+                sub = {"linear": {k: v[:, sl] for k, v in fits["linear"].items()}}
+                if "damped" in fits:
+                    sub["damped"] = {k: v[:, sl] for k, v in fits["damped"].items()}
+                if "regression" in fits:
+                    sub["regression"] = dict(fe, intercept=fe["intercept"][sl], x_bar=fe["x_bar"][:, sl],
+                                             n=fe["n"][sl], resid=fe["resid"][sl])
+                sims = bootstrap_chunk(V[:, sl], t, horizon, sub, list(point), fi, n_boot, rng)
+                for m in point:
+                    draws = sims[m] if m != "regression" else sims[m][:, None]
+                    with np.errstate(invalid="ignore"):
+                        parts[m].append(np.nanpercentile(draws, [100 * q, 100 * (1 - q)], axis=0))
+            bounds = {m: np.concatenate(p, axis=-2) for m, p in parts.items()}
+
+        rows = []
+        for m, (mean_m, se_m, crit) in point.items():
+            names = [target] if m == "regression" else indicators
+            lo, hi = bounds[m] if m in bounds else (mean_m - crit * se_m, mean_m + crit * se_m)
+            k, u = mean_m.shape[:2]
+            rows.append(pd.DataFrame({
+                unit: np.tile(np.repeat(units, horizon), k),
+                "indicator": np.repeat(names, u * horizon),
+                "method": m,
+                time: np.tile(years[-1] + t0.astype(int), k * u),
+                "horizon": np.tile(t0.astype(int), k * u),
+                "forecast": mean_m.ravel(), "se": se_m.ravel(),
+                "lower": lo.ravel(), "upper": hi.ravel(),
+            }))
+        out = pd.concat(rows, ignore_index=True)
+        out["interval"], out["level"] = interval, level
+        st.rows_out = len(out)
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Forecast every unit and indicator h years past the panel")
+    ap.add_argument("--horizon", type=int, default=5)
+    ap.add_argument("--methods", nargs="+", default=METHODS, choices=METHODS)
+    ap.add_argument("--interval", default="analytic", choices=["analytic", "bootstrap"])
+    ap.add_argument("--level", type=float, default=0.95)
+    ap.add_argument("--n-boot", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--unit", default="state", help="unit column (e.g. a county FIPS column)")
+    ap.add_argument("--indicators", nargs="*", default=None, help="default: every *_prevalence column")
+    ap.add_argument("--out", default=str(FORECAST))
+    args = ap.parse_args(argv)
+
+    panel = preprocess.read_table(preprocess.panel_path())
+    out = forecast(panel, args.horizon, args.methods, args.interval, args.level, args.unit,
+                   indicators=args.indicators, n_boot=args.n_boot, seed=args.seed)
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    out.to_csv(args.out, index=False)
+    last = out[(out["indicator"] == TARGET) & (out["horizon"] == args.horizon)]
+    print(f"{len(out)} forecast rows ({out[args.unit].nunique()} units, h={args.horizon}) -> {args.out}")
+    print(last.pivot_table(index=args.unit, columns="method", values="forecast")
+              .sort_values(last["method"].iloc[0], ascending=False).head(10).round(2).to_string())
+    return out
+
+if __name__ == "__main__":
+    main()
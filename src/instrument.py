@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# Per-stage instrumentation. Each `with stage(...)` block appends one JSON line
+# to reports/run_log.jsonl with wall time, CPU time, memory, rows in/out and
+# bytes read/written. All records of one run share a run_id (inherited by
+# process-pool workers through the environment). `python src/instrument.py`
+# summarizes the log, slowest stages first.
+#
+# Memory: ru_maxrss is the process's high-water mark since it started, so it
+# is logged as process_peak_rss_mb; peak_rss_growth_mb is how far the stage
+# raised that mark (0 when an earlier stage already peaked higher).
+#
+# DT_RUN_LOG=0 in the environment (or disable()) turns the log off, e.g. for
+# tests and benchmarks; workers inherit the setting.
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+THIS = Path(__file__).resolve()
+ROOT = THIS.parent
+for _ in range(5):  # walk up a few levels just in case
+    if (ROOT / "columns_config.yaml").exists() and (ROOT / "data").exists():
+        break
+    ROOT = ROOT.parent
+LOG = ROOT / "reports" / "run_log.jsonl"
+
+_local = threading.local()  # per-thread suppressed() depth
+
+def run_id():
+    if "DT_RUN_ID" not in os.environ:
+        os.environ["DT_RUN_ID"] = datetime.now().strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6]
+    return os.environ["DT_RUN_ID"]
+
+# Fix the id at import so pool workers started later inherit it
+run_id()
+
+def enabled():
+    return os.environ.get("DT_RUN_LOG", "1").strip().lower() not in ("0", "false", "no", "off")
+
+def disable():
+    os.environ["DT_RUN_LOG"] = "0"
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+class Stage:
+    def __init__(self, name, **fields):
+        self.name = name
+        self.rows_in = fields.pop("rows_in", None)
+        self.rows_out = fields.pop("rows_out", None)
+        self.bytes_read = fields.pop("bytes_read", None)
+        self.bytes_written = fields.pop("bytes_written", None)
+        self.fields = fields
+
+@contextmanager
+def stage(name, **fields):
+    rec = Stage(name, **fields)
+    w0, c0, m0 = time.perf_counter(), time.process_time(), peak_rss_mb()
+    try:
+        yield rec
+    finally:
+        if not getattr(_local, "suppress", 0) and enabled():
+            m1 = peak_rss_mb()
+            write({
+                "run_id": run_id(), "ts": datetime.now().isoformat(), "pid": os.getpid(),
+                "stage": rec.name, "wall_s": time.perf_counter() - w0,
+                "cpu_s": time.process_time() - c0, "process_peak_rss_mb": m1,
+                "peak_rss_growth_mb": None if m1 is None else m1 - m0,
+                "rows_in": rec.rows_in, "rows_out": rec.rows_out,
+                "bytes_read": rec.bytes_read, "bytes_written": rec.bytes_written,
+                **rec.fields,
+            })
+
+@contextmanager
+def suppressed():
+    # Nested stages inside this block are not logged (e.g. per-chunk steps
+    # of the streaming cleaner, which logs one record for the whole file).
+    # Per thread, so a suppressed block does not hide other threads' stages.
+    _local.suppress = getattr(_local, "suppress", 0) + 1
+    try:
+        yield
+    finally:
+        _local.suppress -= 1
+
+def write(record, log=None):
+    log = Path(log or LOG)
+    log.parent.mkdir(parents=True, exist_ok=True)
+    # One short append per record; O_APPEND keeps lines from pool workers intact
+    with open(log, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+def size_of(path):
+    path = Path(path)
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size if path.exists() else 0
+
+def summary(log=None, run=None, top=15):
+    import pandas as pd
+    log = Path(log or LOG)
+    if not log.exists():
+        print("No run log at", log)
+        return None
+    df = pd.read_json(log, lines=True)
+    # Records written before the memory fields were split only have peak_rss_mb
+    old = df.pop("peak_rss_mb") if "peak_rss_mb" in df.columns else None
+    for c in ("process_peak_rss_mb", "peak_rss_growth_mb"):
+        if c not in df.columns:
+            df[c] = float("nan")
+    if old is not None:
+        df["process_peak_rss_mb"] = df["process_peak_rss_mb"].fillna(old)
+    run = run or df["run_id"].iloc[-1]
+    if run != "all":
+        df = df[df["run_id"] == run]
+    out = (df.groupby("stage")
+             .agg(calls=("wall_s", "size"), wall_s=("wall_s", "sum"), cpu_s=("cpu_s", "sum"),
+                  process_peak_rss_mb=("process_peak_rss_mb", "max"),
+                  peak_rss_growth_mb=("peak_rss_growth_mb", "max"), rows_in=("rows_in", "sum"),
+                  rows_out=("rows_out", "sum"), bytes_read=("bytes_read", "sum"),
+                  bytes_written=("bytes_written", "sum"))
+             .sort_values("wall_s", ascending=False))
+    print(f"run: {run}")
+    print(out.head(top).to_string())
+    return out
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Summarize reports/run_log.jsonl")
+    ap.add_argument("--run", default=None, help="run_id to show (default: latest, 'all' for every run)")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--log", default=None)
+    a = ap.parse_args()
+    summary(a.log, a.run, a.top)
@@ -0,0 +1,70 @@
+import json
+import hashlib
+from pathlib import Path
+
+# Content-hash manifest shared by clean.py and preprocess.py.
+# Layout of <dir>/manifest.json:
+#   {"files": {<input path>: {"sha256", "size", "mtime_ns"}},
+#    "outputs": {<step name>: {"fingerprint": <sha256>, "outputs": [file names]}}}
+
+MANIFEST_NAME = "manifest.json"
+
+def load_manifest(folder: Path):
+    p = folder / MANIFEST_NAME
+    if not p.exists():
+        return {"files": {}, "outputs": {}}
+    try:
+        m = json.loads(p.read_text())
+    except ValueError:
+        return {"files": {}, "outputs": {}}
+    m.setdefault("files", {})
+    m.setdefault("outputs", {})
+    return m
+
+def save_manifest(folder: Path, manifest):
+    p = folder / MANIFEST_NAME
+    tmp = p.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    tmp.replace(p)
+
+def file_digest(path: Path, manifest=None):
+    # Reuse the stored hash when size and mtime are unchanged, so a no-op
+    # rerun only stats files instead of reading them
+    st = path.stat()
+    key = str(path)
+    files = manifest["files"] if manifest is not None else {}
+    prev = files.get(key)
+    if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+        return prev["sha256"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    if manifest is not None:
+        files[key] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return digest
+
+def path_digest(path: Path, manifest=None):
+    # Files hash directly; directories (Parquet datasets) hash their sorted file list
+    if path.is_dir():
+        files = sorted(f for f in path.rglob("*") if f.is_file())
+        return fingerprint([(str(f.relative_to(path)), file_digest(f, manifest)) for f in files])
+    return file_digest(path, manifest)
+
+def fingerprint(*parts):
+    # Stable hash over strings / JSON-able values (input digests, config, code version)
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+def is_fresh(manifest, step, fp, folder: Path):
+    entry = manifest["outputs"].get(step)
+    if not entry or entry.get("fingerprint") != fp:
+        return False
+    return all((folder / name).exists() for name in entry.get("outputs", []))
+
+def record(manifest, step, fp, outputs):
+    manifest["outputs"][step] = {"fingerprint": fp, "outputs": sorted(outputs)}
@@ -0,0 +1,122 @@
+import json
+import time
+import pickle
+import hashlib
+from pathlib import Path
+import pandas as pd
+from instrument import stage
+
+# On-disk cache of fitted statsmodels results for the growth models, keyed on
+# (model kind, formula, fit options, panel contents). A hit unpickles the
+# stored results and skips fitting. When only the panel changed, MixedLM is
+# warm-started from the most recent fit of the same formula and options.
+# Entries are evicted least-recently-used once the cache exceeds max_bytes.
+#
+# <cache_dir>/index.json: {key: {"kind", "spec", "file", "bytes", "used"}}
+# <cache_dir>/<key>.pkl : {"params", "cov", "summary", "start", "results"}
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache" / "models"
+MAX_BYTES = 256 * 1024 ** 2
+
+def frame_digest(df):
+    h = hashlib.sha256()
+    h.update(json.dumps([str(c) for c in df.columns]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _spec(kind, formula, options, extra=None):
+    return json.dumps({"kind": kind, "formula": formula, "options": options,
+                       "extra": extra}, sort_keys=True, default=str)
+
+class ModelCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.dir / "index.json"
+        try:
+            self.index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _save_index(self):
+        tmp = self.index_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.index, indent=1, sort_keys=True))
+        tmp.replace(self.index_path)
+
+    def get(self, key):
+        entry = self.index.get(key)
+        if entry is None or not (self.dir / entry["file"]).exists():
+            return None
+        with open(self.dir / entry["file"], "rb") as f:
+            item = pickle.load(f)
+        entry["used"] = time.time()
+        self._save_index()
+        return item
+
+    def latest(self, spec):
+        # Most recently used entry with the same model spec (any panel)
+        hits = [(e["used"], k) for k, e in self.index.items() if e["spec"] == spec]
+        return self.get(max(hits)[1]) if hits else None
+
+    def put(self, key, spec, kind, item):
+        path = self.dir / f"{key}.pkl"
+        with open(path, "wb") as f:
+            pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.index[key] = {"kind": kind, "spec": spec, "file": path.name,
+                           "bytes": path.stat().st_size, "used": time.time()}
+        self.evict()
+        self._save_index()
+
+    def evict(self):
+        total = sum(e["bytes"] for e in self.index.values())
+        for key, entry in sorted(self.index.items(), key=lambda kv: kv[1]["used"]):
+            if total <= self.max_bytes or len(self.index) <= 1:
+                break
+            (self.dir / entry["file"]).unlink(missing_ok=True)
+            total -= entry["bytes"]
+            del self.index[key]
+
+def _item(res, start=None):
+    return {"params": res.params, "cov": res.cov_params(),
+            "summary": res.summary().as_text(), "start": start, "results": res}
+
+def fit_ols(formula, data, cache=None, **fit_kwargs):
+    import statsmodels.formula.api as smf
+    cache = cache or ModelCache()
+    spec = _spec("ols", formula, fit_kwargs)
+    key = hashlib.sha256((spec + frame_digest(data)).encode()).hexdigest()[:32]
+    hit = cache.get(key)
+    if hit is not None:
+        return hit["results"]
+    with stage("model_fit", model="ols", formula=formula, rows_in=len(data)):
+        res = smf.ols(formula=formula, data=data).fit(**fit_kwargs)
+    cache.put(key, spec, "ols", _item(res))
+    return res
+
+def fit_mixedlm(formula, data, groups, cache=None, **fit_kwargs):
+    import statsmodels.formula.api as smf
+    cache = cache or ModelCache()
+    spec = _spec("mixedlm", formula, fit_kwargs, extra=groups)
+    key = hashlib.sha256((spec + frame_digest(data)).encode()).hexdigest()[:32]
+    hit = cache.get(key)
+    if hit is not None:
+        return hit["results"]
+
+    # groups by column name + missing="drop" so rows with a missing target
+    # (states without a diabetes estimate) don't make patsy reject the design
+    model = smf.mixedlm(formula, data, groups=groups, missing="drop")
+    prev = cache.latest(spec)
+    res = None
+    with stage("model_fit", model="mixedlm", formula=formula, rows_in=len(data)) as st:
+        if prev is not None and prev.get("start") is not None:
+            # Warm start from the last fit of the same model on an earlier panel
+            try:
+                res = model.fit(start_params=prev["start"], **fit_kwargs)
+                st.fields["warm_start"] = True
+            except Exception:
+                res = None
+        if res is None:
+            res = model.fit(**fit_kwargs)
+    cache.put(key, spec, "mixedlm", _item(res, start=res.params_object))
+    return res
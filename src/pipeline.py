@@ -0,0 +1,162 @@
+import argparse
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+import pandas as pd
+
+import clean
+import preprocess
+from instrument import stage
+
+# One entry point for raw -> panel -> splits -> models, run as a dependency
+# graph. Stage outputs are handed to downstream stages in memory; files are
+# only written for the stages named in `persist`. Ready stages run
+# concurrently: per-file cleaning on a process pool (CPU-bound parsing), the
+# rest on threads (no pickling of the panel).
+#
+#   clean:<file> ... ─┬─> merge ─┬─> [features] ─> split ──> fit_linear
+#                     │          └─> fit_growth
+
+class Node:
+    def __init__(self, name, fn, deps=(), process=False):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.process = process
+
+def _timed(name, fn, *args):
+    with stage(f"node:{name}"):
+        return fn(*args)
+
+def run_graph(nodes, workers=4):
+    names = {n.name for n in nodes}
+    for n in nodes:
+        missing = [d for d in n.deps if d not in names]
+        if missing:
+            raise ValueError(f"{n.name} depends on unknown stage(s) {missing}")
+
+    results, pending, running = {}, {n.name: n for n in nodes}, {}
+    procs = ProcessPoolExecutor(max_workers=workers) if any(n.process for n in nodes) else None
+    with ThreadPoolExecutor(max_workers=workers) as threads:
+        try:
+            while pending or running:
+                for name, node in list(pending.items()):
+                    if all(d in results for d in node.deps):
+                        pool = procs if node.process else threads
+                        args = [results[d] for d in node.deps]
+                        running[pool.submit(_timed, name, node.fn, *args)] = name
+                        del pending[name]
+                if not running:
+                    raise RuntimeError(f"Dependency cycle among {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    results[running.pop(fut)] = fut.result()
+        finally:
+            if procs is not None:
+                procs.shutdown()
+    return results
+
+
+# Stage functions
+
+def clean_node(path, cfg, persist=False, csv=True):
+    df = clean.clean_one_file(path, cfg)
+    if persist:
+        clean.write_interim(path, df, csv)
+    return df
+
+def merge_node(*dfs, compact=False, persist=False, csv=True):
+    panel = preprocess.panel_from_frames(list(dfs), compact)
+    if persist:
+        preprocess.write_table(panel, "diabetes_panel", csv)
+    return panel
+
+def features_node(panel, spec=None):
+    from features import add_features
+    return add_features(panel, spec)
+
+def split_node(panel, persist=False, csv=True):
+    train, val, test = preprocess.time_splits(panel, preprocess.TARGET)
+    if persist:
+        preprocess.write_splits(panel, csv)
+    return {"train": train, "val": val, "test": test}
+
+def fit_linear_node(splits, extra=()):
+    from LinearReg import fit_linear, FEATURES, TARGET
+    from backtest import rolling_origin
+    cols = FEATURES + list(extra)
+    # Lagged/rolling features are NaN in each state's first years
+    train, test = (splits[k].dropna(subset=cols + [TARGET]) for k in ("train", "test"))
+    model, metrics = fit_linear(train[cols], train[[TARGET]], test[cols], test[[TARGET]])
+    backtest = rolling_origin(train, cols, TARGET, year_col="year")
+    return {"model": model, "metrics": metrics, "backtest": backtest}
+
+def fit_growth_node(panel, mixedlm=False):
+    from regions import assign_regions
+    from model_cache import fit_ols, fit_mixedlm
+    from trends import unit_trends
+    df = panel.dropna(subset=["diabetes_prevalence"]).copy()
+    df["state_abbr"] = df["state"].astype(str).str.strip()
+    df["region"] = pd.Categorical(assign_regions(df["state_abbr"]).to_numpy())
+    df["year_c"] = df["year"] - df["year"].mean()
+    formula = "diabetes_prevalence ~ year_c * C(region)"
+    out = {"ols": fit_ols(formula, df, cov_type="HC3"),
+           "state_trends": unit_trends(df, group="state_abbr")}
+    if mixedlm:
+        out["mixedlm"] = fit_mixedlm(formula, df, "state_abbr", reml=False)
+    return out
+
+def build_graph(raw_paths, cfg, persist=(), csv=True, compact=False, mixedlm=False, models=True,
+                feature_spec=None):
+    nodes = [Node(f"clean:{p.name}", partial(clean_node, p, cfg, "clean" in persist, csv), process=True)
+             for p in raw_paths]
+    nodes.append(Node("merge", partial(merge_node, compact=compact, persist="merge" in persist, csv=csv),
+                      deps=[n.name for n in nodes]))
+    extra, split_from = [], "merge"
+    if feature_spec is not None:
+        from features import feature_names
+        nodes.append(Node("features", partial(features_node, spec=feature_spec), deps=["merge"]))
+        extra, split_from = feature_names(feature_spec), "features"
+    nodes.append(Node("split", partial(split_node, persist="split" in persist, csv=csv), deps=[split_from]))
+    if models:
+        nodes.append(Node("fit_linear", partial(fit_linear_node, extra=extra), deps=["split"]))
+        nodes.append(Node("fit_growth", partial(fit_growth_node, mixedlm=mixedlm), deps=["merge"]))
+    return nodes
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run clean -> preprocess -> models as one in-memory DAG")
+    ap.add_argument("--raw", default=str(clean.RAW), help="folder of raw CDC CSVs")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--persist", nargs="*", default=[], choices=["clean", "merge", "split"],
+                    help="stages whose outputs are also written to data/interim or data/processed")
+    ap.add_argument("--no-csv", dest="csv", action="store_false", help="persist Parquet only")
+    ap.add_argument("--compact", action="store_true")
+    ap.add_argument("--mixedlm", action="store_true", help="also fit the MixedLM growth model")
+    ap.add_argument("--no-models", dest="models", action="store_false")
+    ap.add_argument("--features", action="store_true",
+                    help="add lag/delta/rolling features (features.DEFAULT_SPEC) before the split and fit on them")
+    args = ap.parse_args(argv)
+
+    cfg = clean.load_config()
+    if args.compact:
+        cfg["compact_dtypes"] = True
+    raw_paths = sorted(Path(args.raw).glob("*.[cC][sS][vV]"))
+    if not raw_paths:
+        raise SystemExit(f"No CSVs found in {args.raw}")
+
+    nodes = build_graph(raw_paths, cfg, set(args.persist), args.csv, args.compact, args.mixedlm, args.models,
+                        feature_spec={} if args.features else None)
+    results = run_graph(nodes, workers=args.workers)
+
+    panel = results["merge"]
+    print(f"panel: {len(panel)} rows x {panel.shape[1]} cols")
+    if args.models:
+        m = results["fit_linear"]["metrics"]
+        print(f"linear (test year): R2={m['r2']:.3f}  MSE={m['mse']:.3f}  MAE={m['mae']:.3f}")
+        print(f"backtest mean R2: {results['fit_linear']['backtest']['r2'].mean():.3f}")
+        ols = results["fit_growth"]["ols"]
+        print(f"growth OLS: R2={ols.rsquared:.3f}  n={int(ols.nobs)}")
+    return results
+
+if __name__ == "__main__":
+    main()
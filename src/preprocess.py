@@ -1,6 +1,13 @@
 from pathlib import Path
 from functools import reduce
+import argparse
 import pandas as pd
+import store
+import arrays
+import cube
+from instrument import stage, size_of
+from clean import compact_dtypes, load_config
+from manifest import load_manifest, save_manifest, file_digest, path_digest, fingerprint, is_fresh, record
 
 KEYS = ["state_fips","state","year"]
 
@@ -36,18 +43,37 @@ for _ in range(4):  # walk up a few levels just in case
     ROOT = ROOT.parent
 INTERIM = ROOT / "data" / "interim"
 PROCESSED = ROOT / "data" / "processed"
-PROCESSED.mkdir(parents=True, exist_ok=True)
+INTERIM_STORE = INTERIM / store.STORE_DIR
+STORE = PROCESSED / store.STORE_DIR
 
 TARGET = "diabetes_prevalence"
 
-def load_interim():
-    paths = sorted(INTERIM.glob("*_clean.csv"))  # CSVs written by clean.py
+def interim_paths():
+    # Prefer the Parquet datasets written by clean.py; fall back to its CSVs
+    paths = []
+    if store.available() and INTERIM_STORE.is_dir():
+        paths = sorted(p for p in INTERIM_STORE.iterdir() if store.has_dataset(p))
+    if not paths:
+        paths = sorted(INTERIM.glob("*_clean.csv"))
     if not paths:
         raise RuntimeError("No interim CSVs found. Run clean.py first.")
-    return [pd.read_csv(p) for p in paths]
+    return paths
 
+def read_table(path, columns=None, filters=None):
+    # One reader for both formats; filters only apply to Parquet datasets
+    if path.is_dir():
+        return store.read_dataset(path, columns=columns, filters=filters)
+    return pd.read_csv(path, usecols=columns)
 
-def outer_join_on_keys(dfs):
+def load_interim(paths=None):
+    paths = paths or interim_paths()
+    with stage("read", files=len(paths), bytes_read=sum(size_of(p) for p in paths)) as st:
+        dfs = [read_table(p) for p in paths]
+        st.rows_out = sum(len(d) for d in dfs)
+    return dfs
+
+
+def _merge_pairwise(dfs):
     def _merge(l, r):
         keys = [k for k in KEYS if k in l.columns and k in r.columns]
         if not keys:
@@ -60,9 +86,33 @@ def outer_join_on_keys(dfs):
 
         return pd.merge(l, r, on=keys, how="outer")
 
-    from functools import reduce
     return reduce(_merge, dfs)
 
+def outer_join_on_keys(dfs):
+    # Single pass: index every source once on the shared keys and align them
+    # all with one concat instead of k-1 growing pairwise merges. Falls back to
+    # the pairwise merge when sources carry different key columns or a source
+    # has duplicate keys (merge would fan those out; concat cannot).
+    dfs = list(dfs)
+    key_sets = {tuple(k for k in KEYS if k in d.columns) for d in dfs}
+    keys = list(next(iter(key_sets))) if len(key_sets) == 1 else []
+    if len(dfs) < 2 or not keys or any(d.duplicated(keys).any() for d in dfs):
+        return _merge_pairwise(dfs)
+
+    # Same overlap rule as the pairwise merge: first source to bring a column wins
+    seen = set(dfs[0].columns)
+    order = list(dfs[0].columns)
+    parts = [dfs[0].set_index(keys)]
+    for d in dfs[1:]:
+        overlap = (seen & set(d.columns)) - set(keys)
+        d = d.drop(columns=list(overlap)) if overlap else d
+        order += [c for c in d.columns if c not in seen]
+        seen |= set(d.columns)
+        parts.append(d.set_index(keys))
+
+    joined = pd.concat(parts, axis=1, join="outer").sort_index()
+    return joined.reset_index()[order]
+
 def infer_year_bounds(panel):
     yrs = panel["year"].dropna().astype(int)
     return yrs.min(), yrs.max()
@@ -77,22 +127,163 @@ def time_splits(panel, target=TARGET):
     test  = keep[keep["year"] == test_year]
     return train, val, test
 
-def main():
-    dfs = load_interim()
-    panel = outer_join_on_keys(dfs)
-    if "state_fips" in panel.columns:
-        panel = panel[panel["state_fips"].notna()]
-    panel = panel.sort_values(["year","state_fips"], ignore_index=True)
-    panel.to_csv(PROCESSED / "diabetes_panel.csv", index=False)
+def source_label(df):
+    # Indicator label of an interim source, from its value column (obesity_prevalence -> obesity)
+    values = [c for c in df.columns if c.endswith("_prevalence")]
+    return values[0][: -len("_prevalence")] if values else None
+
+def build_panel(paths, compact=False):
+    return panel_from_frames(load_interim(paths), compact)
+
+def panel_from_frames(dfs, compact=False):
+    # Every source's ci_low/ci_high become <label>_ci_low/_ci_high, so the
+    # panel carries each indicator's CI instead of only the first source's
+    dfs = [prepare_df(d, source_label(d)) if source_label(d) else d for d in dfs]
+    if compact:
+        dfs = [compact_dtypes(d) for d in dfs]
+    with stage("merge", rows_in=sum(len(d) for d in dfs), sources=len(dfs)) as st:
+        panel = outer_join_on_keys(dfs)
+        if "state_fips" in panel.columns:
+            panel = panel[panel["state_fips"].notna()]
+        st.rows_out = len(panel)
+    if compact:
+        # Outer-join gaps come back as NaN; re-narrow the merged columns
+        panel = compact_dtypes(panel)
+    return panel.sort_values(["year","state_fips"], ignore_index=True)
+
+def write_table(df, name, csv=True):
+    PROCESSED.mkdir(parents=True, exist_ok=True)
+    outputs = []
+    with stage("write", table=name, rows_in=len(df)) as st:
+        if store.available():
+            store.write_dataset(df, STORE / name, store.load_dictionary(ROOT))
+            outputs.append(f"{store.STORE_DIR}/{name}")
+        if csv or not store.available():
+            df.to_csv(PROCESSED / f"{name}.csv", index=False)
+            outputs.append(f"{name}.csv")
+        st.bytes_written = sum(size_of(PROCESSED / o) for o in outputs)
+    return outputs
+
+def panel_path():
+    if store.has_dataset(STORE / "diabetes_panel"):
+        return STORE / "diabetes_panel"
+    return PROCESSED / "diabetes_panel.csv"
 
-    if TARGET in panel.columns:
+def write_split_arrays(df, name, dtype):
+    # Numeric X columns in panel order; the string state code is dropped (state_fips is in keys.npy)
+    keys = [k for k in ["state_fips", "year"] if k in df.columns]
+    columns = arrays.numeric_columns(df, exclude=keys + [TARGET])
+    folder = PROCESSED / arrays.ARRAY_DIR / name
+    with stage("write", table=f"{arrays.ARRAY_DIR}/{name}", rows_in=len(df)) as st:
+        arrays.write_split(df, folder, columns, TARGET, keys, dtype)
+        st.bytes_written = size_of(folder)
+    return [f"{arrays.ARRAY_DIR}/{name}"]
+
+def write_splits(panel, csv=True, npy=None):
+    # npy: None, or the dtype ("float32"/"float64") of the memory-mappable export
+    with stage("split", rows_in=len(panel)) as st:
         train, val, test = time_splits(panel, TARGET)
-        for name, df in [("train", train), ("val", val), ("test", test)]:
-            df.dropna(subset=["year"], inplace=True)
-            X = df.drop(columns=[TARGET], errors="ignore")
-            y = df[[TARGET]]
-            X.to_csv(PROCESSED / f"X_{name}.csv", index=False)
-            y.to_csv(PROCESSED / f"y_{name}.csv", index=False)
+        st.rows_out = len(train) + len(val) + len(test)
+    outputs = []
+    for name, df in [("train", train), ("val", val), ("test", test)]:
+        df.dropna(subset=["year"], inplace=True)
+        X = df.drop(columns=[TARGET], errors="ignore")
+        y = df[[TARGET]]
+        outputs += write_table(X, f"X_{name}", csv)
+        with stage("write", table=f"y_{name}", rows_in=len(y)) as st:
+            y_out = []
+            if store.available():
+                # y keeps the keys in Parquet so it stays year-partitioned and joinable
+                keys = [k for k in KEYS if k in df.columns]
+                store.write_dataset(df[keys + [TARGET]], STORE / f"y_{name}", store.load_dictionary(ROOT))
+                y_out.append(f"{store.STORE_DIR}/y_{name}")
+            if csv or not store.available():
+                y.to_csv(PROCESSED / f"y_{name}.csv", index=False)
+                y_out.append(f"y_{name}.csv")
+            st.bytes_written = sum(size_of(PROCESSED / o) for o in y_out)
+        outputs += y_out
+        if npy:
+            outputs += write_split_arrays(df, name, npy)
+        else:
+            # An export from an earlier --npy run would no longer match these
+            # splits, and LinearReg.load_xy prefers it when present
+            arrays.remove_split(PROCESSED / arrays.ARRAY_DIR / name)
+    return outputs
+
+def code_digest(manifest=None):
+    # This file plus the modules whose code shapes the panel, splits and cube
+    deps = [THIS] + [THIS.with_name(f) for f in ("clean.py", "store.py", "arrays.py", "cube.py")]
+    return fingerprint([(p.name, file_digest(p, manifest)) for p in deps])
+
+def panel_fingerprint(paths, manifest, code, csv, compact):
+    return fingerprint([(p.name, path_digest(p, manifest)) for p in paths], KEYS, code, csv, compact)
+
+def split_fingerprint(manifest, code, csv, npy=None):
+    return fingerprint(path_digest(panel_path(), manifest), TARGET, code, csv, npy)
+
+def cube_fingerprint(manifest, code):
+    return fingerprint(path_digest(panel_path(), manifest), code)
+
+def cube_fresh():
+    # True when the persisted cube matches the current panel and code, so
+    # readers can cube.load() it instead of rebuilding from the panel
+    manifest = load_manifest(PROCESSED)
+    return is_fresh(manifest, "cube", cube_fingerprint(manifest, code_digest(manifest)), PROCESSED)
+
+def write_cube(panel):
+    with stage("write", table=cube.NAME, rows_in=len(panel)) as st:
+        out = cube.save(cube.build(panel), PROCESSED, ROOT)
+        st.bytes_written = size_of(out)
+    return [str(out.relative_to(PROCESSED))]
+
+def main(force=False, csv=True, compact=None, npy=None):
+    # Each step is keyed on the content hashes of its inputs plus the source
+    # of this file and its dependencies (code_digest), so unchanged interim
+    # files skip the merge and an unchanged panel skips the splits.
+    PROCESSED.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(PROCESSED)
+    code = code_digest(manifest)
+    paths = interim_paths()
+    if compact is None:
+        compact = bool(load_config().get("compact_dtypes"))
+
+    panel = None
+    panel_fp = panel_fingerprint(paths, manifest, code, csv, compact)
+    if force or not is_fresh(manifest, "panel", panel_fp, PROCESSED):
+        panel = build_panel(paths, compact)
+        record(manifest, "panel", panel_fp, write_table(panel, "diabetes_panel", csv))
+    else:
+        print("panel unchanged, skipping merge")
+
+    split_fp = split_fingerprint(manifest, code, csv, npy)
+    if force or not is_fresh(manifest, "splits", split_fp, PROCESSED):
+        if panel is None:
+            panel = read_table(panel_path())
+        if TARGET in panel.columns:
+            record(manifest, "splits", split_fp, write_splits(panel, csv, npy))
+    else:
+        print("splits unchanged, skipping")
+
+    cube_fp = cube_fingerprint(manifest, code)
+    if force or not is_fresh(manifest, "cube", cube_fp, PROCESSED):
+        if panel is None:
+            panel = read_table(panel_path())
+        record(manifest, "cube", cube_fp, write_cube(panel))
+    else:
+        print("cube unchanged, skipping")
+    save_manifest(PROCESSED, manifest)
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Merge interim files into the panel and X/y splits")
+    ap.add_argument("--force", action="store_true", help="rebuild every output")
+    ap.add_argument("--no-csv", dest="csv", action="store_false",
+                    help="only write the Parquet store, skip the CSV copies")
+    ap.add_argument("--compact", action="store_true", default=None,
+                    help="categorical state, int8 fips (int32 for county keys), int16 year, float32 rates")
+    ap.add_argument("--npy", nargs="?", const="float64", default=None, choices=["float32", "float64"],
+                    help="also export memory-mappable .npy splits to data/processed/npy (default float64)")
+    return ap.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(force=args.force, csv=args.csv, compact=args.compact, npy=args.npy)
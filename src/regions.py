@@ -0,0 +1,14 @@
+import pandas as pd
+
+# Census regions by USPS code (same sets as diabetes_region_growth_model.py)
+REGIONS = {
+    "South": {'AL','AR','DE','DC','FL','GA','KY','LA','MD','MS','NC','OK','SC','TN','TX','VA','WV'},
+    "Northeast": {'CT','ME','MA','NH','NJ','NY','PA','RI','VT'},
+    "Midwest": {'IL','IN','IA','KS','MI','MN','MO','NE','ND','OH','SD','WI'},
+    "West": {'AK','AZ','CA','CO','HI','ID','MT','NV','NM','OR','UT','WA','WY'},
+}
+STATE_TO_REGION = {st: region for region, states in REGIONS.items() for st in states}
+
+def assign_regions(states):
+    # Vectorized: one dict map over the whole column, 'Other' for anything unknown
+    return pd.Series(states).astype(str).str.strip().str.upper().map(STATE_TO_REGION).fillna("Other")
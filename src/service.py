@@ -0,0 +1,221 @@
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+import preprocess
+from instrument import stage
+
+# In-process query service over the processed panel. The panel is read once
+# and kept sorted by (state_fips, year), so "indicator X for states S over
+# years Y1-Y2" is one searchsorted range per state on the int64 key
+# state_fips * 10000 + year. A second permutation sorted by year answers
+# all-state slices the same way. Results are kept in an LRU keyed on the
+# normalized query; the panel files are stat()ed (at most every CHECK_SECONDS)
+# and a change in their (mtime, size) reloads the panel and empties the cache. Cached
+# frames are shared between callers: treat them as read-only.
+#
+# Locking: one thread at a time reloads (_load_lock), building the new index
+# outside the cache lock and swapping it in under it. The cache lock only
+# guards the LRU and the counters, so uncached queries run concurrently.
+# Unknown indicator names raise ValueError (HTTP 400).
+#
+#   svc = PanelService()
+#   svc.query(["obesity_prevalence"], states=["GA", "TX"], years=(2015, 2020))
+#
+# serve() exposes the same call over HTTP for the dashboards:
+#
+#   GET /query?indicators=obesity_prevalence&states=GA,TX&years=2015-2020
+#   GET /meta     columns, states, years, cache counters
+
+CACHE_SIZE = 256
+CHECK_SECONDS = 1.0
+KEYS = ["state_fips", "state", "year"]
+YEAR_SPAN = 10_000
+
+def panel_files():
+    path = preprocess.panel_path()
+    return sorted(path.rglob("*.parquet")) if path.is_dir() else [path]
+
+def signature(files):
+    # Cheap change check: (name, mtime_ns, size) of every panel file
+    out = []
+    for p in files:
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        out.append((str(p), st.st_mtime_ns, st.st_size))
+    return tuple(out)
+
+class PanelIndex:
+    def __init__(self, panel):
+        panel = panel.dropna(subset=["state_fips", "year"])
+        fips = panel["state_fips"].to_numpy(dtype=np.int64)
+        year = panel["year"].to_numpy(dtype=np.int64)
+        order = np.lexsort((year, fips))
+        self.frame = panel.iloc[order].reset_index(drop=True)
+        self.code = fips[order] * YEAR_SPAN + year[order]
+        # Year index: positions into self.frame, sorted by year
+        self.by_year = np.argsort(year[order], kind="stable")
+        self.years = year[order][self.by_year]
+        states = self.frame["state"].astype(str).str.strip().str.upper().to_numpy()
+        self.fips_of = dict(zip(states, fips[order]))
+
+    def _fips(self, states):
+        out = []
+        for s in states:
+            s = str(s).strip().upper()
+            out.append(int(s) if s.isdigit() else self.fips_of.get(s, -1))
+        return sorted(set(out))
+
+    def rows(self, states=None, years=None):
+        lo, hi = years if years is not None else (0, YEAR_SPAN - 1)
+        lo, hi = max(int(lo), 0), min(int(hi), YEAR_SPAN - 1)
+        if states is None:
+            a, b = np.searchsorted(self.years, [lo, hi + 1])
+            return np.sort(self.by_year[a:b])
+        bounds = [(f * YEAR_SPAN + lo, f * YEAR_SPAN + hi + 1) for f in self._fips(states)]
+        ranges = [np.arange(*np.searchsorted(self.code, b)) for b in bounds]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=int)
+
+    def query(self, indicators=None, states=None, years=None):
+        columns = list(self.frame.columns)
+        if indicators:
+            unknown = [c for c in indicators if c not in self.frame.columns]
+            if unknown:
+                raise ValueError(f"unknown indicators: {', '.join(unknown)}")
+            columns = [k for k in KEYS if k in self.frame.columns] + [c for c in indicators if c not in KEYS]
+        return self.frame.iloc[self.rows(states, years)][columns].reset_index(drop=True)
+
+class PanelService:
+    def __init__(self, cache_size=CACHE_SIZE, check_seconds=CHECK_SECONDS):
+        self.cache_size = cache_size
+        self.check_seconds = check_seconds
+        self._checked = -float("inf")
+        self.cache = OrderedDict()
+        self.hits = self.misses = self.loads = 0
+        self.index = None
+        self._sig = None
+        self._lock = threading.Lock()        # cache, counters, index swap
+        self._load_lock = threading.Lock()   # one reload at a time
+
+    def _fresh(self):
+        # Reload when the panel files changed since the last load
+        index = self.index
+        if index is not None and time.monotonic() - self._checked < self.check_seconds:
+            return index
+        with self._load_lock:
+            if self.index is not None and time.monotonic() - self._checked < self.check_seconds:
+                return self.index
+            sig = signature(panel_files())
+            if sig != self._sig or self.index is None:
+                with stage("service_load", files=len(sig)) as st:
+                    index = PanelIndex(preprocess.read_table(preprocess.panel_path()))
+                    st.rows_out = len(index.frame)
+                with self._lock:
+                    self.index, self._sig = index, sig
+                    self.cache.clear()
+                    self.loads += 1
+            self._checked = time.monotonic()
+            return self.index
+
+    def query(self, indicators=None, states=None, years=None):
+        key = (tuple(indicators) if indicators else None,
+               tuple(sorted(str(s).strip().upper() for s in states)) if states is not None else None,
+               tuple(int(y) for y in years) if years is not None else None)
+        index = self._fresh()
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+            self.misses += 1
+        out = index.query(*key)
+        with self._lock:
+            # A reload in the meantime emptied the cache; don't refill it from the old index
+            if self.index is index:
+                self.cache[key] = out
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return out
+
+    def meta(self):
+        index = self._fresh()
+        with self._lock:
+            return {"rows": len(index.frame), "columns": list(index.frame.columns),
+                    "states": sorted(index.fips_of), "years": [int(index.years[0]), int(index.years[-1])],
+                    "cache": {"entries": len(self.cache), "hits": self.hits,
+                              "misses": self.misses, "loads": self.loads}}
+
+
+# HTTP front end (stdlib only, one shared PanelService)
+
+def _split(values):
+    out = [v for s in values or [] for v in s.split(",") if v]
+    return out or None
+
+def parse_query(qs):
+    years = None
+    if qs.get("years"):
+        lo, _, hi = qs["years"][0].partition("-")
+        years = (int(lo), int(hi or lo))
+    return _split(qs.get("indicators")), _split(qs.get("states")), years
+
+def records(df):
+    # NaN -> null in the JSON
+    return json.loads(df.to_json(orient="records"))
+
+def handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                if url.path == "/query":
+                    df = service.query(*parse_query(parse_qs(url.query)))
+                    self._send(200, {"rows": len(df), "data": records(df)})
+                elif url.path == "/meta":
+                    self._send(200, service.meta())
+                else:
+                    self._send(404, {"error": f"unknown path {url.path}"})
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def serve(host="127.0.0.1", port=8765, service=None):
+    service = service or PanelService()
+    server = ThreadingHTTPServer((host, port), handler(service))
+    print(f"serving the panel on http://{host}:{server.server_port} (/query, /meta)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Local HTTP query service over the processed panel")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    return ap.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    serve(args.host, args.port, PanelService(args.cache_size))
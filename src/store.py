@@ -0,0 +1,116 @@
+import json
+import shutil
+from pathlib import Path
+import pandas as pd
+import yaml
+
+# Year-partitioned Parquet store used by clean.py, preprocess.py and LinearReg.py.
+# Each dataset is a directory <store>/<name>/year=YYYY/part-*.parquet, typed
+# from data_dictionary.yaml. pyarrow is optional: without it available() is
+# False and the stages keep using the CSV files.
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = pq = None
+
+PARTITION = "year"
+STORE_DIR = "parquet"
+
+def available():
+    return pa is not None
+
+def load_dictionary(root: Path):
+    with open(root / "data_dictionary.yaml", "r") as f:
+        return yaml.safe_load(f).get("columns") or {}
+
+def column_spec(name, columns):
+    if name in columns:
+        return columns[name]
+    # Per-indicator copies inherit the base entry, e.g. obesity_ci_low -> ci_low
+    for base, spec in columns.items():
+        if name.endswith("_" + base):
+            return spec
+    return None
+
+def column_type(name, columns):
+    return (column_spec(name, columns) or {}).get("type")
+
+def _partitioning():
+    # int16 holds any calendar year; wider written dtypes (Int64) are restored
+    # from the pandas metadata on read
+    return ds.partitioning(pa.schema([(PARTITION, pa.int16())]), flavor="hive")
+
+def to_table(df, columns):
+    df = df.copy()
+    for c in df.columns:
+        t = column_type(c, columns)
+        # Columns already in a compact dtype (int8/int16, float32, category) are kept as is
+        if t == "int" and not pd.api.types.is_integer_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+        elif t == "float" and not pd.api.types.is_float_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        elif t == "str" and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype("string")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Partition columns come back last on read; remember the original order.
+    # The pandas metadata is kept so reads restore the written dtypes.
+    meta = dict(table.schema.metadata or {})
+    meta[b"columns"] = json.dumps(list(df.columns)).encode()
+    return table.replace_schema_metadata(meta)
+
+def write_dataset(df, path: Path, columns, append=False, part=0):
+    # append=False replaces the dataset atomically; append=True adds part-<part>-*
+    # files next to existing ones (used by the streaming cleaner, one part per chunk)
+    table = to_table(df, columns)
+    if append:
+        ds.write_dataset(table, path, format="parquet", partitioning=_partitioning(),
+                         basename_template=f"part-{part}-{{i}}.parquet",
+                         existing_data_behavior="overwrite_or_ignore", use_threads=False)
+        return path
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    ds.write_dataset(table, tmp, format="parquet", partitioning=_partitioning(),
+                     use_threads=False)
+    shutil.rmtree(path, ignore_errors=True)
+    tmp.rename(path)
+    return path
+
+def write_partition(df, path: Path, columns, value):
+    # Replace one year=<value> partition in place (append.py); the rest of the
+    # dataset is untouched. Rows of df must all belong to that year.
+    part = path / f"{PARTITION}={value}"
+    shutil.rmtree(part, ignore_errors=True)
+    if len(df):
+        write_dataset(df, path, columns, append=True, part=f"y{value}")
+    return path
+
+def drop_partition(path: Path, value):
+    shutil.rmtree(path / f"{PARTITION}={value}", ignore_errors=True)
+
+def partition_values(path: Path):
+    return sorted(int(p.name.split("=", 1)[1]) for p in path.glob(f"{PARTITION}=*") if p.is_dir())
+
+def dataset_columns(path: Path):
+    # Column order as written (see to_table), without reading any rows
+    schema = ds.dataset(path, format="parquet", partitioning=_partitioning()).schema
+    order = json.loads((schema.metadata or {}).get(b"columns", b"[]"))
+    return order or schema.names
+
+def read_dataset(path: Path, columns=None, filters=None):
+    # columns: projection; filters: pushed-down predicates in pyarrow's
+    # DNF form, e.g. [("year", ">=", 2020)]
+    dataset = ds.dataset(path, format="parquet", partitioning=_partitioning())
+    expr = pq.filters_to_expression(filters) if filters else None
+    table = dataset.to_table(columns=columns, filter=expr)
+    df = table.to_pandas()
+    if columns is None:
+        meta = dataset.schema.metadata or {}
+        order = json.loads(meta.get(b"columns", b"[]"))
+        if sorted(order) == sorted(df.columns):
+            df = df[order]
+    return df
+
+def has_dataset(path: Path):
+    return available() and path.is_dir() and any(path.rglob("*.parquet"))
@@ -0,0 +1,206 @@
+import json
+import argparse
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import arrays
+import preprocess
+from backtest import solve_batched
+from instrument import stage
+from model_cache import frame_digest
+
+# Exhaustive sweep over feature subsets x {OLS, Ridge(alpha), Lasso(alpha)},
+# trained on the train split and scored on the val split of
+# preprocess.time_splits.
+#
+# The centered Gram matrix X'X and moment X'y of all candidate columns are
+# computed once. Every OLS/Ridge fit is then a solve on a sub-block, batched
+# per subset size, and every val score comes from the val split's Gram
+# matrix the same way, so no fit touches the raw rows. Lasso is iterative:
+# it runs on a process pool by coordinate descent on the same precomputed
+# Gram sub-blocks (sklearn lasso_path), and the workers memory-map the design
+# matrix from data/cache/sweep instead of each receiving a pickled copy.
+#
+# All models are compared on the same rows: train/val rows with a NaN in any
+# candidate column are dropped up front. MAE needs the rows, so it is only
+# computed for the top of the leaderboard.
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "cache" / "sweep"
+LEADERBOARD = preprocess.ROOT / "reports" / "leaderboard.csv"
+RIDGE_ALPHAS = [0.01, 0.1, 1.0, 10.0, 100.0]
+LASSO_ALPHAS = [0.001, 0.01, 0.1, 1.0]
+TASK_SUBSETS = 64
+
+def target_ci_columns(df, target=preprocess.TARGET):
+    # The target's own CI bounds (diabetes_ci_low/_ci_high), plus a bare
+    # ci_low/ci_high as older panels carried the diabetes source's CI
+    base = target[: -len("_prevalence")] if target.endswith("_prevalence") else target
+    return [c for c in df.columns if c in ("ci_low", "ci_high") or c.startswith(f"{base}_ci_")]
+
+def candidate_columns(df, target=preprocess.TARGET):
+    # Risk-factor CIs (obesity_ci_low, ...) may stay; the target's
+    # CI would leak the target into the features
+    return arrays.numeric_columns(df, exclude=["state_fips", "year", target] + target_ci_columns(df, target))
+
+def gram_stats(X, y):
+    # Raw sums (for scoring) and centered blocks (for fitting) in one pass
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    G, g, s = X.T @ X, X.T @ y, X.sum(0)
+    sy, syy = y.sum(), y @ y
+    mx, my = s / n, sy / n
+    return {"n": n, "G": G, "g": g, "s": s, "sy": sy, "syy": syy, "mx": mx, "my": my,
+            "C": G - n * np.outer(mx, mx), "c": g - n * mx * my}
+
+def subsets(p, max_size=None):
+    # One (m, k) index array per subset size k
+    for k in range(1, min(p, max_size or p) + 1):
+        yield np.array(list(combinations(range(p), k)), dtype=int)
+
+def _blocks(M, v, idx):
+    return M[idx[:, :, None], idx[:, None, :]], v[idx]
+
+def closed_form(st, idx, alphas):
+    # Ridge on the centered block (intercept unpenalized, as sklearn Ridge);
+    # alpha=0 is OLS. Returns intercepts (a, m) and coefficients (a, m, k).
+    C, c = _blocks(st["C"], st["c"], idx)
+    eye = np.eye(idx.shape[1])
+    alphas = np.asarray(alphas, dtype=float)
+    beta = solve_batched(C[None] + alphas[:, None, None, None] * eye, np.broadcast_to(c, (len(alphas),) + c.shape))
+    intercept = st["my"] - np.einsum("mk,amk->am", st["mx"][idx], beta)
+    return intercept, beta
+
+def val_scores(vs, idx, intercept, beta):
+    # SSE of a + Xb on the val rows, expanded in the val split's sums:
+    # y'y - 2a Σy - 2b'X'y + n a² + 2a b'Σx + b'X'Xb
+    G, g = _blocks(vs["G"], vs["g"], idx)
+    s = vs["s"][idx]
+    a, b = intercept, beta
+    sse = (vs["syy"] - 2 * a * vs["sy"] - 2 * np.einsum("...k,...k->...", b, g)
+           + vs["n"] * a ** 2 + 2 * a * np.einsum("...k,...k->...", b, s)
+           + np.einsum("...j,...jk,...k->...", b, G, b))
+    sst = vs["syy"] - vs["sy"] ** 2 / vs["n"]
+    sse = np.clip(sse, 0, None)
+    return 1.0 - sse / sst, sse / vs["n"]
+
+def _lasso_task(folder, idx, alphas, C, c, mx, my):
+    # Pool worker: the train split is memory-mapped, only the small Gram
+    # blocks travel with the task
+    from sklearn.linear_model import lasso_path
+    X, y, _, _ = arrays.load_split(Path(folder))
+    yc = np.asarray(y, dtype=float) - my
+    alphas = np.sort(np.asarray(alphas, dtype=float))[::-1]
+    intercepts, betas = [], []
+    for cols in idx:
+        Cs = np.ascontiguousarray(C[np.ix_(cols, cols)])   # symmetric: C order == F order
+        Xs = np.asfortranarray(X[:, cols], dtype=float) - mx[cols]
+        _, coefs, _ = lasso_path(Xs, yc, alphas=alphas, precompute=Cs, Xy=c[cols],
+                                 check_input=False, tol=1e-8, max_iter=10000)
+        b = coefs.T[::-1]                     # (alphas ascending, k)
+        betas.append(b)
+        intercepts.append(my - b @ mx[cols])
+    return np.array(intercepts).T, np.transpose(np.array(betas), (1, 0, 2))
+
+def _frame(model, alphas, idx, names, intercept, beta, r2, mse):
+    rows = []
+    for ai, alpha in enumerate(alphas):
+        for j, cols in enumerate(idx):
+            rows.append({"model": model, "alpha": alpha, "k": len(cols),
+                         "features": "+".join(names[i] for i in cols),
+                         "val_r2": r2[ai, j], "val_mse": mse[ai, j],
+                         "intercept": intercept[ai, j],
+                         "coef": json.dumps({names[i]: round(float(v), 6) for i, v in zip(cols, beta[ai, j])})})
+    return rows
+
+def prepare(panel, feature_spec=None, columns=None):
+    if feature_spec is not None:
+        from features import add_features
+        panel = add_features(panel, feature_spec)
+    train, val, _ = preprocess.time_splits(panel, preprocess.TARGET)
+    names = list(columns or candidate_columns(train))
+    keys = ["state_fips", "year"]
+    train, val = (d.dropna(subset=names + [preprocess.TARGET]) for d in (train, val))
+    return train[keys + names + [preprocess.TARGET]], val[keys + names + [preprocess.TARGET]], names
+
+def sweep(train, val, names, models=("ols", "ridge", "lasso"), ridge_alphas=RIDGE_ALPHAS,
+          lasso_alphas=LASSO_ALPHAS, max_size=None, workers=None, top=25):
+    target = preprocess.TARGET
+    Xt, yt = train[names].to_numpy(dtype=float), train[target].to_numpy(dtype=float)
+    Xv, yv = val[names].to_numpy(dtype=float), val[target].to_numpy(dtype=float)
+    with stage("gram", rows_in=len(train) + len(val), columns=len(names)):
+        st, vs = gram_stats(Xt, yt), gram_stats(Xv, yv)
+    groups = list(subsets(len(names), max_size))
+
+    rows = []
+    with stage("sweep_closed_form", subsets=sum(len(i) for i in groups)) as s:
+        for idx in groups:
+            for model, alphas in (("ols", [0.0]), ("ridge", ridge_alphas)):
+                if model in models:
+                    a, b = closed_form(st, idx, alphas)
+                    r2, mse = val_scores(vs, idx, a, b)
+                    rows += _frame(model, alphas, idx, names, a, b, r2, mse)
+        s.rows_out = len(rows)
+
+    if "lasso" in models and lasso_alphas:
+        # Design matrix written once, memory-mapped by every worker
+        folder = CACHE_DIR / frame_digest(train)[:16]
+        if not arrays.has_split(folder):
+            arrays.write_split(train, folder, names, target, ["state_fips", "year"])
+        alphas = sorted(lasso_alphas)
+        tasks = [(idx, cols) for idx in groups for cols in np.array_split(idx, max(1, -(-len(idx) // TASK_SUBSETS)))]
+        args = [(str(folder), cols, alphas, st["C"], st["c"], st["mx"], st["my"]) for _, cols in tasks]
+        with stage("sweep_lasso", tasks=len(tasks)) as s:
+            if workers == 1:
+                results = [_lasso_task(*a) for a in args]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(_lasso_task, *zip(*args)))
+            for (_, cols), (a, b) in zip(tasks, results):
+                r2, mse = val_scores(vs, cols, a, b)
+                rows += _frame("lasso", alphas, cols, names, a, b, r2, mse)
+            s.rows_out = len(results)
+
+    board = pd.DataFrame(rows).sort_values(["val_mse", "k"], kind="stable", ignore_index=True)
+    board.insert(0, "rank", np.arange(1, len(board) + 1))
+    board["n_train"], board["n_val"] = len(train), len(val)
+    # MAE only for the top rows, from the val rows themselves
+    board["val_mae"] = np.nan
+    for i in range(min(top, len(board))):
+        coef = json.loads(board.at[i, "coef"])
+        pred = board.at[i, "intercept"] + val[list(coef)].to_numpy(dtype=float) @ np.array(list(coef.values()))
+        board.at[i, "val_mae"] = np.abs(yv - pred).mean()
+    return board
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Feature-subset x OLS/Ridge/Lasso sweep scored on the val split")
+    ap.add_argument("--models", nargs="+", default=["ols", "ridge", "lasso"], choices=["ols", "ridge", "lasso"])
+    ap.add_argument("--ridge-alphas", nargs="*", type=float, default=RIDGE_ALPHAS)
+    ap.add_argument("--lasso-alphas", nargs="*", type=float, default=LASSO_ALPHAS)
+    ap.add_argument("--columns", nargs="*", default=None,
+                    help="candidate columns (default: every numeric X column, except the target and its CI)")
+    ap.add_argument("--features", action="store_true",
+                    help="add the engineered features (features.DEFAULT_SPEC) as candidates")
+    ap.add_argument("--max-size", type=int, default=None, help="largest subset size")
+    ap.add_argument("--workers", type=int, default=None, help="process pool size for Lasso")
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--out", default=str(LEADERBOARD))
+    args = ap.parse_args(argv)
+
+    panel = preprocess.read_table(preprocess.panel_path())
+    train, val, names = prepare(panel, {} if args.features else None, args.columns)
+    board = sweep(train, val, names, args.models, args.ridge_alphas, args.lasso_alphas,
+                  args.max_size, args.workers, args.top)
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    board.to_csv(args.out, index=False)
+    print(f"{len(board)} fits over {len(names)} candidate columns "
+          f"(train n={len(train)}, val n={len(val)}) -> {args.out}")
+    print(board.head(args.top)[["rank", "model", "alpha", "k", "features", "val_r2", "val_mse", "val_mae"]]
+          .to_string(index=False))
+    return board
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+# Batched per-unit linear trends: value ~ a + b * (year - center) fitted for
+# every state (or county, or any grouping column) at once. All estimates come
+# from grouped sums of t, y, t², t·y and y², so there is no per-unit model
+# object and no formula/design-matrix construction.
+
+def group_sums(codes, n_groups, t, y):
+    def s(w=None):
+        return np.bincount(codes, weights=w, minlength=n_groups)
+    return s(), s(t), s(y), s(t * t), s(t * y), s(y * y)
+
+def unit_trends(df, value="diabetes_prevalence", group="state", time="year", center=None):
+    data = df[[group, time, value]].dropna()
+    codes, units = pd.factorize(data[group], sort=True)
+    t_raw = data[time].to_numpy(dtype=float)
+    # Centering keeps the sums well conditioned and makes the intercept the
+    # fitted level at `center` (the mean year by default, like year_c)
+    center = float(np.mean(t_raw)) if center is None else float(center)
+    t = t_raw - center
+    y = data[value].to_numpy(dtype=float)
+
+    n, st, sy, stt, sty, syy = group_sums(codes, len(units), t, y)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_bar, y_bar = st / n, sy / n
+        sxx = stt - n * t_bar ** 2
+        sxy = sty - n * t_bar * y_bar
+        syy_c = syy - n * y_bar ** 2
+        slope = sxy / sxx
+        intercept = y_bar - slope * t_bar
+        sse = np.clip(syy_c - slope * sxy, 0, None)
+        sigma2 = sse / (n - 2)
+        se_slope = np.sqrt(sigma2 / sxx)
+        se_intercept = np.sqrt(sigma2 * (1.0 / n + t_bar ** 2 / sxx))
+        r2 = 1.0 - sse / syy_c
+
+    return pd.DataFrame({
+        group: units,
+        "n": n.astype(int),
+        "year_center": center,
+        "intercept": intercept,
+        "slope": slope,
+        "se_intercept": se_intercept,
+        "se_slope": se_slope,
+        "r2": r2,
+    })
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import store
+
+# Schema checks compiled from data_dictionary.yaml and run as one vectorized
+# pass per frame (or per chunk in the streaming cleaner):
+#
+#   type          value is not parseable as the declared int/float ("No Data")
+#   range         numeric value outside the declared `range: [lo, hi]`
+#   state         state code not in the allowed set (clean.STATE_LOOKUP)
+#   key_null      a key column (state_fips, year) is missing
+#   key_duplicate (state_fips, year) already seen in this frame or an earlier chunk
+#
+# Nothing raises: a Validator accumulates row counts and a few example values
+# per (column, rule) across every frame it is given. apply() turns the masks
+# of the last check into a cleaned frame (rows failing a row rule dropped,
+# unparseable values set to NaN) for clean.py --drop-invalid.
+
+MAX_EXAMPLES = 3
+
+class Schema:
+    def __init__(self, columns, allowed_states=None, keys=("state_fips", "year")):
+        self.columns = columns
+        self.states = np.array(sorted(allowed_states)) if allowed_states else None
+        self.keys = list(keys)
+        self._rules = {}
+
+    def rules_for(self, name):
+        # Resolved once per column name: (type, lo, hi)
+        if name not in self._rules:
+            spec = store.column_spec(name, self.columns) or {}
+            lo, hi = (spec.get("range") or [None, None])
+            self._rules[name] = (spec.get("type"), lo, hi)
+        return self._rules[name]
+
+def compile_schema(columns, allowed_states=None, keys=("state_fips", "year")):
+    return Schema(columns, allowed_states, keys)
+
+class Validator:
+    def __init__(self, schema):
+        self.schema = schema
+        self.rows = 0
+        self.bad_rows = 0
+        self.counts = {}
+        self.examples = {}
+        self._example_set = {}
+        self._seen = np.empty(0, dtype=np.int64)
+        self._row_bad = None
+        self._type_bad = {}
+
+    def _add(self, column, rule, mask, values):
+        n = int(mask.sum())
+        if not n:
+            return
+        key = (column, rule)
+        self.counts[key] = self.counts.get(key, 0) + n
+        ex = self.examples.setdefault(key, [])
+        if len(ex) < MAX_EXAMPLES:
+            # Distinct across every frame/chunk, not just within this one
+            seen = self._example_set.setdefault(key, set(ex))
+            for v in pd.unique(values[mask]):
+                v = str(v)
+                if v not in seen:
+                    seen.add(v)
+                    ex.append(v)
+                    if len(ex) == MAX_EXAMPLES:
+                        break
+
+    def check(self, df):
+        row_bad = np.zeros(len(df), dtype=bool)
+        self._type_bad = {}
+        numeric = {}
+        for c in df.columns:
+            kind, lo, hi = self.schema.rules_for(c)
+            if kind not in ("int", "float"):
+                continue
+            raw = df[c]
+            num = pd.to_numeric(raw, errors="coerce")
+            values = raw.to_numpy(dtype=object)
+            bad = (num.isna() & raw.notna()).to_numpy()
+            if kind == "int":
+                bad = bad | (num.notna() & (num % 1 != 0)).to_numpy()
+            self._add(c, "type", bad, values)
+            self._type_bad[c] = bad
+            numeric[c] = num
+            if lo is not None or hi is not None:
+                x = num.to_numpy(dtype=float, na_value=np.nan)
+                with np.errstate(invalid="ignore"):
+                    out = ((x < lo) if lo is not None else False) | ((x > hi) if hi is not None else False)
+                self._add(c, "range", out, values)
+                row_bad |= out
+
+        if self.schema.states is not None and "state" in df.columns:
+            state = df["state"].astype(str).to_numpy()
+            bad = ~np.isin(state, self.schema.states)
+            self._add("state", "state", bad, state)
+            row_bad |= bad
+
+        keys = [k for k in self.schema.keys if k in df.columns]
+        if keys:
+            nums = [numeric.get(k, pd.to_numeric(df[k], errors="coerce")) for k in keys]
+            null = np.zeros(len(df), dtype=bool)
+            for k, num in zip(keys, nums):
+                miss = num.isna().to_numpy()
+                self._add(k, "key_null", miss, df[k].to_numpy(dtype=object))
+                null |= miss
+            row_bad |= null
+            if len(keys) == len(self.schema.keys):
+                # One int64 per key tuple; duplicates within the frame and
+                # against every earlier chunk in one isin/duplicated pass
+                code = np.zeros(len(df), dtype=np.int64)
+                for num in nums:
+                    v = num.to_numpy(dtype=float, na_value=np.nan)
+                    code = code * 100_000 + np.where(np.isnan(v), 0, v).astype(np.int64)
+                code = np.where(null, -1, code)
+                dup = ~null & (pd.Series(code).duplicated().to_numpy() | np.isin(code, self._seen))
+                labels = code
+                if dup.any():
+                    labels = df[keys[0]].astype(str)
+                    for k in keys[1:]:
+                        labels = labels + "/" + df[k].astype(str)
+                    labels = labels.to_numpy()
+                self._add("/".join(keys), "key_duplicate", dup, labels)
+                row_bad |= dup
+                self._seen = np.union1d(self._seen, code[~null])
+
+        self.rows += len(df)
+        self.bad_rows += int(row_bad.sum())
+        self._row_bad = row_bad
+        return row_bad
+
+    def apply(self, df):
+        # Cleaned copy of the frame given to the last check()
+        df = df.copy()
+        for c, bad in self._type_bad.items():
+            if bad.any():
+                df[c] = pd.to_numeric(df[c], errors="coerce")
+        return df[~self._row_bad]
+
+    def summary(self):
+        return {"rows": self.rows, "bad_rows": self.bad_rows,
+                "violations": [{"column": c, "rule": r, "rows": n, "examples": self.examples[(c, r)]}
+                               for (c, r), n in sorted(self.counts.items())]}
+
+    def lines(self):
+        out = [f"{self.bad_rows}/{self.rows} rows fail a row rule"]
+        for v in self.summary()["violations"]:
+            out.append(f"{v['column']}: {v['rule']} x{v['rows']} (e.g. {', '.join(v['examples'])})")
+        return out
@@ -0,0 +1,177 @@
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+import preprocess
+from backtest import solve_batched
+from cube import Z95, ci_columns
+from instrument import stage
+from regions import assign_regions
+from sweep import subsets
+
+# Inverse-variance weighted estimation from the CDC 95% CIs. Each estimate's
+# standard error is taken as the CI width / (2 * 1.96) and its weight as
+# 1 / se²; values without a CI get weight 0. The CIs are the panel's
+# <indicator>_ci_low/_ci_high columns; a missing pair raises.
+#
+# wls() stacks every response (indicator, optionally x sub-population) as a
+# column of Y and W and computes all weighted Gram matrices Z'WZ, Z'Wy, y'Wy
+# in one einsum over the rows. Every feature set is then a batched solve on
+# sub-blocks of those matrices (as sweep.closed_form), and the weighted SSE,
+# scale, standard errors and R² come from the same moments, so no fit touches
+# the rows again. Coefficients and SEs match statsmodels WLS.
+
+RISK_FACTORS = ["inactivity_prevalence", "obesity_prevalence", "smoking_prevalence"]  # LinearReg.FEATURES
+OUT = preprocess.ROOT / "reports"
+
+def ci_se(lo, hi):
+    lo = pd.to_numeric(pd.Series(np.asarray(lo).ravel()), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    hi = pd.to_numeric(pd.Series(np.asarray(hi).ravel()), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    return (hi - lo) / (2 * Z95)
+
+def ci_weights(frame, indicators):
+    # (rows, indicators) inverse-variance weights; 0 where the value or CI is
+    # missing. Every indicator needs its own <base>_ci_low/_ci_high columns.
+    W = np.zeros((len(frame), len(indicators)))
+    for j, ind in enumerate(indicators):
+        ci = ci_columns(frame, ind, required=True)
+        se = ci_se(frame[ci[0]], frame[ci[1]])
+        ok = ~np.isnan(se) & (se > 0) & frame[ind].notna().to_numpy()
+        W[ok, j] = 1.0 / se[ok] ** 2
+    return W
+
+
+# Batched WLS
+
+def weighted_stats(X, Y, W):
+    # Rows with any NaN in X get weight 0 for every response; a NaN response
+    # only zeroes its own column
+    X, Y, W = (np.asarray(a, dtype=float) for a in (X, Y, W))
+    W = np.where(np.isnan(Y) | np.isnan(X).any(1, keepdims=True), 0.0, W)
+    Y = np.where(W > 0, Y, 0.0)
+    Z = np.column_stack([np.ones(len(X)), np.nan_to_num(X)])
+    # Contract over the rows directly; no (k, n, p) weighted copy of Z
+    G = np.einsum("nk,na,nb->kab", W, Z, Z, optimize=True)
+    g = np.einsum("nk,na,nk->ka", W, Z, Y, optimize=True)
+    return {"G": G, "g": g, "yy": np.einsum("nk,nk,nk->k", W, Y, Y),
+            "n": (W > 0).sum(0)}
+
+def wls_solve(st, cols):
+    # cols (m, s) candidate indices; intercept always in. Returns per
+    # (response, subset): beta (k, m, s+1), se, sigma2, r2, n
+    idx = np.column_stack([np.zeros(len(cols), dtype=int), cols + 1])
+    G = st["G"][:, idx[:, :, None], idx[:, None, :]]
+    g = st["g"][:, idx]
+    beta = solve_batched(G, g)
+    ssr = (st["yy"][:, None] - 2 * np.einsum("kms,kms->km", beta, g)
+           + np.einsum("kms,kmst,kmt->km", beta, G, beta))
+    n = st["n"][:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma2 = np.clip(ssr, 0, None) / (n - idx.shape[1])
+        diag = np.diagonal(np.linalg.pinv(G), axis1=-2, axis2=-1)
+        se = np.sqrt(sigma2[..., None] * diag)
+        sw, swy = st["G"][:, 0, 0], st["g"][:, 0]
+        tss = st["yy"] - swy ** 2 / sw
+        r2 = 1.0 - ssr / tss[:, None]
+    return beta, se, sigma2, r2, np.broadcast_to(n, sigma2.shape)
+
+def wls(frame, responses, features, feature_sets=None, weights=None, by=None, max_size=None):
+    # Tidy table, one row per (response, group, feature set, term). feature_sets:
+    # lists of names from `features` (default: every subset up to max_size).
+    # weights: (rows, responses), default ci_weights. by: column whose levels
+    # are fitted as separate sub-populations, all in the same pass.
+    X = frame[features].to_numpy(dtype=float, na_value=np.nan)
+    Y = frame[responses].to_numpy(dtype=float, na_value=np.nan)
+    W = ci_weights(frame, responses) if weights is None else np.asarray(weights, dtype=float)
+    labels = [(r, "all") for r in responses]
+    if by is not None:
+        codes, levels = pd.factorize(frame[by], sort=True)
+        mask = (codes[:, None] == np.arange(len(levels))).astype(float)          # (n, groups)
+        Y = np.repeat(Y, len(levels), axis=1)
+        W = (W[:, :, None] * mask[:, None, :]).reshape(len(frame), -1)
+        labels = [(r, lvl) for r in responses for lvl in levels]
+    if feature_sets is None:
+        groups = list(subsets(len(features), max_size))
+    else:
+        sizes = {}
+        for fs in feature_sets:
+            sizes.setdefault(len(fs), []).append([features.index(f) for f in fs])
+        groups = [np.array(v, dtype=int) for _, v in sorted(sizes.items())]
+
+    with stage("wls", rows_in=len(frame), responses=len(labels), features=len(features)) as st_:
+        st = weighted_stats(X, Y, W)
+        rows = []
+        for cols in groups:
+            beta, se, sigma2, r2, n = wls_solve(st, cols)
+            terms = [["const"] + [features[i] for i in c] for c in cols]
+            for k, (resp, grp) in enumerate(labels):
+                for m, names in enumerate(terms):
+                    # A response cannot explain itself
+                    if resp in names:
+                        continue
+                    for t, term in enumerate(names):
+                        rows.append((resp, grp, "+".join(names[1:]), term, beta[k, m, t], se[k, m, t],
+                                     int(n[k, m]), sigma2[k, m], r2[k, m]))
+        out = pd.DataFrame(rows, columns=["response", "group", "features", "term", "coef", "se",
+                                          "n", "sigma2", "r2"])
+        st_.rows_out = len(out)
+    return out
+
+
+# Weighted aggregates
+
+def aggregates(frame, indicators, by=("region", "year")):
+    # Inverse-variance weighted mean and SE per group, all indicators in one
+    # bincount, next to the plain mean for comparison
+    by = list(by)
+    data = frame.dropna(subset=by)
+    codes = data.groupby(by, sort=True, observed=True).ngroup().to_numpy()
+    keys = data[by].drop_duplicates().sort_values(by).reset_index(drop=True)
+    n_groups, k = len(keys), len(indicators)
+    X = data[indicators].to_numpy(dtype=float, na_value=np.nan)
+    W = ci_weights(data, indicators)
+    ok = ~np.isnan(X)
+    flat = (codes[:, None] * k + np.arange(k)).ravel()
+
+    def s(v):
+        return np.bincount(flat, weights=v.ravel(), minlength=n_groups * k).reshape(n_groups, k)
+    n, sx, sw, swx = s(ok), s(np.where(ok, X, 0.0)), s(W), s(W * np.where(ok, X, 0.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean, mean_ivw, se_ivw = sx / n, swx / sw, 1.0 / np.sqrt(sw)
+    out = []
+    for j, ind in enumerate(indicators):
+        part = keys.copy()
+        part["indicator"] = ind
+        part["n"] = n[:, j].astype(int)
+        part["n_ci"] = s((W > 0).astype(float))[:, j].astype(int)
+        part["mean"], part["mean_ivw"], part["se_ivw"] = mean[:, j], mean_ivw[:, j], se_ivw[:, j]
+        out.append(part)
+    return pd.concat(out, ignore_index=True)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Inverse-variance weighted WLS and region aggregates from the CI columns")
+    ap.add_argument("--responses", nargs="*", default=[preprocess.TARGET])
+    ap.add_argument("--features", nargs="*", default=RISK_FACTORS)
+    ap.add_argument("--max-size", type=int, default=None)
+    ap.add_argument("--by", default=None, help="fit each level of this column separately (e.g. region)")
+    ap.add_argument("--out", default=str(OUT))
+    args = ap.parse_args(argv)
+
+    panel = preprocess.read_table(preprocess.panel_path())
+    panel["region"] = assign_regions(panel["state"]).to_numpy()
+    indicators = [c for c in panel.columns if c.endswith("_prevalence")]
+    fits = wls(panel, args.responses, args.features, by=args.by, max_size=args.max_size)
+    agg = aggregates(panel, indicators)
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    fits.to_csv(out / "wls_fits.csv", index=False)
+    agg.to_csv(out / "weighted_aggregates.csv", index=False)
+    full = fits[fits["features"] == "+".join(args.features)]
+    print(f"{fits[['response', 'group', 'features']].drop_duplicates().shape[0]} weighted fits -> {out / 'wls_fits.csv'}")
+    print(full[["response", "group", "term", "coef", "se", "n", "r2"]].to_string(index=False))
+    print(f"{len(agg)} weighted region-year aggregates -> {out / 'weighted_aggregates.csv'}")
+    return fits, agg
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# Keep test runs out of reports/run_log.jsonl
+os.environ.setdefault("DT_RUN_LOG", "0")
@@ -0,0 +1,71 @@
+import sys
+import json
+import shutil
+import subprocess
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = Path(__file__).resolve().parent
+REPO = HERE.parent
+sys.path.insert(0, str(REPO / "src"))
+sys.path.insert(0, str(REPO / "benchmarks"))
+import arrays
+import store
+from synth import generate
+
+pytestmark = pytest.mark.skipif(not store.available(), reason="appending needs pyarrow")
+
+def make_tree(root, raw_files, year_max):
+    # A throwaway copy of the repo layout: scripts find ROOT by walking up to
+    # columns_config.yaml + data/
+    shutil.copytree(REPO / "src", root / "src", ignore=shutil.ignore_patterns("__pycache__"))
+    shutil.copy(REPO / "data_dictionary.yaml", root)
+    config = (REPO / "columns_config.yaml").read_text()
+    (root / "columns_config.yaml").write_text(config + f"\nyear_max: {year_max}\n")
+    (root / "data" / "raw").mkdir(parents=True)
+    for p in raw_files:
+        shutil.copy(p, root / "data" / "raw")
+
+def run(root, script, *args):
+    subprocess.run([sys.executable, str(root / "src" / script), *map(str, args)], cwd=root,
+                   check=True, capture_output=True, env={"DT_RUN_LOG": "0", "PATH": ""})
+
+def table(root, name, keys=("year", "state_fips")):
+    df = store.read_dataset(root / "data" / "processed" / store.STORE_DIR / name)
+    return df.sort_values(list(keys), ignore_index=True)
+
+def test_append_matches_rebuild(tmp_path):
+    # One synthetic export covering 2014-2024; the appended tree first sees it up to 2023
+    raw = generate(tmp_path / "exports", n_units=51, n_years=11, n_indicators=4, first_year=2014)
+    appended, rebuilt = tmp_path / "appended", tmp_path / "rebuilt"
+
+    make_tree(appended, raw, 2023)
+    run(appended, "clean.py")
+    run(appended, "preprocess.py", "--npy")
+    run(appended, "append.py", "--year", 2024, *raw)
+
+    make_tree(rebuilt, raw, 2024)
+    run(rebuilt, "clean.py")
+    run(rebuilt, "preprocess.py", "--npy")
+
+    for name in ["diabetes_panel"] + [f"{k}_{s}" for k in "Xy" for s in ["train", "val", "test"]]:
+        pd.testing.assert_frame_equal(table(appended, name), table(rebuilt, name), obj=name)
+    cells = ("level", "geo", "year", "indicator")
+    pd.testing.assert_frame_equal(table(appended, "cube", cells), table(rebuilt, "cube", cells), obj="cube")
+
+    for split in ["train", "val", "test"]:
+        a = arrays.load_split(appended / "data" / "processed" / arrays.ARRAY_DIR / split, mmap=False)
+        b = arrays.load_split(rebuilt / "data" / "processed" / arrays.ARRAY_DIR / split, mmap=False)
+        assert a[3] == b[3]
+        for x, y in zip(a[:3], b[:3]):
+            np.testing.assert_array_equal(x, y)
+
+    # The incrementally solved model equals OLS on the rebuilt train split
+    model = json.loads((appended / "data" / "processed" / "linear_model.json").read_text())
+    X, y = table(rebuilt, "X_train"), table(rebuilt, "y_train")
+    data = X.merge(y, on=["state_fips", "state", "year"]).dropna(subset=model["features"] + ["diabetes_prevalence"])
+    Z = np.column_stack([np.ones(len(data)), data[model["features"]].to_numpy(dtype=float)])
+    beta = np.linalg.lstsq(Z, data["diabetes_prevalence"].to_numpy(dtype=float), rcond=None)[0]
+    assert np.allclose([model["intercept"]] + [model["coef"][f] for f in model["features"]], beta)
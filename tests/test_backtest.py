@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import backtest
+
+FEATURES = ["a", "b", "c"]
+
+def make_panel(n_units=20, years=range(2012, 2022), seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [(u, y) for u in range(n_units) for y in years]
+    df = pd.DataFrame(rows, columns=["unit", "year"])
+    for c in FEATURES:
+        df[c] = rng.normal(size=len(df))
+    df["target"] = 2 + df[FEATURES].to_numpy() @ [1.5, -0.7, 0.3] + rng.normal(scale=0.5, size=len(df))
+    # A few gaps, dropped before fitting
+    df.loc[rng.choice(len(df), 8, replace=False), "b"] = np.nan
+    return df
+
+def sklearn_origins(df, features, min_train_years):
+    data = df.dropna(subset=features + ["target"])
+    years = sorted(data["year"].unique())
+    rows = []
+    for t in years[min_train_years:]:
+        train, test = data[data["year"] < t], data[data["year"] == t]
+        pred = LinearRegression().fit(train[features], train["target"]).predict(test[features])
+        rows.append({"origin_year": t, "n_train": len(train), "n_test": len(test),
+                     "r2": r2_score(test["target"], pred),
+                     "mse": mean_squared_error(test["target"], pred),
+                     "mae": mean_absolute_error(test["target"], pred)})
+    return pd.DataFrame(rows)
+
+def test_rolling_origin_matches_sklearn():
+    df = make_panel()
+    sets = [FEATURES, ["a"], ["c", "a"]]
+    got = backtest.rolling_origin(df, FEATURES, "target", min_train_years=3, feature_sets=sets)
+    # Rows missing any of `features` are dropped once, for every feature set
+    data = df.dropna(subset=FEATURES)
+    for fs in sets:
+        expected = sklearn_origins(data, fs, 3)
+        part = got[got["features"] == "+".join(fs)].reset_index(drop=True)
+        assert part["origin_year"].tolist() == expected["origin_year"].tolist() == list(range(2015, 2022))
+        assert (part["n_train"] == expected["n_train"]).all()
+        assert (part["n_test"] == expected["n_test"]).all()
+        for m in ["r2", "mse", "mae"]:
+            np.testing.assert_allclose(part[m], expected[m], rtol=1e-9, err_msg=m)
+
+def test_arrays_match_frame():
+    df = make_panel(seed=1)
+    frame = backtest.rolling_origin(df, FEATURES, "target", min_train_years=4)
+    # NaN rows left in the arrays are dropped by rolling_origin_arrays itself
+    arrays = backtest.rolling_origin_arrays(df[FEATURES].to_numpy(), df["target"].to_numpy(),
+                                            df["year"].to_numpy(), FEATURES, min_train_years=4)
+    pd.testing.assert_frame_equal(arrays, frame)
+    expected = sklearn_origins(df, FEATURES, 4)
+    np.testing.assert_allclose(arrays["r2"], expected["r2"], rtol=1e-9)
+    np.testing.assert_allclose(arrays["mse"], expected["mse"], rtol=1e-9)
@@ -0,0 +1,78 @@
+import sys
+from pathlib import Path
+import pandas as pd
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+sys.path.insert(0, str(HERE.parent / "benchmarks"))
+import clean
+import store
+from synth import generate
+
+def test_compact_keeps_county_rows():
+    df = pd.DataFrame({"year": [2014, 2014, 2015], "state": ["ALABAMA COUNTY 1", "WYOMING COUNTY 2", "ALABAMA COUNTY 1"],
+                       "state_fips": [1001, 56002, 1001], "diabetes_prevalence": [9.5, 8.1, 9.9]})
+    out = clean.compact_dtypes(df)
+    assert len(out) == len(df)
+    assert out["state_fips"].tolist() == [1001, 56002, 1001]
+    assert out["state"].astype(str).tolist() == df["state"].tolist()
+
+def test_compact_drops_non_states():
+    df = pd.DataFrame({"year": [2014, 2014, 2014], "state": ["AL", "GUAM", "WY"],
+                       "state_fips": [1, None, 56], "diabetes_prevalence": [9.5, None, 8.1]})
+    out = clean.compact_dtypes(df)
+    assert out["state"].astype(str).tolist() == ["AL", "WY"]
+    assert str(out["state_fips"].dtype) == "int8"
+
+def use_dirs(monkeypatch, raw, out):
+    monkeypatch.setattr(clean, "RAW", raw)
+    monkeypatch.setattr(clean, "INTERIM", out / "interim")
+    monkeypatch.setattr(clean, "STORE", out / "interim" / store.STORE_DIR)
+    monkeypatch.setattr(clean, "REPORTS", out / "reports")
+
+def interim_files(out):
+    return {p.name: p.read_bytes() for p in sorted((out / "interim").glob("*_clean.csv"))}
+
+def interim_tables(out):
+    root = out / "interim" / store.STORE_DIR
+    return {p.name: store.read_dataset(p).sort_values(["year", "state"], ignore_index=True)
+            for p in sorted(root.iterdir()) if store.has_dataset(p)}
+
+def test_pool_and_stream_match_serial(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    generate(raw, n_units=51, n_years=4, n_indicators=4)
+    runs = {"serial": {}, "pool": {"workers": 2}, "stream": {"stream": True, "chunksize": 37}}
+    for name, kwargs in runs.items():
+        use_dirs(monkeypatch, raw, tmp_path / name)
+        clean.main(force=True, **kwargs)
+
+    serial = interim_files(tmp_path / "serial")
+    assert len(serial) == 4
+    for name in ["pool", "stream"]:
+        assert interim_files(tmp_path / name) == serial
+    if store.available():
+        expected = interim_tables(tmp_path / "serial")
+        for name in ["pool", "stream"]:
+            got = interim_tables(tmp_path / name)
+            assert got.keys() == expected.keys()
+            for k in expected:
+                pd.testing.assert_frame_equal(got[k], expected[k])
+
+def test_rerun_skips_unchanged_files(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    paths = generate(raw, n_units=51, n_years=3, n_indicators=2)
+    use_dirs(monkeypatch, raw, tmp_path / "out")
+    clean.main()
+    before = interim_files(tmp_path / "out")
+
+    cleaned = []
+    process_file = clean.process_file
+    monkeypatch.setattr(clean, "process_file", lambda p, *a: cleaned.append(p.name) or process_file(p, *a))
+    clean.main()
+    clean.main(stream=True, chunksize=50)   # same output, so no re-clean either
+    assert cleaned == []
+    assert interim_files(tmp_path / "out") == before
+
+    paths[0].write_text(paths[0].read_text().replace("Data downloaded", "Data exported"))
+    clean.main()
+    assert cleaned == [paths[0].name]
@@ -0,0 +1,91 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import arrays
+import preprocess
+import LinearReg
+
+def make_panel(years, n_states=5, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [(f, f"S{f}", y) for f in range(1, n_states + 1) for y in years]
+    df = pd.DataFrame(rows, columns=["state_fips", "state", "year"])
+    for c in LinearReg.FEATURES + [preprocess.TARGET]:
+        df[c] = rng.uniform(5, 40, len(df))
+    return df
+
+def use_processed(monkeypatch, folder):
+    monkeypatch.setattr(preprocess, "PROCESSED", folder)
+    monkeypatch.setattr(preprocess, "STORE", folder / "parquet")
+    monkeypatch.setattr(LinearReg, "PROCESSED", folder)
+
+def test_rebuild_without_npy_drops_stale_arrays(tmp_path, monkeypatch):
+    use_processed(monkeypatch, tmp_path)
+    preprocess.write_splits(make_panel(range(2014, 2025)), npy="float64")
+    assert arrays.has_split(tmp_path / arrays.ARRAY_DIR / "train")
+
+    preprocess.write_splits(make_panel(range(2014, 2024)))
+    for name in ["train", "val", "test"]:
+        assert not arrays.has_split(tmp_path / arrays.ARRAY_DIR / name)
+    X, y, years = LinearReg.load_xy("train")
+    assert len(X) == len(y) == 5 * 8
+    assert years.max() == 2021
+
+def test_weighted_fit_aligns_ci_on_keys(tmp_path, monkeypatch):
+    use_processed(monkeypatch, tmp_path)
+    panel = make_panel(range(2014, 2024))
+    panel["diabetes_ci_low"] = panel[preprocess.TARGET] - 1 - panel["state_fips"] * 0.1
+    panel["diabetes_ci_high"] = panel[preprocess.TARGET] + 1 + panel["state_fips"] * 0.1
+    preprocess.write_splits(panel, npy="float64")
+    keys = LinearReg.load_keys("train")
+    table = LinearReg.load_split("X_train", LinearReg.KEYS + ["diabetes_ci_low", "diabetes_ci_high"])
+    # Row order of the CI table must not matter
+    ci = LinearReg.align_on_keys(keys, table.iloc[::-1])
+    assert (ci[LinearReg.KEYS].to_numpy() == keys.to_numpy()).all()
+    X, _, _ = LinearReg.load_xy("train")
+    assert len(X) == len(ci)
+    width = (ci["diabetes_ci_high"] - ci["diabetes_ci_low"]).to_numpy()
+    assert np.allclose(width, 2 + 0.2 * keys["state_fips"].to_numpy())
+
+    with pytest.raises(ValueError):
+        LinearReg.align_on_keys(keys, table.iloc[1:])
+    shifted = table.assign(year=table["year"] + 100)
+    with pytest.raises(ValueError):
+        LinearReg.align_on_keys(keys, shifted)
+
+def source(label, fips, years, seed):
+    rng = np.random.default_rng(seed)
+    rows = [(f, f"S{f}", y) for f in fips for y in years]
+    df = pd.DataFrame(rows, columns=["state_fips", "state", "year"])
+    df[f"{label}_prevalence"] = rng.uniform(5, 40, len(df))
+    df["ci_low"] = df[f"{label}_prevalence"] - 1
+    return df
+
+def sorted_frame(df):
+    return df.sort_values(["state_fips", "year"], ignore_index=True)
+
+def test_concat_join_matches_pairwise_merge():
+    # Overlapping but unequal key sets, so the outer join has gaps
+    dfs = [source("diabetes", range(1, 6), range(2014, 2020), 0),
+           source("obesity", range(2, 8), range(2015, 2021), 1),
+           source("smoking", range(1, 4), range(2014, 2018), 2)]
+    joined = preprocess.outer_join_on_keys(dfs)
+    pairwise = preprocess._merge_pairwise(dfs)
+    assert list(joined.columns) == list(pairwise.columns)
+    pd.testing.assert_frame_equal(sorted_frame(joined), sorted_frame(pairwise))
+
+def test_different_keys_fall_back_to_pairwise():
+    dfs = [source("diabetes", range(1, 6), range(2014, 2020), 0),
+           source("obesity", range(1, 6), range(2014, 2020), 1).drop(columns="state")]
+    pd.testing.assert_frame_equal(preprocess.outer_join_on_keys(dfs), preprocess._merge_pairwise(dfs))
+
+def test_duplicate_keys_fall_back_to_pairwise():
+    dup = source("obesity", range(1, 4), range(2014, 2017), 1)
+    dfs = [source("diabetes", range(1, 4), range(2014, 2017), 0), pd.concat([dup, dup.iloc[:2]])]
+    joined = preprocess.outer_join_on_keys(dfs)
+    pd.testing.assert_frame_equal(joined, preprocess._merge_pairwise(dfs))
+    # merge fans the duplicated keys out; every source row is kept
+    assert len(joined) == 9 + 2
@@ -0,0 +1,117 @@
+import sys
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import preprocess
+import service
+
+STATES = ["AL", "AK", "AZ", "GA", "TX", "WY"]
+FIPS = [1, 2, 4, 13, 48, 56]
+INDICATORS = ["diabetes_prevalence", "obesity_prevalence"]
+
+def make_panel(years=range(2014, 2024), shift=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [(y, s, f) for s, f in zip(STATES, FIPS) for y in years]
+    df = pd.DataFrame(rows, columns=["year", "state", "state_fips"])
+    for c in INDICATORS:
+        df[c] = rng.uniform(5, 40, len(df)).round(2) + shift
+    # Shuffled on disk; the index sorts it
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+@pytest.fixture
+def panel_file(tmp_path, monkeypatch):
+    # No Parquet store in tmp_path, so panel_path() falls back to the CSV
+    monkeypatch.setattr(preprocess, "PROCESSED", tmp_path)
+    monkeypatch.setattr(preprocess, "STORE", tmp_path / "parquet")
+    path = tmp_path / "diabetes_panel.csv"
+    make_panel().to_csv(path, index=False)
+    return path
+
+def expected(path, indicators, states=None, years=None):
+    df = pd.read_csv(path)
+    if states is not None:
+        df = df[df["state"].isin(states)]
+    if years is not None:
+        df = df[df["year"].between(*years)]
+    return df.sort_values(["state_fips", "year"])[service.KEYS + indicators].reset_index(drop=True)
+
+def test_index_lookups_match_filter(panel_file):
+    svc = service.PanelService(check_seconds=0)
+    cases = [(["obesity_prevalence"], ["GA", "TX"], (2015, 2020)),
+             (INDICATORS, ["wy", " al "], None),
+             (["diabetes_prevalence"], None, (2018, 2019)),
+             (["diabetes_prevalence"], None, None),
+             (["obesity_prevalence"], ["TX"], (2030, 2031))]
+    for indicators, states, years in cases:
+        got = svc.query(indicators, states=states, years=years)
+        norm = [s.strip().upper() for s in states] if states is not None else None
+        pd.testing.assert_frame_equal(got, expected(panel_file, indicators, norm, years), check_dtype=False)
+    # FIPS codes work in place of state codes
+    pd.testing.assert_frame_equal(svc.query(INDICATORS, states=["13", "48"]),
+                                  svc.query(INDICATORS, states=["GA", "TX"]))
+
+def test_repeated_queries_hit_the_cache(panel_file):
+    svc = service.PanelService(cache_size=2, check_seconds=0)
+    a = svc.query(["obesity_prevalence"], states=["GA", "TX"], years=(2015, 2020))
+    # Same query after normalization: state order and case don't matter
+    b = svc.query(["obesity_prevalence"], states=["tx", "GA"], years=(2015, 2020))
+    assert b is a
+    assert svc.meta()["cache"] == {"entries": 1, "hits": 1, "misses": 1, "loads": 1}
+
+    svc.query(["diabetes_prevalence"])
+    svc.query(["diabetes_prevalence"], years=(2016, 2016))
+    # Oldest entry evicted at cache_size=2
+    assert svc.query(["obesity_prevalence"], states=["GA", "TX"], years=(2015, 2020)) is not a
+    assert svc.meta()["cache"] == {"entries": 2, "hits": 1, "misses": 4, "loads": 1}
+
+def test_changed_file_reloads(panel_file):
+    svc = service.PanelService(check_seconds=0)
+    before = svc.query(["diabetes_prevalence"], states=["GA"])
+    svc.query(["diabetes_prevalence"], states=["GA"])
+    assert svc.meta()["cache"]["hits"] == 1
+
+    make_panel(range(2014, 2025), shift=100.0).to_csv(panel_file, index=False)
+    st = panel_file.stat()
+    os.utime(panel_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    after = svc.query(["diabetes_prevalence"], states=["GA"])
+    meta = svc.meta()
+    assert meta["cache"]["loads"] == 2
+    assert meta["years"] == [2014, 2024]
+    assert len(after) == len(before) + 1
+    pd.testing.assert_frame_equal(after, expected(panel_file, ["diabetes_prevalence"], ["GA"]), check_dtype=False)
+    assert (after["diabetes_prevalence"] > 100).all()
+
+def get(port, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}") as r:
+            return r.status, json.loads(r.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_http_unknown_indicator_is_400(panel_file):
+    svc = service.PanelService(check_seconds=0)
+    server = service.ThreadingHTTPServer(("127.0.0.1", 0), service.handler(svc))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        port = server.server_port
+        code, body = get(port, "/query?indicators=obesity_prevalence,nope&states=GA")
+        assert code == 400
+        assert "nope" in body["error"]
+
+        code, body = get(port, "/query?indicators=obesity_prevalence&states=GA,TX&years=2015-2020")
+        assert code == 200
+        assert body["rows"] == 2 * 6
+        assert set(body["data"][0]) == set(service.KEYS + ["obesity_prevalence"])
+        assert get(port, "/nowhere")[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
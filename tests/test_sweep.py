@@ -0,0 +1,21 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import sweep
+
+def test_candidates_exclude_target_ci():
+    rng = np.random.default_rng(0)
+    n = 20
+    df = pd.DataFrame({
+        "state_fips": np.arange(n), "year": 2014 + np.arange(n) % 5,
+        "diabetes_prevalence": rng.random(n), "ci_low": rng.random(n), "ci_high": rng.random(n),
+        "diabetes_ci_low": rng.random(n), "diabetes_ci_high": rng.random(n),
+        "obesity_prevalence": rng.random(n), "obesity_ci_low": rng.random(n), "obesity_ci_high": rng.random(n),
+    })
+    names = sweep.candidate_columns(df)
+    assert not set(sweep.target_ci_columns(df)) & set(names)
+    assert not {"ci_low", "ci_high", "diabetes_ci_low", "diabetes_ci_high"} & set(names)
+    assert names == ["obesity_prevalence", "obesity_ci_low", "obesity_ci_high"]
@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+import validate
+
+COLUMNS = {"diabetes_prevalence": {"type": "float", "range": [0, 100]}}
+
+def test_examples_distinct_across_chunks():
+    v = validate.Validator(validate.compile_schema(COLUMNS))
+    for chunk in (["No Data", "1.5"], ["No Data", "Suppressed"], ["No Data", "n/a", "x"]):
+        v.check(pd.DataFrame({"diabetes_prevalence": chunk}))
+    key = ("diabetes_prevalence", "type")
+    assert v.counts[key] == 6
+    assert v.examples[key] == ["No Data", "Suppressed", "n/a"]